@@ -25,6 +25,16 @@ BUNDLE_ID = "com.yourname.recallapp" # Your app's bundle ID
 APNS_KEY_PATH = "AuthKey_XXXXXXXXXX.p8" # Path to your .p8 file
 ALGORITHM = "ES256"
 
+# Load the signing key once and reuse the provider token across pushes
+from app.services.apns import APNsCredentialProvider, APNsClient
+apns_credentials = APNsCredentialProvider(
+    key_path=APNS_KEY_PATH,
+    key_id=APNS_AUTH_KEY_ID,
+    team_id=APNS_TEAM_ID,
+    algorithm=ALGORITHM
+)
+apns_client = APNsClient(credentials=apns_credentials)
+
 # OpenAI Settings for LLM Integration
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 if OPENAI_API_KEY:
@@ -461,39 +471,22 @@ content_generator = ContentGenerator()
 # --- APNS INTEGRATION (PATH A & B) ---
 
 def create_apns_token():
-    """Generates the JWT required to authenticate with Apple."""
-    with open(APNS_KEY_PATH, "r") as f:
-        secret = f.read()
-
-    token = jwt.encode(
-        {
-            "iss": APNS_TEAM_ID,
-            "iat": time.time(),
-        },
-        secret,
-        algorithm=ALGORITHM,
-        headers={"alg": ALGORITHM, "kid": APNS_AUTH_KEY_ID},
-    )
-    return token
+    """Returns the cached JWT required to authenticate with Apple (re-signed only when stale)."""
+    return apns_credentials.get_token()
 
 async def send_push_notification(device_token, payload, push_type="alert", activity_token=None):
     """
-    Sends notification to APNs.
+    Sends notification to APNs over the shared, long-lived HTTP/2 client.
     push_type can be 'alert' (Path A) or 'liveactivity' (Path B)
     """
-    token = create_apns_token()
-    url = f"https://api.development.push.apple.com/3/device/{device_token if not activity_token else activity_token}"
-    
-    headers = {
-        "apns-topic": BUNDLE_ID if push_type == "alert" else f"{BUNDLE_ID}.push-type.liveactivity",
-        "authorization": f"bearer {token}",
-        "apns-push-type": push_type,
-        "apns-priority": "10"
-    }
-
-    async with httpx.AsyncClient(http2=True) as client:
-        response = await client.post(url, headers=headers, json=payload)
-        return response.status_code
+    topic = BUNDLE_ID if push_type == "alert" else f"{BUNDLE_ID}.push-type.liveactivity"
+    response = await apns_client.send(
+        activity_token or device_token,
+        payload,
+        push_type=push_type,
+        topic=topic
+    )
+    return response.status_code
 
 # --- API ENDPOINTS ---
 
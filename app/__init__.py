@@ -13,6 +13,10 @@ def create_app(config_name=None):
     """Create and configure Flask application"""
     app = Flask(__name__)
     
+    # Generation uploads are spooled and size-checked while the body is parsed
+    from app.utils.uploads import UploadRequest
+    app.request_class = UploadRequest
+    
     # Determine configuration
     if config_name is None:
         config_name = os.environ.get('FLASK_ENV', 'development')
@@ -21,6 +25,11 @@ def create_app(config_name=None):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
     
+    # Take the client address from X-Forwarded-For only as far back as our own proxies
+    if app.config.get('PROXY_FIX_X_FOR'):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    
     # Initialize extensions with app
     db.init_app(app)
     
@@ -5,6 +5,7 @@ from flask import request, jsonify, session
 from functools import wraps
 from app.api import api_bp
 from app.services.auth_service import AuthService
+from app.middleware.auth_middleware import set_current_user
 from app.models import User
 
 def require_auth(f):
@@ -29,6 +30,7 @@ def require_auth(f):
         # Add user to request context
         request.current_user = auth_result['user']
         request.current_session = auth_result['session']
+        set_current_user(auth_result)
         
         return f(*args, **kwargs)
     
@@ -88,6 +90,13 @@ def login():
     )
     
     if not auth_result['success']:
+        if auth_result.get('rate_limited'):
+            response = jsonify({
+                'error': auth_result['error'],
+                'retry_after': auth_result['retry_after']
+            })
+            response.headers['Retry-After'] = str(auth_result['retry_after'])
+            return response, 429
         return jsonify({'error': auth_result['error']}), 401
     
     # Create session
@@ -1,19 +1,22 @@
 """
 AI Content Generation API endpoints
 """
-from flask import request, jsonify
-from datetime import datetime
+from flask import Response, current_app, request, jsonify, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 import os
+import time
 from app.api import api_bp
 from app.models import User, Card, ContentGeneration, Folder
-from app.services.ai_content_generator import AIContentGenerator
+from app.services.generation_jobs import generation_jobs
+from app.utils.card_stream import sse_event
+from app.utils.pdf_text import page_intervals
+from app.utils.uploads import SpooledUpload, UploadBudget, UploadTooLarge, accepts_uploads
+from app.config import Config
 from app.api.auth import require_auth
+from app.middleware.auth_middleware import get_current_user_obj
 from app import db
 
-# Initialize AI content generator
-ai_generator = AIContentGenerator()
-
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 
@@ -23,6 +26,7 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @api_bp.route('/generate-content', methods=['POST'])
+@accepts_uploads
 @require_auth
 def generate_content():
     """Generate flashcards and/or information pieces from source material using AI"""
@@ -33,6 +37,7 @@ def generate_content():
     max_cards = int(request.form.get('max_cards', 10))
     focus_areas = request.form.get('focus_areas', '').strip()
     folder_id = request.form.get('folder_id')  # New: folder selection
+    page_range = request.form.get('page_range', '').strip() or None  # e.g. "1-20, 35"
     
     # Parse focus areas
     focus_areas_list = []
@@ -63,134 +68,83 @@ def generate_content():
             "error": "Invalid generation_type. Must be 'flashcards', 'information', or 'mixed'"
         }), 400
     
+    # Validate PDF page selection
+    try:
+        page_intervals(page_range)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     # Check if AI generation is available
-    if not ai_generator.is_available():
+    if not generation_jobs.is_available():
         return jsonify({
             "error": "AI content generation not configured. Please set OPENAI_API_KEY environment variable."
         }), 503
     
-    # Process uploaded files
+    # Uploads were spooled and size-checked as the body was parsed (UploadRequest); adopt them as they are
     pdf_content = None
     images = []
+    budget = UploadBudget()
     
-    # Handle PDF upload
-    if 'pdf_file' in request.files:
-        pdf_file = request.files['pdf_file']
-        if pdf_file and pdf_file.filename and pdf_file.filename != '':
-            if pdf_file.filename.lower().endswith('.pdf') or allowed_file(pdf_file.filename):
-                try:
-                    pdf_content = pdf_file.read()
+    try:
+        # Handle PDF upload
+        if 'pdf_file' in request.files:
+            pdf_file = request.files['pdf_file']
+            if pdf_file and pdf_file.filename and pdf_file.filename != '':
+                if pdf_file.filename.lower().endswith('.pdf') or allowed_file(pdf_file.filename):
+                    pdf_content = SpooledUpload.from_file_storage(
+                        pdf_file, Config.UPLOAD_MAX_PDF_BYTES, budget
+                    )
                     # Basic validation - check if it's actually a PDF or has content
                     if len(pdf_content) > 0:
                         # Try to validate it's a real PDF by checking for PDF header
-                        if pdf_content.startswith(b'%PDF') or len(pdf_content) < 1000:
+                        if pdf_content.head(4) == b'%PDF' or len(pdf_content) < 1000:
                             # Either it's a real PDF or small enough to be test content
                             pass
                         else:
                             # Large file that doesn't start with PDF header - might be invalid
                             print(f"Warning: Uploaded file might not be a valid PDF")
-                except Exception as e:
-                    print(f"Error reading PDF file: {e}")
-                    pdf_content = None
-    
-    # Handle image uploads
-    if 'images' in request.files:
-        image_files = request.files.getlist('images')
-        for image_file in image_files[:5]:  # Limit to 5 images
-            if image_file and image_file.filename and allowed_file(image_file.filename):
-                image_content = image_file.read()
-                images.append(image_content)
-    
-    # Create generation record
-    generation = ContentGeneration(
-        user_id=user_id,
-        source_material=source_material or "File-based generation",
-        generation_type=generation_type,
-        subject=subject,
-        max_cards=max_cards,
-        focus_areas=','.join(focus_areas_list) if focus_areas_list else None
+        
+        # Handle image uploads
+        if 'images' in request.files:
+            image_files = request.files.getlist('images')
+            for image_file in image_files[:5]:  # Limit to 5 images
+                if image_file and image_file.filename and allowed_file(image_file.filename):
+                    images.append(SpooledUpload.from_file_storage(
+                        image_file, Config.UPLOAD_MAX_IMAGE_BYTES, budget
+                    ))
+    except UploadTooLarge as e:
+        for upload in [pdf_content] + images:
+            if upload is not None:
+                upload.close()
+        return jsonify({"error": str(e)}), 413
+    
+    # Extraction, the OpenAI calls and card inserts run on the generation worker pool
+    result = generation_jobs.enqueue(
+        user_id, source_material, generation_type, subject, max_cards,
+        focus_areas_list, folder_id, images, pdf_content, page_range
     )
-    db.session.add(generation)
-    db.session.commit()
+    if not result['success']:
+        response = jsonify({"error": result['error']})
+        response.headers['Retry-After'] = str(result['retry_after'])
+        return response, 503
     
-    try:
-        # Generate content based on type
-        if generation_type == 'flashcards':
-            generated_items = ai_generator.generate_flashcards(
-                source_material, subject, max_cards, focus_areas_list, images, pdf_content
-            )
-        elif generation_type == 'information':
-            generated_items = ai_generator.generate_information_pieces(
-                source_material, subject, max_cards, focus_areas_list, images, pdf_content
-            )
-        elif generation_type == 'mixed':
-            generated_items = ai_generator.generate_mixed_content(
-                source_material, subject, max_cards, focus_areas_list, images, pdf_content
-            )
-        
-        # Validate that we got some results
-        if not generated_items:
-            raise Exception("No content was generated. Please check your input and try again.")
-        
-        # Save generated cards to database
-        created_cards = []
-        cards_to_create = generated_items[:max_cards]  # Limit to requested number
-        
-        for item in cards_to_create:
-            card = Card(
-                user_id=user_id,
-                folder_id=folder_id,  # Assign to selected folder
-                content_type=item['content_type'],
-                front=item['front'],
-                back=item.get('back'),
-                subject=subject,
-                is_ai_generated=True
-            )
-            db.session.add(card)
-            created_cards.append({
-                'content_type': item['content_type'],
-                'front': item['front'],
-                'back': item.get('back')
-            })
-        
-        # Update generation record
-        generation.cards_generated = len(created_cards)
-        generation.generation_status = 'completed'
-        generation.completed_at = datetime.utcnow()
-        
-        db.session.commit()
-        
-        return jsonify({
-            "message": "Content generated successfully",
-            "generation_id": generation.id,
-            "cards_generated": len(created_cards),
-            "cards": created_cards
-        }), 201
-        
-    except Exception as e:
-        # Log the error for debugging
-        print(f"AI Generation Error: {str(e)}")
-        
-        # Update generation record with error
-        generation.generation_status = 'failed'
-        generation.error_message = str(e)
-        generation.completed_at = datetime.utcnow()
-        db.session.commit()
-        
-        # Provide user-friendly error message
-        error_message = str(e)
-        if "Failed to extract text from PDF" in error_message:
-            error_message = "Unable to process the uploaded PDF file. Please ensure it's a valid PDF with extractable text."
-        elif "Failed to process image" in error_message:
-            error_message = "Unable to process one or more uploaded images. Please ensure they are valid image files."
-        elif "OpenAI" in error_message or "API" in error_message:
-            error_message = "AI service temporarily unavailable. Please try again in a moment."
-        
-        return jsonify({
-            "error": "Failed to generate content",
-            "details": error_message,
-            "generation_id": generation.id
-        }), 500
+    generation = result['generation']
+    return jsonify({
+        "message": "Content generation started",
+        "generation_id": generation.id,
+        "generation_status": generation.generation_status,
+        "status_url": url_for('api.get_content_generation', generation_id=generation.id),
+        "stream_url": url_for('api.stream_content_generation', generation_id=generation.id)
+    }), 202
+
+@api_bp.errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    """Bodies over the endpoint's limit (MAX_CONTENT_LENGTH, or UPLOAD_MAX_BODY_BYTES in
+    upload views) are rejected before they are read, and
+    files over their per-file or per-request cap as soon as parsing crosses it"""
+    if error.description != RequestEntityTooLarge.description:
+        return jsonify({"error": error.description}), 413
+    return jsonify({"error": "Upload too large"}), 413
 
 @api_bp.route('/users/<int:user_id>/content-generations', methods=['GET'])
 @require_auth
@@ -200,11 +154,11 @@ def get_content_generations(user_id):
     if request.current_user['id'] != user_id:
         return jsonify({"error": "Access denied"}), 403
     
-    user = User.query.get(user_id)
+    user = get_current_user_obj(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    generations = ContentGeneration.query.filter_by(user_id=user_id)\
+    generations = ContentGeneration.query.filter_by(user_id=user.id)\
         .order_by(ContentGeneration.created_at.desc()).all()
     
     return jsonify({
@@ -223,4 +177,95 @@ def get_content_generation(generation_id):
     if request.current_user['id'] != generation.user_id:
         return jsonify({"error": "Access denied"}), 403
     
-    return jsonify({"generation": generation.to_dict()})
\ No newline at end of file
+    data = generation.to_dict()
+    if generation.generation_status != 'pending':
+        # Cards are saved in batches while processing, so partial results are listed too
+        cards = Card.query.filter_by(generation_id=generation.id).order_by(Card.id).all()
+        data['cards'] = [_card_summary(card) for card in cards]
+    
+    return jsonify({"generation": data})
+
+@api_bp.route('/content-generations/<int:generation_id>/stream', methods=['GET'])
+@require_auth
+def stream_content_generation(generation_id):
+    """Server-sent events for a generation: `card` as each card is saved, `status` on
+    status changes and `done` with the final generation"""
+    generation = ContentGeneration.query.get(generation_id)
+    if not generation:
+        return jsonify({"error": "Content generation not found"}), 404
+    
+    # Only allow users to access their own data
+    if request.current_user['id'] != generation.user_id:
+        return jsonify({"error": "Access denied"}), 403
+    
+    # EventSource resends the id of the last card it received when it reconnects
+    try:
+        after_id = int(request.headers.get('Last-Event-ID') or request.args.get('after') or 0)
+    except ValueError:
+        after_id = 0
+    
+    # Each stream ties up a server thread until it ends, so their number is capped
+    user_id = request.current_user['id']
+    slot = generation_jobs.open_stream(user_id)
+    if not slot['success']:
+        response = jsonify({"error": slot['error']})
+        response.headers['Retry-After'] = str(slot['retry_after'])
+        return response, 503
+    
+    events = _generation_events(current_app._get_current_object(), generation_id, after_id)
+    response = Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Don't let a reverse proxy buffer the stream
+    })
+    # Runs when the stream ends or the client disconnects
+    response.call_on_close(lambda: generation_jobs.close_stream(user_id))
+    return response
+
+def _card_summary(card):
+    return {
+        'id': card.id,
+        'content_type': card.content_type,
+        'front': card.front,
+        'back': card.back
+    }
+
+def _generation_events(app, generation_id, after_id):
+    """Relay cards as the job commits them, waking on job updates in this process and
+    re-reading the database at least every GENERATION_STREAM_POLL_SECONDS"""
+    deadline = time.monotonic() + Config.GENERATION_STREAM_TIMEOUT_SECONDS
+    last_sent = time.monotonic()
+    status = None
+    yield "retry: 2000\n\n"
+    
+    while True:
+        version = generation_jobs.update_version()
+        # A short app context per read, so no connection is held between reads
+        with app.app_context():
+            cards = Card.query.filter(Card.generation_id == generation_id, Card.id > after_id)\
+                .order_by(Card.id).all()
+            frames = [sse_event('card', _card_summary(card), card.id) for card in cards]
+            generation = db.session.get(ContentGeneration, generation_id)
+            data = generation.to_dict() if generation else None
+        
+        if cards:
+            after_id = cards[-1].id
+        if data is not None and data['generation_status'] != status:
+            status = data['generation_status']
+            frames.append(sse_event('status', {'generation_status': status, 'cards_generated': data['cards_generated']}))
+        
+        now = time.monotonic()
+        if frames:
+            last_sent = now
+            yield ''.join(frames)
+        
+        if data is None or status in ('completed', 'failed'):
+            yield sse_event('done', {'generation': data})
+            return
+        if now >= deadline:
+            yield sse_event('timeout', {'generation': data})
+            return
+        if now - last_sent >= Config.GENERATION_STREAM_KEEPALIVE_SECONDS:
+            last_sent = now
+            yield ": keep-alive\n\n"
+        
+        generation_jobs.wait_for_update(version, min(Config.GENERATION_STREAM_POLL_SECONDS, deadline - now))
\ No newline at end of file
@@ -4,7 +4,7 @@ Import/Export API endpoints
 from flask import request, jsonify, make_response
 from app.api import api_bp
 from app.models import User
-from app.utils.data_import import DataImporter
+from app.utils.data_import import DataImporter, DUPLICATE_MODES
 
 @api_bp.route('/users/<int:user_id>/import/csv', methods=['POST'])
 def import_csv(user_id):
@@ -19,13 +19,18 @@ def import_csv(user_id):
     
     csv_content = data['csv_content']
     delimiter = data.get('delimiter', ',')
+    on_duplicate = data.get('on_duplicate', 'skip')
+    if on_duplicate not in DUPLICATE_MODES:
+        return jsonify({"error": f"on_duplicate must be one of: {', '.join(DUPLICATE_MODES)}"}), 400
     
-    result = DataImporter.import_from_csv(user_id, csv_content, delimiter)
+    result = DataImporter.import_from_csv(user_id, csv_content, delimiter, on_duplicate)
     
     if result['success']:
         return jsonify({
             "message": f"Successfully imported {result['imported_count']} cards",
             "imported_count": result['imported_count'],
+            "skipped_count": result['skipped_count'],
+            "duplicates": result['duplicates'],
             "errors": result['errors']
         }), 201
     else:
@@ -47,13 +52,18 @@ def import_anki(user_id):
         return jsonify({"error": "JSON content is required"}), 400
     
     json_content = data['json_content']
+    on_duplicate = data.get('on_duplicate', 'skip')
+    if on_duplicate not in DUPLICATE_MODES:
+        return jsonify({"error": f"on_duplicate must be one of: {', '.join(DUPLICATE_MODES)}"}), 400
     
-    result = DataImporter.import_from_anki_json(user_id, json_content)
+    result = DataImporter.import_from_anki_json(user_id, json_content, on_duplicate)
     
     if result['success']:
         return jsonify({
             "message": f"Successfully imported {result['imported_count']} cards from Anki",
             "imported_count": result['imported_count'],
+            "skipped_count": result['skipped_count'],
+            "duplicates": result['duplicates'],
             "errors": result['errors']
         }), 201
     else:
@@ -3,9 +3,10 @@ Live Activity API endpoints for iOS
 """
 from flask import request, jsonify
 from datetime import datetime
-import asyncio
 from app.api import api_bp
 from app.api.auth import require_auth
+from app.utils.async_runner import run_async
+from app.middleware.auth_middleware import get_current_user_obj
 from app.services.live_activity_service import LiveActivityService
 from app.services.spaced_repetition import SpacedRepetitionService
 from app.models import User, Card
@@ -20,20 +21,14 @@ def start_study_session_activity():
     user_id = request.current_user['id']
     
     # Get study session cards
-    cards = SpacedRepetitionService.get_next_review_batch(user_id, 10)
+    cards = SpacedRepetitionService.get_next_review_batch(get_current_user_obj(), 10)
     session_cards = [card.to_dict() for card in cards]
     
     if not session_cards:
         return jsonify({"error": "No cards available for study session"}), 400
     
     try:
-        # Run async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            live_activity_service.start_study_session_activity(user_id, session_cards)
-        )
-        loop.close()
+        result = live_activity_service.start_study_session_activity(user_id, session_cards)
         
         if result['success']:
             return jsonify(result), 200
@@ -63,20 +58,14 @@ def update_study_progress():
             if card and card.user_id == user_id:
                 current_card = card.to_dict()
         
-        # Run async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            live_activity_service.update_study_progress(
-                user_id=user_id,
-                session_id=data['session_id'],
-                current_card_index=data['current_card_index'],
-                cards_reviewed=data['cards_reviewed'],
-                total_cards=data['total_cards'],
-                current_card=current_card
-            )
+        result = live_activity_service.update_study_progress(
+            user_id=user_id,
+            session_id=data['session_id'],
+            current_card_index=data['current_card_index'],
+            cards_reviewed=data['cards_reviewed'],
+            total_cards=data['total_cards'],
+            current_card=current_card
         )
-        loop.close()
         
         if result['success']:
             return jsonify({"message": "Live Activity updated successfully"}), 200
@@ -99,18 +88,12 @@ def end_study_session_activity():
             return jsonify({"error": f"Missing required field: {field}"}), 400
     
     try:
-        # Run async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            live_activity_service.end_study_session_activity(
-                user_id=user_id,
-                session_id=data['session_id'],
-                cards_reviewed=data['cards_reviewed'],
-                session_duration=data['session_duration']
-            )
+        result = live_activity_service.end_study_session_activity(
+            user_id=user_id,
+            session_id=data['session_id'],
+            cards_reviewed=data['cards_reviewed'],
+            session_duration=data['session_duration']
         )
-        loop.close()
         
         if result['success']:
             return jsonify({"message": "Study session Live Activity ended successfully"}), 200
@@ -127,23 +110,18 @@ def send_recall_reminder_activity():
     user_id = request.current_user['id']
     
     # Get due cards
-    due_cards = SpacedRepetitionService.get_due_cards(user_id, limit=1)
-    due_cards_count = len(SpacedRepetitionService.get_due_cards(user_id))
+    user = get_current_user_obj()
+    due_cards = SpacedRepetitionService.get_due_cards(user, limit=1)
+    due_cards_count = SpacedRepetitionService.count_due_cards(user)
     
     next_card = due_cards[0].to_dict() if due_cards else None
     
     try:
-        # Run async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            live_activity_service.send_recall_reminder_activity(
-                user_id=user_id,
-                due_cards_count=due_cards_count,
-                next_card=next_card
-            )
+        result = live_activity_service.send_recall_reminder_activity(
+            user_id=user_id,
+            due_cards_count=due_cards_count,
+            next_card=next_card
         )
-        loop.close()
         
         if result['success']:
             return jsonify({
@@ -163,13 +141,7 @@ def send_daily_progress_activity():
     user_id = request.current_user['id']
     
     try:
-        # Run async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            live_activity_service.send_daily_progress_activity(user_id)
-        )
-        loop.close()
+        result = live_activity_service.send_daily_progress_activity(user_id)
         
         if result['success']:
             return jsonify({"message": "Daily progress Live Activity sent successfully"}), 200
@@ -183,8 +155,7 @@ def send_daily_progress_activity():
 @require_auth
 def test_live_activity():
     """Send a test Live Activity"""
-    user_id = request.current_user['id']
-    user = User.query.get(user_id)
+    user = get_current_user_obj()
     
     if not user or not user.active_activity_token:
         return jsonify({"error": "No Live Activity token registered. Please register from the iOS app first."}), 400
@@ -205,10 +176,8 @@ def test_live_activity():
             }
         }
         
-        # Run async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        status_code = loop.run_until_complete(
+        # Only the APNs send runs on the shared background event loop
+        status_code = run_async(
             live_activity_service.notification_service._send_push_notification(
                 device_token=user.device_token,
                 payload=test_payload,
@@ -216,7 +185,6 @@ def test_live_activity():
                 activity_token=user.active_activity_token
             )
         )
-        loop.close()
         
         if status_code == 200:
             return jsonify({
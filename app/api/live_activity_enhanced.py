@@ -5,7 +5,7 @@ from flask import request, jsonify
 from app.api import api_bp
 from app.api.auth import require_auth
 from app.services.live_activity_enhanced import live_activity_service
-import asyncio
+from app.services.unlock_debounce import unlock_debouncer
 
 @api_bp.route('/live-activity/start', methods=['POST'])
 @require_auth
@@ -14,11 +14,7 @@ def start_live_activity():
     user_id = request.current_user['id']
     
     try:
-        # Run async function in sync context
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(live_activity_service.start_live_activity(user_id))
-        loop.close()
+        result = live_activity_service.start_live_activity(user_id)
         
         if result['success']:
             return jsonify({
@@ -40,13 +36,7 @@ def update_on_unlock():
     device_info = request.json or {}
     
     try:
-        # Run async function in sync context
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            live_activity_service.handle_unlock_webhook(user_id, device_info)
-        )
-        loop.close()
+        result = live_activity_service.handle_unlock_webhook(user_id, device_info)
         
         if result['success']:
             return jsonify({
@@ -68,11 +58,7 @@ def end_live_activity():
     user_id = request.current_user['id']
     
     try:
-        # Run async function in sync context
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(live_activity_service.end_live_activity(user_id))
-        loop.close()
+        result = live_activity_service.end_live_activity(user_id)
         
         if result['success']:
             return jsonify({"message": "Live Activity ended successfully"}), 200
@@ -108,6 +94,10 @@ def phone_unlock_webhook():
     if not user_id or not device_token:
         return jsonify({"error": "Missing user_id or device_token"}), 400
     
+    # Turn away unlocks inside the debounce interval before touching the database
+    if unlock_debouncer.retry_after(user_id):
+        return jsonify({"success": False, "error": "Too soon for content update"}), 400
+    
     # Basic validation - check if device token matches user
     from app.models import User
     user = User.query.get(user_id)
@@ -115,13 +105,7 @@ def phone_unlock_webhook():
         return jsonify({"error": "Invalid user or device token"}), 401
     
     try:
-        # Run async function in sync context
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            live_activity_service.handle_unlock_webhook(user_id, data)
-        )
-        loop.close()
+        result = live_activity_service.handle_unlock_webhook(user_id, data)
         
         return jsonify(result), 200 if result['success'] else 400
         
@@ -135,13 +119,7 @@ def test_live_activity_content():
     user_id = request.current_user['id']
     
     try:
-        # Run async function in sync context
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(
-            live_activity_service.update_live_activity_on_unlock(user_id)
-        )
-        loop.close()
+        result = live_activity_service.update_live_activity_on_unlock(user_id)
         
         if result['success']:
             return jsonify({
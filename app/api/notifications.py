@@ -1,12 +1,14 @@
 """
 Notification API endpoints
 """
-from flask import request, jsonify
+from flask import request, jsonify, current_app
 from app.api import api_bp
-from app.models import User
+from app.models import User, DailyRecallCount
 from app.services.notification_service import NotificationService
 from app.api.auth import require_auth
+from app.middleware.auth_middleware import get_current_user_obj
 from app.services.spaced_repetition import SpacedRepetitionService
+from app.services.recall_scheduler import recall_scheduler
 from app import db
 
 # Initialize notification service
@@ -24,7 +26,7 @@ def register_device_token(user_id):
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    success = notification_service.register_device_token(user_id, data['device_token'])
+    success = notification_service.register_device_token(user, data['device_token'])
     
     if success:
         return jsonify({"message": "Device token registered successfully"})
@@ -43,7 +45,7 @@ def register_live_activity_token(user_id):
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    success = notification_service.register_live_activity_token(user_id, data['activity_token'])
+    success = notification_service.register_live_activity_token(user, data['activity_token'])
     
     if success:
         return jsonify({"message": "Live Activity token registered successfully"})
@@ -85,21 +87,20 @@ def check_user_availability(user_id):
 @api_bp.route('/notification-scheduler/start', methods=['POST'])
 def start_notification_scheduler():
     """Start the notification scheduler"""
-    notification_service.start_scheduler()
+    notification_service.start_scheduler(current_app._get_current_object())
     return jsonify({"message": "Notification scheduler started"})
 
 @api_bp.route('/notifications/test-recall', methods=['POST'])
 @require_auth
 def test_recall_notification():
     """Send a test recall notification"""
-    user_id = request.current_user['id']
-    user = User.query.get(user_id)
+    user = get_current_user_obj()
     
     if not user:
         return jsonify({"error": "User not found"}), 404
     
     # Get a sample due card
-    due_cards = SpacedRepetitionService.get_due_cards(user_id, limit=1)
+    due_cards = SpacedRepetitionService.get_due_cards(user, limit=1)
     
     if due_cards:
         card = due_cards[0]
@@ -123,29 +124,29 @@ def test_recall_notification():
 @require_auth
 def get_notification_status():
     """Get current notification status for user"""
-    user_id = request.current_user['id']
-    user = User.query.get(user_id)
+    user = get_current_user_obj()
     
     if not user:
         return jsonify({"error": "User not found"}), 404
     
     # Calculate status information
-    due_cards_count = len(SpacedRepetitionService.get_due_cards(user_id))
+    due_cards_count = SpacedRepetitionService.count_due_cards(user)
     available = notification_service._should_send_notification(user) and not user.recall_paused
     
-    # Calculate next recall time based on user settings
+    # Report the slot the recall scheduler persisted (UTC), shown in server local time
     next_recall = "Paused" if user.recall_paused else "Not scheduled"
-    if user.recall_enabled and available and not user.recall_paused:
-        from datetime import datetime, timedelta
-        next_time = datetime.now() + timedelta(minutes=user.recall_frequency_minutes or 30)
-        next_recall = next_time.strftime("%H:%M")
+    if user.recall_enabled and not user.recall_paused and user.next_recall_at:
+        from datetime import timezone
+        next_recall = user.next_recall_at.replace(tzinfo=timezone.utc).astimezone().strftime("%H:%M")
     
-    # Get today's recall count (simplified - in production you'd track this)
-    recalls_today = 0  # This would be tracked in a separate table
+    # Today's recall count (single primary-key lookup)
+    recalls_today = DailyRecallCount.count_for(user.id)
     
     return jsonify({
         "recalls_today": recalls_today,
+        "max_daily_recalls": user.max_daily_recalls,
         "next_recall": next_recall,
+        "next_recall_at": user.next_recall_at.isoformat() if user.next_recall_at and not user.recall_paused else None,
         "available": available,
         "due_cards": due_cards_count,
         "recall_enabled": user.recall_enabled,
@@ -157,15 +158,14 @@ def get_notification_status():
 @require_auth
 def pause_notifications():
     """Pause notifications"""
-    user_id = request.current_user['id']
-    user = User.query.get(user_id)
+    user = get_current_user_obj()
     
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    # Set paused state
+    # Set paused state (drops the user's recall slot)
     user.recall_paused = True
-    db.session.commit()
+    recall_scheduler.reschedule_user(user)
     
     return jsonify({
         "message": "Notifications paused",
@@ -176,15 +176,14 @@ def pause_notifications():
 @require_auth
 def resume_notifications():
     """Resume notifications"""
-    user_id = request.current_user['id']
-    user = User.query.get(user_id)
+    user = get_current_user_obj()
     
     if not user:
         return jsonify({"error": "User not found"}), 404
     
     # Resume notifications by clearing paused state
     user.recall_paused = False
-    db.session.commit()
+    recall_scheduler.reschedule_user(user)
     
     return jsonify({
         "message": "Notifications resumed",
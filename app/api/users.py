@@ -5,6 +5,7 @@ from flask import request, jsonify
 from app.api import api_bp
 from app.models import User
 from app.services.spaced_repetition import SpacedRepetitionService
+from app.services.recall_scheduler import recall_scheduler
 from app import db
 
 @api_bp.route('/users', methods=['POST'])
@@ -61,7 +62,7 @@ def update_user(user_id):
     if 'sleep_end' in data:
         user.sleep_end = data['sleep_end']
     
-    db.session.commit()
+    recall_scheduler.reschedule_user(user)
     
     return jsonify({
         "message": "User updated successfully",
@@ -75,7 +76,7 @@ def get_user_stats(user_id):
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    stats = SpacedRepetitionService.get_user_stats(user_id)
+    stats = SpacedRepetitionService.get_user_stats(user)
     return jsonify(stats)
 
 @api_bp.route('/users/<int:user_id>/cards', methods=['GET'])
@@ -19,13 +19,93 @@ class Config:
     BUNDLE_ID = os.environ.get("BUNDLE_ID", "com.yourname.recallapp")
     APNS_KEY_PATH = os.environ.get("APNS_KEY_PATH", "AuthKey_XXXXXXXXXX.p8")
     ALGORITHM = "ES256"
+    APNS_BASE_URL = os.environ.get("APNS_BASE_URL", "https://api.development.push.apple.com")  # Point at a local stand-in for tests/benchmarks
+    APNS_MAX_CONNECTIONS = int(os.environ.get("APNS_MAX_CONNECTIONS", 4))
+    APNS_MAX_CONCURRENT_STREAMS = int(os.environ.get("APNS_MAX_CONCURRENT_STREAMS", 100))  # In-flight pushes per process
+    APNS_REQUEST_TIMEOUT = float(os.environ.get("APNS_REQUEST_TIMEOUT", 10))
+    APNS_MAX_IDLE_SECONDS = int(os.environ.get("APNS_MAX_IDLE_SECONDS", 30 * 60))
+    APNS_TOKEN_REFRESH_SECONDS = int(os.environ.get("APNS_TOKEN_REFRESH_SECONDS", 50 * 60))  # Apple allows reuse for up to 1 hour
+    PUSH_DISPATCH_CONCURRENCY = int(os.environ.get("PUSH_DISPATCH_CONCURRENCY", 100))  # Pushes in flight per dispatch
+    PUSH_DISPATCH_RATE_PER_SECOND = float(os.environ.get("PUSH_DISPATCH_RATE_PER_SECOND", 0))  # 0 = no global rate limit
+    PUSH_RETRY_ATTEMPTS = int(os.environ.get("PUSH_RETRY_ATTEMPTS", 2))  # Inline retries for 429/5xx before giving up
+    PUSH_RETRY_BASE_SECONDS = float(os.environ.get("PUSH_RETRY_BASE_SECONDS", 0.5))
+    PUSH_RETRY_MAX_SECONDS = float(os.environ.get("PUSH_RETRY_MAX_SECONDS", 5))  # Longer waits are left to the outbox
+    PUSH_REQUEST_RETRY_ATTEMPTS = int(os.environ.get("PUSH_REQUEST_RETRY_ATTEMPTS", 0))  # Inline retries while a request waits on APNs
     
     # OpenAI Settings
     OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
+    OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "")  # Point at mock_openai_server.py for tests/benchmarks; empty uses the OpenAI API
+    GENERATION_WORKERS = int(os.environ.get("GENERATION_WORKERS", 4))  # Content generation jobs run concurrently per process
+    GENERATION_MAX_PENDING = int(os.environ.get("GENERATION_MAX_PENDING", 50))  # Queued + running jobs before new requests get 503
+    GENERATION_RETRY_AFTER_SECONDS = int(os.environ.get("GENERATION_RETRY_AFTER_SECONDS", 30))
+    GENERATION_CHUNK_TOKENS = int(os.environ.get("GENERATION_CHUNK_TOKENS", 4000))  # Source tokens per prompt; longer material is split
+    GENERATION_CHUNK_OVERLAP_TOKENS = int(os.environ.get("GENERATION_CHUNK_OVERLAP_TOKENS", 200))
+    GENERATION_CHUNK_CONCURRENCY = int(os.environ.get("GENERATION_CHUNK_CONCURRENCY", 8))  # Concurrent OpenAI calls per process
+    GENERATION_CACHE_PATH = os.environ.get("GENERATION_CACHE_PATH", "instance/generation_cache.db")  # Empty disables the result cache
+    GENERATION_CACHE_MAX_BYTES = int(os.environ.get("GENERATION_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))  # Processes for page-parallel extraction
+    PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 16))  # Smaller PDFs are extracted in-process
+    PDF_TEXT_CACHE_DIR = os.environ.get("PDF_TEXT_CACHE_DIR", "instance/pdf_text_cache")  # Empty disables the extracted text cache
+    PDF_TEXT_CACHE_MAX_BYTES = int(os.environ.get("PDF_TEXT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    UPLOAD_MAX_PDF_BYTES = int(os.environ.get("UPLOAD_MAX_PDF_BYTES", 50 * 1024 * 1024))
+    UPLOAD_MAX_IMAGE_BYTES = int(os.environ.get("UPLOAD_MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+    UPLOAD_MAX_REQUEST_BYTES = int(os.environ.get("UPLOAD_MAX_REQUEST_BYTES", 100 * 1024 * 1024))  # All files in one generation request
+    UPLOAD_SPOOL_MEMORY_BYTES = int(os.environ.get("UPLOAD_SPOOL_MEMORY_BYTES", 1024 * 1024))  # Larger uploads go to a temp file
+    UPLOAD_TMP_DIR = os.environ.get("UPLOAD_TMP_DIR", "")  # Defaults to the system temp directory
+    UPLOAD_MAX_BODY_BYTES = UPLOAD_MAX_REQUEST_BYTES + 1024 * 1024  # Body limit of upload views; headroom for form fields
+    MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH", 16 * 1024 * 1024))  # Every other endpoint
+    IMAGE_PREP_WORKERS = int(os.environ.get("IMAGE_PREP_WORKERS", 4))  # Threads decoding/resizing uploaded images
+    IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", 2048))
+    IMAGE_MAX_SHORT_SIDE = int(os.environ.get("IMAGE_MAX_SHORT_SIDE", 768))  # OpenAI scales "high" detail images to this anyway; 0 disables
+    IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # Encoded images kept for regenerations
+    GENERATION_ABANDONED_SECONDS = int(os.environ.get("GENERATION_ABANDONED_SECONDS", 15 * 60))  # Unfinished jobs older than this are failed on startup
+    GENERATION_STREAM_BATCH_SIZE = int(os.environ.get("GENERATION_STREAM_BATCH_SIZE", 5))  # Streamed cards committed per insert
+    GENERATION_STREAM_FLUSH_SECONDS = float(os.environ.get("GENERATION_STREAM_FLUSH_SECONDS", 0.5))  # Max wait before a partial batch is committed
+    GENERATION_STREAM_POLL_SECONDS = float(os.environ.get("GENERATION_STREAM_POLL_SECONDS", 1))  # Event stream re-checks the database at least this often
+    GENERATION_STREAM_KEEPALIVE_SECONDS = int(os.environ.get("GENERATION_STREAM_KEEPALIVE_SECONDS", 15))
+    GENERATION_STREAM_TIMEOUT_SECONDS = int(os.environ.get("GENERATION_STREAM_TIMEOUT_SECONDS", 10 * 60))  # Clients reconnect or fall back to polling after this
+    # Each open stream holds a worker thread for up to the timeout; keep these well below the server's thread count
+    GENERATION_STREAM_MAX_PER_USER = int(os.environ.get("GENERATION_STREAM_MAX_PER_USER", 2))
+    GENERATION_STREAM_MAX_STREAMS = int(os.environ.get("GENERATION_STREAM_MAX_STREAMS", 8))  # Per process; more get 503 and poll
     
     # Notification Settings
     DEFAULT_NOTIFICATION_FREQUENCY = 30  # minutes
     MAX_DAILY_NOTIFICATIONS = 50
+    RECALL_SCHEDULER_TICK_SECONDS = int(os.environ.get('RECALL_SCHEDULER_TICK_SECONDS', 60))
+    RECALL_SCHEDULER_RESYNC_MINUTES = int(os.environ.get('RECALL_SCHEDULER_RESYNC_MINUTES', 30))  # Reload slots changed by other processes
+    DAILY_RECALL_COUNT_RETENTION_DAYS = int(os.environ.get('DAILY_RECALL_COUNT_RETENTION_DAYS', 7))
+    UNLOCK_QUEUE_DEPTH = int(os.environ.get('UNLOCK_QUEUE_DEPTH', 3))  # Prepared cards kept per user for phone unlocks
+    UNLOCK_QUEUE_MAX_PAYLOADS = int(os.environ.get('UNLOCK_QUEUE_MAX_PAYLOADS', 50000))  # Across all users
+    UNLOCK_QUEUE_MAX_AGE_SECONDS = int(os.environ.get('UNLOCK_QUEUE_MAX_AGE_SECONDS', 600))
+    UNLOCK_MIN_INTERVAL_SECONDS = int(os.environ.get('UNLOCK_MIN_INTERVAL_SECONDS', 300))  # Minimum gap between unlock updates
+    UNLOCK_FLUSH_SECONDS = float(os.environ.get('UNLOCK_FLUSH_SECONDS', 30))  # How often update times are written back
+    UNLOCK_DEBOUNCE_MAX_USERS = int(os.environ.get('UNLOCK_DEBOUNCE_MAX_USERS', 100000))
+    METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN', '')  # Require "Authorization: Bearer <token>" on /metrics when set
+    
+    # Notification Outbox
+    OUTBOX_SHARD_WORKERS = int(os.environ.get('OUTBOX_SHARD_WORKERS', 0))  # Dedicated run_outbox_worker.py processes (0 = none)
+    OUTBOX_INLINE_WORKER = os.environ.get(
+        'OUTBOX_INLINE_WORKER', 'false' if OUTBOX_SHARD_WORKERS else 'true'
+    ).lower() == 'true'  # Drain the outbox from the scheduler; off by default when shard workers run
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 500))
+    OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', 120))  # Claimed rows older than this are reclaimed; renewed before each dispatch wave
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+    OUTBOX_POLL_SECONDS = float(os.environ.get('OUTBOX_POLL_SECONDS', 1))
+    OUTBOX_RETENTION_HOURS = int(os.environ.get('OUTBOX_RETENTION_HOURS', 24))  # Finished rows are purged after this
+    
+    # Login Rate Limiting
+    LOGIN_RATE_LIMIT_WINDOW = int(os.environ.get('LOGIN_RATE_LIMIT_WINDOW', 300))  # seconds
+    LOGIN_RATE_LIMIT_PER_IP = int(os.environ.get('LOGIN_RATE_LIMIT_PER_IP', 20))
+    LOGIN_RATE_LIMIT_PER_ACCOUNT = int(os.environ.get('LOGIN_RATE_LIMIT_PER_ACCOUNT', 5))
+    LOGIN_RATE_LIMIT_MAX_KEYS = int(os.environ.get('LOGIN_RATE_LIMIT_MAX_KEYS', 10000))
+    RATE_LIMIT_STORAGE_PATH = os.environ.get('RATE_LIMIT_STORAGE_PATH', '')  # Shared SQLite file for multi-worker runs
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))  # Trusted proxies in front of the app (0 = trust none)
+    
+    # Near-Duplicate Detection
+    DEDUPE_SIMILARITY = float(os.environ.get('DEDUPE_SIMILARITY', 0.7))  # Estimated Jaccard of card text shingles treated as a duplicate
+    DEDUPE_LSH_BANDS = int(os.environ.get('DEDUPE_LSH_BANDS', 16))  # Bands of the 64-value signature; more bands find lower similarities
+    DEDUPE_INDEX_MAX_USERS = int(os.environ.get('DEDUPE_INDEX_MAX_USERS', 500))  # Users whose index is kept in memory
+    DEDUPE_GENERATED_CARDS = os.environ.get('DEDUPE_GENERATED_CARDS', 'true').lower() == 'true'  # Skip generated items the user already has
     
     @staticmethod
     def get_port():
@@ -5,6 +5,25 @@ from functools import wraps
 from flask import session, redirect, url_for, request, g
 from app.services.auth_service import AuthService
 
+def set_current_user(auth_result):
+    """Store the authenticated user for the rest of the request"""
+    g.current_user = auth_result['user']
+    g.current_user_obj = auth_result['user_obj']
+
+def get_current_user_obj(user_id=None):
+    """Get the User entity loaded during authentication for this request
+    
+    Falls back to a query when no user was authenticated or a different user is requested.
+    """
+    user = g.get('current_user_obj')
+    if user is not None and (user_id is None or user.id == user_id):
+        return user
+    if user_id is None:
+        return None
+    
+    from app.models import User
+    return User.query.get(user_id)
+
 def login_required(f):
     """Decorator to require login for web routes"""
     @wraps(f)
@@ -21,7 +40,7 @@ def login_required(f):
             return redirect(url_for('web.welcome'))
         
         # Store user in g for template access
-        g.current_user = auth_result['user']
+        set_current_user(auth_result)
         
         return f(*args, **kwargs)
     
@@ -33,11 +52,12 @@ def optional_auth(f):
     def decorated_function(*args, **kwargs):
         session_token = session.get('session_token')
         g.current_user = None
+        g.current_user_obj = None
         
         if session_token:
             auth_result = AuthService.validate_session(session_token)
             if auth_result['success']:
-                g.current_user = auth_result['user']
+                set_current_user(auth_result)
             else:
                 session.clear()
         
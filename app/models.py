@@ -4,8 +4,17 @@ Database models for Active Recall application
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import sqlite, postgresql
+import json
+import uuid
+import zlib
 import secrets
 from app import db
+from app.utils.minhash import signature as card_signature, pack as pack_signature
+
+# Dialects whose INSERT supports ON CONFLICT clauses
+UPSERT_DIALECTS = {'sqlite': sqlite, 'postgresql': postgresql}
 
 class User(UserMixin, db.Model):
     """Enhanced User model with authentication"""
@@ -51,6 +60,14 @@ class User(UserMixin, db.Model):
     
     # Notification tracking
     last_notification_time = db.Column(db.DateTime, nullable=True)
+    next_recall_at = db.Column(db.DateTime, nullable=True, index=True)  # Next scheduled recall slot (UTC)
+    
+    # Query-friendly copies of the recall schedule (kept in sync by normalize_recall_schedule)
+    recall_days_mask = db.Column(db.Integer, default=127)  # Bit (day - 1) set for each active ISO weekday
+    recall_start_seconds = db.Column(db.Integer, nullable=True)  # Seconds after midnight
+    recall_end_seconds = db.Column(db.Integer, nullable=True)
+    sleep_start_seconds = db.Column(db.Integer, nullable=True)
+    sleep_end_seconds = db.Column(db.Integer, nullable=True)
     
     # Relationships
     cards = db.relationship('Card', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -65,6 +82,70 @@ class User(UserMixin, db.Model):
         """Check password against hash"""
         return check_password_hash(self.password_hash, password)
     
+    @staticmethod
+    def seconds_of_day(value):
+        """Whole seconds after midnight of a time or "HH:MM[:SS]" string (fractions are dropped)"""
+        if value is None or value == '':
+            return None
+        if isinstance(value, str):
+            parts = [int(float(part)) for part in value.split(':')[:3]]
+            parts += [0] * (3 - len(parts))
+            return parts[0] * 3600 + parts[1] * 60 + parts[2]
+        return value.hour * 3600 + value.minute * 60 + value.second
+    
+    @staticmethod
+    def recall_schedule_columns(days_of_week, start_time, end_time, sleep_start, sleep_end):
+        """Compute the normalized recall schedule columns from the user-facing settings"""
+        seconds_of_day = User.seconds_of_day
+        
+        if days_of_week:
+            days_mask = 0
+            for day in days_of_week.split(','):
+                day = day.strip()
+                if day.isdigit() and 1 <= int(day) <= 7:
+                    days_mask |= 1 << (int(day) - 1)
+        else:
+            days_mask = 127  # No restriction
+        
+        return {
+            'recall_days_mask': days_mask,
+            'recall_start_seconds': seconds_of_day(start_time),
+            'recall_end_seconds': seconds_of_day(end_time),
+            'sleep_start_seconds': seconds_of_day(sleep_start),
+            'sleep_end_seconds': seconds_of_day(sleep_end)
+        }
+    
+    def normalize_recall_schedule(self):
+        """Refresh the normalized recall schedule columns"""
+        columns = User.recall_schedule_columns(
+            self.recall_days_of_week, self.recall_start_time, self.recall_end_time,
+            self.sleep_start, self.sleep_end
+        )
+        for column, value in columns.items():
+            setattr(self, column, value)
+    
+    # Push type -> column holding the token it is sent to
+    PUSH_TOKEN_COLUMNS = {'alert': 'device_token', 'liveactivity': 'active_activity_token'}
+    
+    @classmethod
+    def clear_push_tokens(cls, dead_tokens):
+        """Null out tokens APNs rejected as invalid, one UPDATE per token column
+        
+        `dead_tokens` maps push type to token values. Users losing their device token
+        also lose their recall slot. Runs in the caller's transaction; returns rows changed.
+        """
+        cleared = 0
+        for push_type, tokens in dead_tokens.items():
+            column_name = cls.PUSH_TOKEN_COLUMNS.get(push_type)
+            if not column_name or not tokens:
+                continue
+            column = getattr(cls, column_name)
+            values = {column_name: None}
+            if column_name == 'device_token':
+                values['next_recall_at'] = None
+            cleared += cls.query.filter(column.in_(list(tokens))).update(values, synchronize_session=False)
+        return cleared
+    
     def get_full_name(self):
         """Get user's full name"""
         if self.first_name and self.last_name:
@@ -110,6 +191,12 @@ class User(UserMixin, db.Model):
         }
         return data
 
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def _normalize_user_recall_schedule(mapper, connection, user):
+    """Keep the normalized recall schedule columns in sync on every write"""
+    user.normalize_recall_schedule()
+
 class UserSession(db.Model):
     """User session management"""
     id = db.Column(db.Integer, primary_key=True)
@@ -255,6 +342,12 @@ class Card(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_reviewed = db.Column(db.DateTime, nullable=True)
     is_ai_generated = db.Column(db.Boolean, default=False)
+    generation_id = db.Column(db.Integer, db.ForeignKey('content_generation.id'), nullable=True, index=True)  # Set for AI-generated cards
+    minhash = db.Column(db.LargeBinary, nullable=True)  # Packed MinHash of front/back for near-duplicate detection
+    
+    __table_args__ = (
+        db.Index('ix_card_user_next_review', 'user_id', 'next_review'),
+    )
     
     def update_spaced_repetition(self, quality):
         """Update spaced repetition variables based on SM-2 algorithm"""
@@ -302,6 +395,15 @@ class Card(db.Model):
             'is_due': self.is_due_for_review()
         }
 
+@event.listens_for(Card, 'before_insert')
+@event.listens_for(Card, 'before_update')
+def _update_card_minhash(mapper, connection, card):
+    """Keep the near-duplicate signature in sync with the card text"""
+    state = inspect(card)
+    if card.minhash is None or state.attrs.front.history.has_changes() or state.attrs.back.history.has_changes():
+        signature = card_signature(card.front, card.back)
+        card.minhash = pack_signature(signature) if signature else None
+
 class ContentGeneration(db.Model):
     """Track AI content generation requests and results"""
     id = db.Column(db.Integer, primary_key=True)
@@ -316,8 +418,12 @@ class ContentGeneration(db.Model):
     
     # Results
     cards_generated = db.Column(db.Integer, default=0)
-    generation_status = db.Column(db.String(20), default='pending')  # 'pending', 'completed', 'failed'
+    generation_status = db.Column(db.String(20), default='pending')  # 'pending', 'processing', 'completed', 'failed'
     error_message = db.Column(db.Text, nullable=True)
+    cache_hit = db.Column(db.Boolean, default=False)  # Items came from the generation cache
+    generation_ms = db.Column(db.Float, nullable=True)  # Time spent producing the items
+    latency_saved_ms = db.Column(db.Float, nullable=True)  # On a cache hit, the original generation time avoided
+    duplicates_skipped = db.Column(db.Integer, default=0)  # Items not saved because the user already had a near-duplicate card
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -332,6 +438,137 @@ class ContentGeneration(db.Model):
             'focus_areas': self.focus_areas,
             'cards_generated': self.cards_generated,
             'generation_status': self.generation_status,
+            'error_message': self.error_message,
+            'cache_hit': bool(self.cache_hit),
+            'generation_ms': self.generation_ms,
+            'latency_saved_ms': self.latency_saved_ms,
+            'duplicates_skipped': self.duplicates_skipped or 0,
             'created_at': self.created_at.isoformat(),
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
-        }
\ No newline at end of file
+        }
+
+class NotificationOutbox(db.Model):
+    """Durable queue of pushes produced by the scheduler and drained by outbox workers"""
+    __tablename__ = 'notification_outbox'
+    
+    # Rows are spread over a fixed number of shards; workers each own shard % count == index
+    SHARD_COUNT = 1024
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    shard = db.Column(db.Integer, nullable=False)
+    dedupe_key = db.Column(db.String(120), unique=True, nullable=False)  # One row per logical notification
+    
+    # What to send
+    push_type = db.Column(db.String(20), nullable=False, default='alert')
+    device_token = db.Column(db.String(255), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # Serialized JSON body
+    
+    # Delivery state: 'pending', 'claimed', 'sent', 'failed'
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claimed_by = db.Column(db.String(80), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_status = db.Column(db.Integer, nullable=True)  # Last APNs HTTP status
+    error_message = db.Column(db.Text, nullable=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_notification_outbox_claim', 'status', 'available_at', 'shard'),
+    )
+    
+    @classmethod
+    def shard_for(cls, user_id):
+        """Stable shard for a user (independent of Python's per-process hash seed)"""
+        return zlib.crc32(str(user_id).encode()) % cls.SHARD_COUNT
+    
+    @classmethod
+    def row_for(cls, user_id, push_type, device_token, payload, dedupe_key, available_at=None):
+        """Column values for inserting one outbox entry"""
+        return {
+            'user_id': user_id,
+            'shard': cls.shard_for(user_id),
+            'dedupe_key': dedupe_key,
+            'push_type': push_type,
+            'device_token': device_token,
+            'payload': payload.decode('utf-8') if isinstance(payload, bytes) else
+                       payload if isinstance(payload, str) else json.dumps(payload),
+            'status': 'pending',
+            'attempts': 0,
+            'available_at': available_at or datetime.utcnow(),
+            'created_at': datetime.utcnow()
+        }
+    
+    @property
+    def is_recall_alert(self):
+        """The alert of a scheduled recall, which counts towards the user's daily cap once sent"""
+        return self.push_type == 'alert' and self.dedupe_key.startswith('recall:')
+    
+    @property
+    def apns_id(self):
+        """apns-id derived from the dedupe key, identical for every attempt at this notification"""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, self.dedupe_key)).upper()
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'push_type': self.push_type,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_status': self.last_status,
+            'error_message': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+class DailyRecallCount(db.Model):
+    """Recalls sent to a user on one (server-local) day, looked up by primary key"""
+    __tablename__ = 'daily_recall_count'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def increment(cls, user_ids, day=None):
+        """Atomically add one recall for each user id on `day` (runs in the caller's transaction)"""
+        if not user_ids:
+            return
+        day = day or datetime.now().date()
+        rows = [{'user_id': user_id, 'day': day, 'count': 1} for user_id in user_ids]
+        
+        dialect = UPSERT_DIALECTS.get(db.engine.dialect.name)
+        if dialect is None:
+            for user_id in user_ids:
+                counter = db.session.get(cls, (user_id, day))
+                if counter is None:
+                    db.session.add(cls(user_id=user_id, day=day, count=1))
+                else:
+                    counter.count += 1
+            return
+        
+        stmt = dialect.insert(cls.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'day'],
+            set_={'count': cls.__table__.c.count + 1}
+        )
+        db.session.execute(stmt, rows)
+    
+    @classmethod
+    def count_for(cls, user_id, day=None):
+        """Recalls sent to a user today (or on `day`)"""
+        counter = db.session.get(cls, (user_id, day or datetime.now().date()))
+        return counter.count if counter else 0
+    
+    @classmethod
+    def expire(cls, keep_days=7, today=None):
+        """Delete counters older than `keep_days` days"""
+        cutoff = (today or datetime.now().date()) - timedelta(days=keep_days)
+        deleted = cls.query.filter(cls.day < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
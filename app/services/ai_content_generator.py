@@ -3,41 +3,70 @@ Improved AI Content Generation Service with robust prompts and parsing
 """
 from openai import OpenAI
 import re
-import base64
-import PyPDF2
-import io
-from PIL import Image
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from typing import Callable, List, Dict, Any, Optional, Union
 from app.config import Config
+from app.utils.image_prep import image_preprocessor
+from app.utils.pdf_text import pdf_text_extractor
+from app.utils.uploads import SpooledUpload, as_upload
+from app.utils.text_chunker import chunk_text, count_tokens, allocate_budget
+from app.utils.card_stream import CardLineParser
+
+def _dedupe_key(text: str) -> frozenset:
+    return frozenset(re.findall(r'[a-z0-9]+', text.lower()))
+
+
+def _is_duplicate(key: frozenset, kept_keys: List[frozenset]) -> bool:
+    """Same words, or a word-set Jaccard similarity of at least 0.8"""
+    return any(key == other or (key and len(key & other) / len(key | other) >= 0.8) for other in kept_keys)
+
+
+class _StreamCollector:
+    """Thread-safe dedupe and max_items cap for items streamed from concurrent chunks"""
+    
+    def __init__(self, max_items: int, on_item: Callable[[Dict[str, Any]], None]):
+        self.max_items = max_items
+        self.on_item = on_item
+        self.items = []
+        self._keys = []
+        self._lock = threading.Lock()
+    
+    def add(self, item: Dict[str, Any]):
+        with self._lock:
+            key = _dedupe_key(item['front'])
+            if len(self.items) >= self.max_items or _is_duplicate(key, self._keys):
+                return
+            self._keys.append(key)
+            self.items.append(item)
+            # Called under the lock so consumers see items in one consistent order
+            self.on_item(item)
+
 
 class AIContentGenerator:
     """Enhanced service for generating flashcards and information pieces using AI"""
     
+    MODEL = "gpt-4o-mini"
+    
     def __init__(self):
         self.api_key = Config.OPENAI_API_KEY
-        self.client = OpenAI(api_key=self.api_key) if self.api_key else None
+        self.client = OpenAI(api_key=self.api_key, base_url=Config.OPENAI_BASE_URL or None) if self.api_key else None
+        self._executor = None
+        self._executor_lock = threading.Lock()
     
     def is_available(self):
         """Check if AI generation is available"""
         return bool(self.api_key and self.client)
     
-    def extract_text_from_pdf(self, pdf_content: bytes) -> str:
+    def extract_text_from_pdf(self, pdf_content: Union[bytes, SpooledUpload], page_range: str = None) -> str:
         """Extract text from PDF content with fallback handling"""
         try:
-            pdf_file = io.BytesIO(pdf_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            text = ""
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            
-            return text.strip()
+            return pdf_text_extractor.extract(pdf_content, page_range)
         except Exception as e:
             # Fallback: try to decode as text for invalid PDFs
             try:
-                text_content = pdf_content.decode('utf-8', errors='ignore')
+                text_content = as_upload(pdf_content).read().decode('utf-8', errors='ignore')
                 if text_content.strip():
                     return text_content.strip()
             except:
@@ -45,190 +74,194 @@ class AIContentGenerator:
             
             raise Exception(f"Failed to extract text from PDF: {str(e)}")
     
-    def encode_image(self, image_content: bytes) -> str:
+    def encode_image(self, image_content: Union[bytes, SpooledUpload]) -> str:
         """Encode image to base64 for OpenAI API with optimization"""
         try:
-            image = Image.open(io.BytesIO(image_content))
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize if too large (max 2048x2048 for GPT-4 Vision)
-            max_size = 2048
-            if image.width > max_size or image.height > max_size:
-                image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-            
-            # Convert back to bytes
-            img_buffer = io.BytesIO()
-            image.save(img_buffer, format='JPEG', quality=85)
-            img_buffer.seek(0)
-            
-            return base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+            return image_preprocessor.encode(image_content)
         except Exception as e:
             raise Exception(f"Failed to process image: {str(e)}")
     
     def generate_flashcards(self, source_material: str, subject: str = None, 
                           max_cards: int = 10, focus_areas: List[str] = None,
-                          images: List[bytes] = None, pdf_content: bytes = None) -> List[Dict[str, Any]]:
+                          images: List[bytes] = None, pdf_content: bytes = None,
+                          page_range: str = None, on_item: Callable = None) -> List[Dict[str, Any]]:
         """Generate flashcards with enhanced prompting"""
-        if not self.is_available():
-            raise Exception("OpenAI API key not configured")
-        
-        # Process additional content
-        full_content = source_material
-        if pdf_content:
-            pdf_text = self.extract_text_from_pdf(pdf_content)
-            full_content += f"\n\nPDF Content:\n{pdf_text}"
-        
-        prompt = self._build_flashcard_prompt(full_content, subject, max_cards, focus_areas)
-        
-        try:
-            messages = [
-                {
-                    "role": "system", 
-                    "content": "You are an expert educational content creator specializing in active recall and spaced repetition. You create high-quality, testable flashcards that optimize learning retention. Always follow the exact formatting requirements provided."
-                },
-                {"role": "user", "content": [{"type": "text", "text": prompt}]}
-            ]
-            
-            # Add images if provided
-            if images:
-                for image_content in images[:5]:  # Limit to 5 images
-                    try:
-                        encoded_image = self.encode_image(image_content)
-                        messages[1]["content"].append({
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_image}",
-                                "detail": "high"
-                            }
-                        })
-                    except Exception as e:
-                        print(f"Warning: Failed to process image: {e}")
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",  # Using the correct model name
-                messages=messages,
-                max_tokens=2500,
-                temperature=0.3,  # Lower temperature for more consistent formatting
-                presence_penalty=0.1,
-                frequency_penalty=0.1
-            )
-            
-            content = response.choices[0].message.content
-            return self._parse_flashcards(content, max_cards)
-            
-        except Exception as e:
-            raise Exception(f"Failed to generate flashcards: {str(e)}")
+        return self._generate('flashcards', source_material, subject, max_cards, focus_areas, images, pdf_content, page_range, on_item)
     
     def generate_information_pieces(self, source_material: str, subject: str = None,
                                   max_items: int = 10, focus_areas: List[str] = None,
-                                  images: List[bytes] = None, pdf_content: bytes = None) -> List[Dict[str, Any]]:
+                                  images: List[bytes] = None, pdf_content: bytes = None,
+                                  page_range: str = None, on_item: Callable = None) -> List[Dict[str, Any]]:
         """Generate information pieces with enhanced prompting"""
-        if not self.is_available():
-            raise Exception("OpenAI API key not configured")
-        
-        # Process additional content
-        full_content = source_material
-        if pdf_content:
-            pdf_text = self.extract_text_from_pdf(pdf_content)
-            full_content += f"\n\nPDF Content:\n{pdf_text}"
-        
-        prompt = self._build_information_prompt(full_content, subject, max_items, focus_areas)
-        
-        try:
-            messages = [
-                {
-                    "role": "system", 
-                    "content": "You are an expert educational content creator specializing in information retention and micro-learning. You extract the most important facts, formulas, and concepts for spaced repetition learning. Always follow the exact formatting requirements provided."
-                },
-                {"role": "user", "content": [{"type": "text", "text": prompt}]}
-            ]
-            
-            # Add images if provided
-            if images:
-                for image_content in images[:5]:
-                    try:
-                        encoded_image = self.encode_image(image_content)
-                        messages[1]["content"].append({
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_image}",
-                                "detail": "high"
-                            }
-                        })
-                    except Exception as e:
-                        print(f"Warning: Failed to process image: {e}")
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                max_tokens=2000,
-                temperature=0.3,
-                presence_penalty=0.1,
-                frequency_penalty=0.1
-            )
-            
-            content = response.choices[0].message.content
-            return self._parse_information_pieces(content, max_items)
-            
-        except Exception as e:
-            raise Exception(f"Failed to generate information pieces: {str(e)}")
+        return self._generate('information', source_material, subject, max_items, focus_areas, images, pdf_content, page_range, on_item)
     
     def generate_mixed_content(self, source_material: str, subject: str = None,
                              max_items: int = 10, focus_areas: List[str] = None,
-                             images: List[bytes] = None, pdf_content: bytes = None) -> List[Dict[str, Any]]:
+                             images: List[bytes] = None, pdf_content: bytes = None,
+                             page_range: str = None, on_item: Callable = None) -> List[Dict[str, Any]]:
         """Generate mixed content with enhanced prompting"""
+        return self._generate('mixed', source_material, subject, max_items, focus_areas, images, pdf_content, page_range, on_item)
+    
+    def _generate(self, kind: str, source_material: str, subject: Optional[str], max_items: int,
+                  focus_areas: Optional[List[str]], images: Optional[List[bytes]],
+                  pdf_content: Optional[bytes], page_range: Optional[str] = None,
+                  on_item: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """Split the material into token-bounded chunks, generate each chunk's share of
+        max_items concurrently, then merge and deduplicate the results
+        
+        With on_item, replies are streamed and every kept item is passed to it as soon
+        as it is parsed (from the chunk worker threads); the return value is the same
+        items in the order they arrived.
+        """
         if not self.is_available():
             raise Exception("OpenAI API key not configured")
         
         # Process additional content
-        full_content = source_material
+        full_content = source_material or ""
         if pdf_content:
-            pdf_text = self.extract_text_from_pdf(pdf_content)
+            pdf_text = self.extract_text_from_pdf(pdf_content, page_range)
             full_content += f"\n\nPDF Content:\n{pdf_text}"
         
-        prompt = self._build_mixed_prompt(full_content, subject, max_items, focus_areas)
+        # Encoded once, concurrently and without duplicates; images are sent with the first
+        # chunk only so they are not turned into cards repeatedly
+        encoded_images = image_preprocessor.encode_many((images or [])[:5])  # Limit to 5 images
+        
+        chunks = chunk_text(full_content, Config.GENERATION_CHUNK_TOKENS, Config.GENERATION_CHUNK_OVERLAP_TOKENS) or [full_content]
+        if len(chunks) == 1 and on_item is None:
+            return self._generate_chunk(kind, chunks[0], subject, max_items, focus_areas, encoded_images)
+        
+        if len(chunks) == 1:
+            jobs = [(chunks[0], max_items, encoded_images)]
+        else:
+            budgets = allocate_budget([count_tokens(chunk) for chunk in chunks], max_items)
+            # Ask for a little more than each chunk's share so deduplication can still fill max_items
+            jobs = [
+                (chunk, budget + -(-budget // 4), encoded_images if i == 0 else [])
+                for i, (chunk, budget) in enumerate(zip(chunks, budgets))
+                if budget > 0
+            ]
+        
+        collector = _StreamCollector(max_items, on_item) if on_item else None
+        futures = [
+            self._chunk_executor().submit(self._generate_chunk, kind, chunk, subject, count, focus_areas, chunk_images,
+                                          collector.add if collector else None)
+            for chunk, count, chunk_images in jobs
+        ]
+        results, errors = [], []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors.append(e)
+        
+        if errors and not (collector.items if collector else any(results)):
+            raise errors[0]
+        if errors:
+            print(f"Warning: {len(errors)} of {len(futures)} chunks failed to generate: {errors[0]}")
+        
+        if collector:
+            return collector.items
+        return self._merge_results(results, max_items)
+    
+    def _chunk_executor(self) -> ThreadPoolExecutor:
+        """Pool shared by all generations, capping concurrent OpenAI calls per process"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=Config.GENERATION_CHUNK_CONCURRENCY, thread_name_prefix='generation-chunk'
+                    )
+        return self._executor
+    
+    def _generate_chunk(self, kind: str, content: str, subject: Optional[str], count: int,
+                        focus_areas: Optional[List[str]], encoded_images: List[str],
+                        on_item: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """Run one prompt for one chunk of material and parse the reply
+        
+        With on_item, the reply is streamed and each card is passed to it as soon as
+        its line is complete.
+        """
+        if kind == 'flashcards':
+            prompt = self._build_flashcard_prompt(content, subject, count, focus_areas)
+            system = "You are an expert educational content creator specializing in active recall and spaced repetition. You create high-quality, testable flashcards that optimize learning retention. Always follow the exact formatting requirements provided."
+            max_tokens, parse, label = 2500, self._parse_flashcards, "flashcards"
+        elif kind == 'information':
+            prompt = self._build_information_prompt(content, subject, count, focus_areas)
+            system = "You are an expert educational content creator specializing in information retention and micro-learning. You extract the most important facts, formulas, and concepts for spaced repetition learning. Always follow the exact formatting requirements provided."
+            max_tokens, parse, label = 2000, self._parse_information_pieces, "information pieces"
+        else:
+            prompt = self._build_mixed_prompt(content, subject, count, focus_areas)
+            system = "You are an expert educational content creator specializing in active recall and spaced repetition. You create both testable flashcards and memorable information pieces for optimal learning. Always follow the exact formatting requirements provided and generate the exact number of items requested."
+            max_tokens, parse, label = 3000, self._parse_mixed_content, "mixed content"
         
         try:
             messages = [
-                {
-                    "role": "system", 
-                    "content": "You are an expert educational content creator specializing in active recall and spaced repetition. You create both testable flashcards and memorable information pieces for optimal learning. Always follow the exact formatting requirements provided and generate the exact number of items requested."
-                },
+                {"role": "system", "content": system},
                 {"role": "user", "content": [{"type": "text", "text": prompt}]}
             ]
             
             # Add images if provided
-            if images:
-                for image_content in images[:5]:
-                    try:
-                        encoded_image = self.encode_image(image_content)
-                        messages[1]["content"].append({
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_image}",
-                                "detail": "high"
-                            }
-                        })
-                    except Exception as e:
-                        print(f"Warning: Failed to process image: {e}")
+            for encoded_image in encoded_images:
+                messages[1]["content"].append({
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{encoded_image}",
+                        "detail": "high"
+                    }
+                })
             
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+            options = dict(
+                model=self.MODEL,
                 messages=messages,
-                max_tokens=3000,
-                temperature=0.3,
+                max_tokens=max_tokens,
+                temperature=0.3,  # Lower temperature for more consistent formatting
                 presence_penalty=0.1,
                 frequency_penalty=0.1
             )
             
-            content = response.choices[0].message.content
-            return self._parse_mixed_content(content, max_items)
+            if on_item is None:
+                response = self.client.chat.completions.create(**options)
+                content = response.choices[0].message.content
+                return parse(content, count)
             
+            parser = CardLineParser(kind, count)
+            items = []
+            stream = self.client.chat.completions.create(stream=True, **options)
+            try:
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        for item in parser.feed(delta):
+                            items.append(item)
+                            on_item(item)
+                    if parser.done:
+                        break
+            finally:
+                stream.response.close()  # Stop downloading once enough cards have arrived
+            for item in parser.close():
+                items.append(item)
+                on_item(item)
+            return items
+        
         except Exception as e:
-            raise Exception(f"Failed to generate mixed content: {str(e)}")
+            raise Exception(f"Failed to generate {label}: {str(e)}")
+    
+    def _merge_results(self, results: List[List[Dict[str, Any]]], max_items: int) -> List[Dict[str, Any]]:
+        """Interleave per-chunk items so every part of the source is represented, dropping
+        items whose wording mostly repeats one already kept (chunks overlap)"""
+        merged, kept_keys = [], []
+        for round_items in zip_longest(*results):
+            for item in round_items:
+                if item is None:
+                    continue
+                key = _dedupe_key(item['front'])
+                if _is_duplicate(key, kept_keys):
+                    continue
+                kept_keys.append(key)
+                merged.append(item)
+                if len(merged) >= max_items:
+                    return merged
+        return merged
     
     def _build_flashcard_prompt(self, source_material: str, subject: str, max_cards: int, focus_areas: List[str]) -> str:
         """Build enhanced prompt for flashcard generation"""
@@ -361,105 +394,12 @@ GENERATE EXACTLY {flashcard_count} FLASHCARDS AND {info_count} INFORMATION PIECE
     
     def _parse_flashcards(self, content: str, max_cards: int) -> List[Dict[str, Any]]:
         """Parse flashcards with robust error handling and validation"""
-        flashcards = []
-        lines = [line.strip() for line in content.strip().split('\n') if line.strip()]
-        
-        current_question = None
-        
-        for line in lines:
-            # Match question pattern (Q1:, Q2:, etc.)
-            q_match = re.match(r'^Q(\d+):\s*(.+)$', line, re.IGNORECASE)
-            if q_match:
-                current_question = q_match.group(2).strip()
-                continue
-            
-            # Match answer pattern (A1:, A2:, etc.)
-            a_match = re.match(r'^A(\d+):\s*(.+)$', line, re.IGNORECASE)
-            if a_match and current_question:
-                answer = a_match.group(2).strip()
-                
-                flashcards.append({
-                    'content_type': 'flashcard',
-                    'front': current_question,
-                    'back': answer
-                })
-                
-                current_question = None
-                
-                # Stop if we've reached the max
-                if len(flashcards) >= max_cards:
-                    break
-        
-        return flashcards[:max_cards]  # Ensure we don't exceed the limit
+        return CardLineParser('flashcards', max_cards).parse(content)
     
     def _parse_information_pieces(self, content: str, max_items: int) -> List[Dict[str, Any]]:
         """Parse information pieces with robust error handling and validation"""
-        info_pieces = []
-        lines = [line.strip() for line in content.strip().split('\n') if line.strip()]
-        
-        for line in lines:
-            # Match info pattern (INFO1:, INFO2:, etc.)
-            info_match = re.match(r'^INFO(\d+):\s*(.+)$', line, re.IGNORECASE)
-            if info_match:
-                info_content = info_match.group(2).strip()
-                
-                info_pieces.append({
-                    'content_type': 'information',
-                    'front': info_content,
-                    'back': None
-                })
-                
-                # Stop if we've reached the max
-                if len(info_pieces) >= max_items:
-                    break
-        
-        return info_pieces[:max_items]  # Ensure we don't exceed the limit
+        return CardLineParser('information', max_items).parse(content)
     
     def _parse_mixed_content(self, content: str, max_items: int) -> List[Dict[str, Any]]:
         """Parse mixed content with robust error handling and validation"""
-        items = []
-        lines = [line.strip() for line in content.strip().split('\n') if line.strip()]
-        
-        current_question = None
-        
-        for line in lines:
-            # Match question pattern (Q1:, Q2:, etc.)
-            q_match = re.match(r'^Q(\d+):\s*(.+)$', line, re.IGNORECASE)
-            if q_match:
-                current_question = q_match.group(2).strip()
-                continue
-            
-            # Match answer pattern (A1:, A2:, etc.)
-            a_match = re.match(r'^A(\d+):\s*(.+)$', line, re.IGNORECASE)
-            if a_match and current_question:
-                answer = a_match.group(2).strip()
-                
-                items.append({
-                    'content_type': 'flashcard',
-                    'front': current_question,
-                    'back': answer
-                })
-                
-                current_question = None
-                
-                # Stop if we've reached the max
-                if len(items) >= max_items:
-                    break
-                continue
-            
-            # Match information pattern (INFO1:, INFO2:, etc.)
-            info_match = re.match(r'^INFO(\d+):\s*(.+)$', line, re.IGNORECASE)
-            if info_match:
-                info_content = info_match.group(2).strip()
-                
-                items.append({
-                    'content_type': 'information',
-                    'front': info_content,
-                    'back': None
-                })
-                
-                # Stop if we've reached the max
-                if len(items) >= max_items:
-                    break
-        
-        return items[:max_items]  # Ensure we don't exceed the limit
\ No newline at end of file
+        return CardLineParser('mixed', max_items).parse(content)
\ No newline at end of file
@@ -0,0 +1,350 @@
+"""
+Apple Push Notification service (APNs) support shared by all push paths
+"""
+import os
+import jwt
+import time
+import h2.exceptions
+import httpx
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional
+from app.config import Config
+from app.utils.metrics import metrics
+from app.services.push_payloads import dumps
+
+APNS_REQUEST_SECONDS = metrics.histogram(
+    'apns_request_duration_seconds', 'APNs request latency by HTTP status (error = no response)', ['status']
+)
+APNS_TOKEN_CACHE = metrics.counter(
+    'apns_token_cache_lookups_total', 'APNs provider token lookups by cache result', ['result']
+)
+APNS_RECONNECTS = metrics.counter('apns_reconnects_total', 'APNs client pools replaced after connection failures')
+
+
+class APNsCredentialProvider:
+    """Loads the .p8 signing key once and reuses the signed provider token
+
+    Apple accepts a provider token for up to an hour and rejects tokens that are
+    refreshed more often than every 20 minutes, so a token is reused until it is
+    `refresh_after` seconds old and then re-signed by exactly one thread.
+    """
+
+    def __init__(self, key_path=None, key_id=None, team_id=None, algorithm=None, refresh_after=None):
+        self.key_path = key_path or Config.APNS_KEY_PATH
+        self.key_id = key_id if key_id is not None else Config.APNS_AUTH_KEY_ID
+        self.team_id = team_id if team_id is not None else Config.APNS_TEAM_ID
+        self.algorithm = algorithm or Config.ALGORITHM
+        self.refresh_after = refresh_after or Config.APNS_TOKEN_REFRESH_SECONDS
+
+        self._secret = None
+        self._cached = (None, 0.0)  # (token, issued_at) swapped atomically
+        self._lock = threading.Lock()
+
+        # Token cache statistics
+        self.hits = 0
+        self.misses = 0
+
+    def _load_key(self):
+        """Read the signing key from disk (first use only)"""
+        if self._secret is None:
+            if not os.path.exists(self.key_path):
+                raise Exception("APNs key file not found")
+            with open(self.key_path, "r") as f:
+                self._secret = f.read()
+        return self._secret
+
+    def get_token(self, now=None):
+        """Return a valid provider token, signing a new one only when the cached one is stale"""
+        now = time.time() if now is None else now
+
+        token, issued_at = self._cached
+        if token and now - issued_at < self.refresh_after:
+            self.hits += 1
+            APNS_TOKEN_CACHE.inc(result='hit')
+            return token
+
+        with self._lock:
+            # Another thread may have refreshed while we waited
+            token, issued_at = self._cached
+            if token and now - issued_at < self.refresh_after:
+                self.hits += 1
+                APNS_TOKEN_CACHE.inc(result='hit')
+                return token
+
+            token = jwt.encode(
+                {
+                    "iss": self.team_id,
+                    "iat": int(now),
+                },
+                self._load_key(),
+                algorithm=self.algorithm,
+                headers={"alg": self.algorithm, "kid": self.key_id},
+            )
+            self._cached = (token, now)
+            self.misses += 1
+            APNS_TOKEN_CACHE.inc(result='miss')
+            return token
+
+    def invalidate(self):
+        """Drop the cached token (e.g. after APNs answers ExpiredProviderToken)"""
+        with self._lock:
+            self._cached = (None, 0.0)
+
+    def reload_key(self):
+        """Forget the cached key and token so both are read again on next use"""
+        with self._lock:
+            self._secret = None
+            self._cached = (None, 0.0)
+
+
+class APNsResponse:
+    """Result of a single APNs request"""
+
+    # Rejections meaning the token will never be deliverable again
+    DEAD_TOKEN_REASONS = {"BadDeviceToken", "Unregistered", "DeviceTokenNotForTopic", "ExpiredToken"}
+
+    # Outcomes returned by `outcome`
+    SENT = "sent"
+    DEAD_TOKEN = "dead_token"
+    RETRY = "retry"
+    REJECTED = "rejected"
+
+    def __init__(self, status_code: int, apns_id: Optional[str] = None, reason: Optional[str] = None,
+                 retry_after: Optional[float] = None):
+        self.status_code = status_code
+        self.apns_id = apns_id
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def ok(self):
+        return self.status_code == 200
+
+    @property
+    def is_dead_token(self):
+        """410, or a 400 whose reason says the token is invalid"""
+        return self.status_code == 410 or (self.status_code == 400 and self.reason in self.DEAD_TOKEN_REASONS)
+
+    @property
+    def is_retryable(self):
+        """Throttling and server-side failures are worth retrying later"""
+        return self.status_code == 429 or self.status_code >= 500
+
+    @property
+    def outcome(self):
+        """Classify the response as sent, dead_token, retry or rejected"""
+        if self.ok:
+            return self.SENT
+        if self.is_dead_token:
+            return self.DEAD_TOKEN
+        if self.is_retryable:
+            return self.RETRY
+        return self.REJECTED
+
+    def __repr__(self):
+        reason = f" {self.reason}" if self.reason else ""
+        return f"<APNsResponse {self.status_code}{reason}>"
+
+
+class APNsClient:
+    """Long-lived HTTP/2 client multiplexing pushes over a few pooled connections
+
+    httpx clients are bound to the event loop that created them, so one client is
+    kept per running loop. Connections dropped by the server (GOAWAY, resets) cause
+    the client to be replaced once and the affected requests retried; a pool that sits
+    idle too long or keeps failing is rebuilt by check_health(), which the push
+    dispatcher runs before each fan-out.
+    """
+
+    # Errors raised when APNs sends GOAWAY or the connection otherwise goes away
+    CONNECTION_ERRORS = (httpx.ProtocolError, httpx.NetworkError, httpx.PoolTimeout, h2.exceptions.ProtocolError)
+
+    # Attempts per push when its connection is torn down underneath it
+    MAX_CONNECTION_ATTEMPTS = 3
+
+    def __init__(self, base_url=None, credentials=None, max_connections=None, timeout=None,
+                 max_idle_seconds=None, max_streams=None):
+        self.base_url = (base_url or Config.APNS_BASE_URL).rstrip('/')
+        self.credentials = credentials or apns_credentials
+        self.max_connections = max_connections or Config.APNS_MAX_CONNECTIONS
+        self.timeout = timeout or Config.APNS_REQUEST_TIMEOUT
+        self.max_idle_seconds = max_idle_seconds or Config.APNS_MAX_IDLE_SECONDS
+        self.max_streams = max_streams or Config.APNS_MAX_CONCURRENT_STREAMS
+
+        self._clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+        self._last_used = weakref.WeakKeyDictionary()
+        self._stream_slots = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+        self._lock = threading.Lock()
+        self._closing = set()  # retired clients waiting for in-flight streams
+        self.consecutive_failures = 0
+        self.reconnects = 0
+
+    def _new_client(self) -> httpx.AsyncClient:
+        """Create a pooled HTTP/2 client (prior-knowledge h2c for plain http stand-in servers)"""
+        return httpx.AsyncClient(
+            http1=not self.base_url.startswith('http://'),
+            http2=True,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.max_idle_seconds
+            )
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the client for the running event loop, creating it on first use"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None or client.is_closed:
+                client = self._new_client()
+                self._clients[loop] = client
+            self._last_used[loop] = time.monotonic()
+            return client
+
+    def _get_stream_slots(self) -> asyncio.Semaphore:
+        """Bound in-flight streams for the running loop
+
+        A fresh connection only allows 100 streams until the server's SETTINGS arrive,
+        and overrunning that fails every request multiplexed on the connection.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slots = self._stream_slots.get(loop)
+            if slots is None:
+                slots = asyncio.Semaphore(self.max_streams)
+                self._stream_slots[loop] = slots
+            return slots
+
+    async def _reset_client(self, broken_client=None):
+        """Replace the current loop's client so later requests open fresh connections
+
+        When `broken_client` is given, the client is only replaced if it is still the
+        current one, so a burst of failures on one dead connection reconnects once.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None or (broken_client is not None and client is not broken_client):
+                return
+            del self._clients[loop]
+        self.reconnects += 1
+        APNS_RECONNECTS.inc()
+
+        # Streams the server already accepted can still complete on the old connections,
+        # so the retired client is only closed once the request timeout has passed
+        task = loop.create_task(self._close_later(client))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close_later(self, client: httpx.AsyncClient):
+        await asyncio.sleep(self.timeout)
+        try:
+            await client.aclose()
+        except Exception:
+            pass
+
+    async def check_health(self) -> bool:
+        """Recycle the connection pool if it keeps failing or has been idle too long"""
+        loop = asyncio.get_running_loop()
+        last_used = self._last_used.get(loop)
+        idle_too_long = last_used is not None and time.monotonic() - last_used > self.max_idle_seconds
+        if self.consecutive_failures >= self.MAX_CONNECTION_ATTEMPTS * 2 or idle_too_long:
+            await self._reset_client()
+            self.consecutive_failures = 0
+            return False
+        return True
+
+    def build_headers(self, push_type: str = "alert", topic: Optional[str] = None, priority: int = 10,
+                      apns_id: Optional[str] = None, expiration: Optional[int] = None) -> Dict[str, str]:
+        """Build the APNs request headers for a push"""
+        if topic is None:
+            topic = Config.BUNDLE_ID if push_type == "alert" else f"{Config.BUNDLE_ID}.push-type.{push_type}"
+
+        headers = {
+            "apns-topic": topic,
+            "authorization": f"bearer {self.credentials.get_token()}",
+            "apns-push-type": push_type,
+            "apns-priority": str(priority)
+        }
+        if apns_id:
+            headers["apns-id"] = apns_id
+        if expiration is not None:
+            headers["apns-expiration"] = str(expiration)
+        return headers
+
+    async def send(self, device_token: str, payload: Any, push_type: str = "alert", topic: Optional[str] = None,
+                   priority: int = 10, apns_id: Optional[str] = None, expiration: Optional[int] = None) -> APNsResponse:
+        """Send one push; payload may be a dict or pre-serialized JSON bytes"""
+        body = payload if isinstance(payload, (bytes, bytearray)) else dumps(payload)
+        url = f"{self.base_url}/3/device/{device_token}"
+
+        token_refreshed = False
+        attempt = 0
+        while True:
+            attempt += 1
+            headers = self.build_headers(push_type, topic, priority, apns_id, expiration)
+            client = self._get_client()
+            try:
+                async with self._get_stream_slots():
+                    started = time.perf_counter()
+                    response = await client.post(url, headers=headers, content=body)
+            except self.CONNECTION_ERRORS:
+                APNS_REQUEST_SECONDS.observe(time.perf_counter() - started, status='error')
+                # GOAWAY or dropped connection: reconnect once for everyone on that
+                # client, then retry this push on the fresh connection
+                self.consecutive_failures += 1
+                await self._reset_client(client)
+                if attempt >= self.MAX_CONNECTION_ATTEMPTS:
+                    raise
+                continue
+
+            APNS_REQUEST_SECONDS.observe(time.perf_counter() - started, status=str(response.status_code))
+            self.consecutive_failures = 0
+            result = self._parse_response(response)
+
+            # A rejected provider token is re-signed once
+            if result.status_code == 403 and result.reason == "ExpiredProviderToken" and not token_refreshed:
+                token_refreshed = True
+                self.credentials.invalidate()
+                continue
+            return result
+
+    @staticmethod
+    def _parse_response(response: httpx.Response) -> APNsResponse:
+        """Extract status, apns-id, failure reason and Retry-After from a response"""
+        reason = None
+        if response.status_code != 200 and response.content:
+            try:
+                reason = response.json().get("reason")
+            except ValueError:
+                reason = None
+
+        retry_after = response.headers.get("retry-after")
+        try:
+            retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            retry_after = None
+
+        return APNsResponse(
+            status_code=response.status_code,
+            apns_id=response.headers.get("apns-id"),
+            reason=reason,
+            retry_after=retry_after
+        )
+
+    async def aclose(self):
+        """Close the current loop's client"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+
+# Shared provider and client for the application
+apns_credentials = APNsCredentialProvider()
+apns_client = APNsClient()
@@ -5,9 +5,25 @@ from datetime import datetime, timedelta
 from flask import request, session
 from werkzeug.security import generate_password_hash
 import re
+import time
 from app.models import User, UserSession, PasswordResetToken
+from app.config import Config
+from app.services.recall_scheduler import recall_scheduler
+from app.utils.rate_limiter import LoginRateLimiter
 from app import db
 
+# Minimum time between persisted session last_activity updates
+SESSION_ACTIVITY_INTERVAL = timedelta(minutes=1)
+
+# Shared login throttle (checked before any password hash work)
+login_rate_limiter = LoginRateLimiter(
+    ip_limit=Config.LOGIN_RATE_LIMIT_PER_IP,
+    account_limit=Config.LOGIN_RATE_LIMIT_PER_ACCOUNT,
+    window_seconds=Config.LOGIN_RATE_LIMIT_WINDOW,
+    max_keys=Config.LOGIN_RATE_LIMIT_MAX_KEYS,
+    storage_path=Config.RATE_LIMIT_STORAGE_PATH or None
+)
+
 class AuthService:
     """Service for handling authentication operations"""
     
@@ -45,6 +61,15 @@ class AuthService:
         
         return True, "Username is valid"
     
+    @staticmethod
+    def get_client_ip():
+        """Get the client IP address for the current request
+
+        X-Forwarded-For is set by the client, so it is never read here; behind a
+        trusted proxy, PROXY_FIX_X_FOR makes ProxyFix rewrite REMOTE_ADDR instead.
+        """
+        return request.remote_addr
+    
     @staticmethod
     def register_user(username, email, password, first_name=None, last_name=None):
         """Register a new user"""
@@ -93,6 +118,19 @@ class AuthService:
     @staticmethod
     def authenticate_user(username_or_email, password):
         """Authenticate user with username/email and password"""
+        # Reserve the attempt before touching the database or hashing the password;
+        # failures keep the reservation, throttled clients are turned away here
+        ip_address = AuthService.get_client_ip()
+        attempted_at = time.time()
+        retry_after = login_rate_limiter.acquire(ip_address, username_or_email, attempted_at)
+        if retry_after:
+            return {
+                'success': False,
+                'error': 'Too many login attempts. Please try again later.',
+                'rate_limited': True,
+                'retry_after': int(retry_after) + 1
+            }
+        
         # Find user by username or email
         user = User.query.filter(
             (User.username == username_or_email) | 
@@ -108,12 +146,15 @@ class AuthService:
         if not user.check_password(password):
             return {'success': False, 'error': 'Invalid password'}
         
+        login_rate_limiter.record_success(ip_address, username_or_email, attempted_at)
+        
         # Update last login
         user.update_last_login()
         
         return {
             'success': True,
             'user': user.to_dict(include_sensitive=True),
+            'user_obj': user,
             'message': 'Authentication successful'
         }
     
@@ -125,13 +166,8 @@ class AuthService:
         if not auth_result['success']:
             return auth_result
         
-        # Create session
-        user = User.query.filter(
-            (User.username == username_or_email) | 
-            (User.email == username_or_email)
-        ).first()
-        
-        session_result = AuthService.create_session(user.id)
+        # Create session for the user loaded during authentication
+        session_result = AuthService.create_session(auth_result['user_obj'].id)
         if not session_result['success']:
             return session_result
         
@@ -147,7 +183,7 @@ class AuthService:
         """Create a new user session"""
         try:
             # Get request metadata
-            ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR'))
+            ip_address = AuthService.get_client_ip()
             user_agent = request.environ.get('HTTP_USER_AGENT', '')
             
             # Create session
@@ -185,11 +221,14 @@ class AuthService:
         if not user_session.is_valid():
             return {'success': False, 'error': 'Session expired or inactive'}
         
-        # Update last activity
-        user_session.last_activity = datetime.utcnow()
-        db.session.commit()
+        # Update last activity at most once a minute; committing expires every loaded
+        # object, so doing it on each request would force the user to be reloaded
+        now = datetime.utcnow()
+        if not user_session.last_activity or now - user_session.last_activity >= SESSION_ACTIVITY_INTERVAL:
+            user_session.last_activity = now
+            db.session.commit()
         
-        # Get user
+        # Get user (loaded once here and shared with the rest of the request)
         user = User.query.get(user_session.user_id)
         if not user or not user.is_active:
             return {'success': False, 'error': 'User account not found or inactive'}
@@ -197,6 +236,7 @@ class AuthService:
         return {
             'success': True,
             'user': user.to_dict(include_sensitive=True),
+            'user_obj': user,
             'session': user_session.to_dict()
         }
     
@@ -262,7 +302,8 @@ class AuthService:
                 if field in allowed_fields and hasattr(user, field):
                     setattr(user, field, value)
             
-            db.session.commit()
+            # Preferences may move the next recall slot
+            recall_scheduler.reschedule_user(user)
             
             return {
                 'success': True,
@@ -0,0 +1,290 @@
+"""
+Near-duplicate card index
+Per-user LSH buckets over the MinHash signature stored on each card, so AI generation
+and imports can check a candidate against a whole deck in microseconds instead of
+comparing card text
+"""
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+from app.models import Card
+from app.config import Config
+from app.utils import minhash
+from app.utils.metrics import metrics
+from app import db
+
+DUPLICATE_CHECKS = metrics.counter('duplicate_index_checks_total', 'Near-duplicate checks by result', ['result'])
+DUPLICATE_INDEX_LOADS = metrics.counter('duplicate_index_loads_total', 'User indexes loaded from the database')
+
+
+class LshTable:
+    """Banded LSH buckets over packed signatures
+
+    A signature is split into `bands` bands of NUM_HASHES / bands values; cards
+    sharing any band land in the same bucket and become candidates, which are then
+    confirmed by comparing full signatures, held as integers so the comparison needs
+    no unpacking. Buckets hold a bare key until a second key arrives.
+    """
+
+    def __init__(self, bands: int):
+        self.bands = bands
+        self.rows = minhash.NUM_HASHES // bands
+        self.signatures = {}  # key -> packed signature as an int
+        self._buckets = {}  # band hash -> key or list of keys
+
+    def _band_hashes(self, sig: minhash.Signature) -> List[int]:
+        rows = self.rows
+        return [hash((band,) + sig[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def insert(self, key: int, packed: bytes):
+        self.remove(key)
+        sig = minhash.unpack(packed)
+        if sig is None:
+            return
+        self.signatures[key] = int.from_bytes(packed, 'little')
+        for band_hash in self._band_hashes(sig):
+            members = self._buckets.get(band_hash)
+            if members is None:
+                self._buckets[band_hash] = key
+            elif isinstance(members, list):
+                members.append(key)
+            else:
+                self._buckets[band_hash] = [members, key]
+
+    def remove(self, key: int):
+        value = self.signatures.pop(key, None)
+        if value is None:
+            return
+        packed = value.to_bytes(minhash.NUM_HASHES * 4, 'little')
+        for band_hash in self._band_hashes(minhash.unpack(packed)):
+            members = self._buckets.get(band_hash)
+            if members == key:
+                del self._buckets[band_hash]
+            elif isinstance(members, list) and key in members:
+                members.remove(key)
+                if len(members) == 1:
+                    self._buckets[band_hash] = members[0]
+
+    def query(self, sig: minhash.Signature, threshold: float) -> Optional[Tuple[int, float]]:
+        """Most similar key at or above threshold, as (key, similarity)"""
+        candidates = set()
+        for band_hash in self._band_hashes(sig):
+            members = self._buckets.get(band_hash)
+            if isinstance(members, list):
+                candidates.update(members)
+            elif members is not None:
+                candidates.add(members)
+
+        best = None
+        value = int.from_bytes(minhash.pack(sig), 'little')
+        signatures = self.signatures
+        for key in candidates:
+            score = minhash.packed_similarity(value, signatures[key])
+            if score >= threshold and (best is None or score > best[1]):
+                best = (key, score)
+        return best
+
+    def __len__(self):
+        return len(self.signatures)
+
+
+class DuplicateBatch:
+    """Checks a batch of new cards against the user's deck and against each other
+
+    The user's index is loaded when the batch is created (which needs an app
+    context); check() itself never touches the database, so it can be called from
+    worker threads, one at a time.
+    """
+
+    def __init__(self, index: 'DuplicateIndex', user_id: int):
+        self.index = index
+        self.user_id = user_id
+        self._table = index._table(user_id)
+        self._batch = LshTable(index.bands)
+        self._position = 0
+
+    def check(self, front: Optional[str], back: Optional[str] = None, key: Optional[int] = None) -> Optional[dict]:
+        """The near-duplicate of a candidate card, if any; candidates without one are remembered
+
+        Returns {'card_id': ..., 'similarity': ...} for a saved card, or
+        {'card_id': None, 'batch_key': ..., 'similarity': ...} when it repeats an earlier
+        candidate of this batch. key names the candidate in such matches (a row number,
+        say) and defaults to its position, counting check() calls from 0.
+        """
+        if key is None:
+            key = self._position
+        self._position += 1
+        sig = minhash.signature(front, back)
+        if sig is None:
+            return None
+
+        match = self.index._query(self._table, sig)
+        if match is None:
+            earlier = self._batch.query(sig, self.index.threshold)
+            if earlier is not None:
+                DUPLICATE_CHECKS.inc(result='batch_duplicate')
+                return {'card_id': None, 'batch_key': earlier[0], 'similarity': round(earlier[1], 2)}
+            self._batch.insert(key, minhash.pack(sig))
+        return match
+
+
+class DuplicateIndex:
+    """In-memory LSH index per user, loaded from Card.minhash on first use
+
+    Tables for the most recently used `max_users` users are kept. Committed card
+    inserts, text edits and deletes are applied to loaded tables by the session hooks
+    below, so an index never needs rebuilding while the process runs.
+    """
+
+    def __init__(self, threshold=None, bands=None, max_users=None):
+        self.threshold = threshold or Config.DEDUPE_SIMILARITY
+        self.bands = bands or Config.DEDUPE_LSH_BANDS
+        self.max_users = max_users or Config.DEDUPE_INDEX_MAX_USERS
+        self._tables = OrderedDict()  # user_id -> LshTable, least recently used first
+        self._loading = {}  # user_id -> change buffers of the threads currently loading that table
+        self._lock = threading.Lock()
+
+    def find(self, user_id: int, front: Optional[str], back: Optional[str] = None) -> Optional[dict]:
+        """The user's card most similar to this text, if at least `threshold`; requires an app context"""
+        sig = minhash.signature(front, back)
+        if sig is None:
+            return None
+        return self._query(self._table(user_id), sig)
+
+    def batch(self, user_id: int) -> DuplicateBatch:
+        return DuplicateBatch(self, user_id)
+
+    def _query(self, table: LshTable, sig: minhash.Signature) -> Optional[dict]:
+        with self._lock:
+            match = table.query(sig, self.threshold)
+        DUPLICATE_CHECKS.inc(result='duplicate' if match else 'unique')
+        if match is None:
+            return None
+        return {'card_id': match[0], 'similarity': round(match[1], 2)}
+
+    # --- Per-user tables ---
+
+    def _table(self, user_id: int) -> LshTable:
+        with self._lock:
+            table = self._tables.get(user_id)
+            if table is not None:
+                self._tables.move_to_end(user_id)
+                return table
+            # Changes committed from here on may be missing from the query below; apply()
+            # collects them so they can be replayed once the table is built
+            buffer = []
+            self._loading.setdefault(user_id, []).append(buffer)
+
+        try:
+            table = self._load(user_id)
+        finally:
+            with self._lock:
+                buffers = self._loading[user_id]
+                buffers.remove(buffer)
+                if not buffers:
+                    del self._loading[user_id]
+
+        with self._lock:
+            # Another thread may have loaded it meanwhile; keep the first, which apply() has kept current
+            existing = self._tables.get(user_id)
+            if existing is not None:
+                return existing
+            # Replaying changes the query already saw is harmless: inserts and removes are idempotent
+            for card_id, packed in buffer:
+                self._apply_to(table, card_id, packed)
+            self._tables[user_id] = table
+            while len(self._tables) > self.max_users:
+                self._tables.popitem(last=False)
+        return table
+
+    def _load(self, user_id: int) -> LshTable:
+        """Build a user's table from the stored signatures"""
+        table = LshTable(self.bands)
+        with db.session.no_autoflush:
+            rows = db.session.query(Card.id, Card.minhash).filter(Card.user_id == user_id).all()
+            unsigned = [card_id for card_id, packed in rows if packed is None]
+            if unsigned:
+                # Cards saved before signatures existed, until the migration backfills them
+                for card_id, front, back in db.session.query(Card.id, Card.front, Card.back)\
+                        .filter(Card.id.in_(unsigned)).all():
+                    sig = minhash.signature(front, back)
+                    if sig is not None:
+                        table.insert(card_id, minhash.pack(sig))
+        for card_id, packed in rows:
+            if packed is not None:
+                table.insert(card_id, packed)
+        DUPLICATE_INDEX_LOADS.inc()
+        return table
+
+    def apply(self, changes: List[Tuple[int, int, Optional[bytes]]]):
+        """Apply committed (user_id, card_id, packed signature or None to remove) changes to loaded tables
+
+        Changes for a table that is still loading are buffered for _table() to replay.
+        """
+        with self._lock:
+            for user_id, card_id, packed in changes:
+                for buffer in self._loading.get(user_id, ()):
+                    buffer.append((card_id, packed))
+                table = self._tables.get(user_id)
+                if table is not None:
+                    self._apply_to(table, card_id, packed)
+
+    @staticmethod
+    def _apply_to(table: LshTable, card_id: int, packed: Optional[bytes]):
+        if packed is None:
+            table.remove(card_id)
+        else:
+            table.insert(card_id, packed)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self._tables.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+    def __len__(self):
+        return sum(len(table) for table in list(self._tables.values()))
+
+
+# Singleton instance
+duplicate_index = DuplicateIndex()
+
+metrics.gauge('duplicate_index_cards', 'Card signatures held in memory', callback=lambda: len(duplicate_index))
+
+
+def _record_change(card: Card, packed: Optional[bytes]):
+    session = object_session(card)
+    if session is not None:
+        session.info.setdefault('duplicate_index_changes', []).append((card.user_id, card.id, packed))
+
+
+@event.listens_for(Card, 'after_insert')
+def _index_inserted_card(mapper, connection, card):
+    _record_change(card, card.minhash)
+
+
+@event.listens_for(Card, 'after_update')
+def _index_updated_card(mapper, connection, card):
+    if inspect(card).attrs.minhash.history.has_changes():
+        _record_change(card, card.minhash)
+
+
+@event.listens_for(Card, 'after_delete')
+def _unindex_deleted_card(mapper, connection, card):
+    _record_change(card, None)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_after_commit(session):
+    changes = session.info.pop('duplicate_index_changes', None)
+    if changes:
+        duplicate_index.apply(changes)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('duplicate_index_changes', None)
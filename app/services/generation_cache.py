@@ -0,0 +1,152 @@
+"""
+Content-addressed cache for AI generation results
+Regenerating from the same notes, PDF or images with the same settings returns the
+previously parsed items instead of calling OpenAI again
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Union
+from app.config import Config
+from app.utils.metrics import metrics
+from app.utils.uploads import SpooledUpload, as_upload
+
+GENERATION_CACHE_LOOKUPS = metrics.counter('generation_cache_lookups_total', 'Generation cache lookups', ['result'])
+
+
+def _collapse_whitespace(text: Optional[str]) -> str:
+    """Collapse whitespace so trivially re-pasted notes hash the same; case is kept ("CO" is not "Co")"""
+    return ' '.join((text or '').split())
+
+
+def _normalize(text: Optional[str]) -> str:
+    """Collapse whitespace and case, for settings such as the subject"""
+    return _collapse_whitespace(text).lower()
+
+
+class GenerationCache:
+    """SQLite store of parsed generation items keyed by a SHA-256 of everything that shapes the output
+
+    Entries remember how long the original generation took so a hit can report the
+    latency it saved. The file is capped at max_bytes of stored items by evicting
+    the least recently used entries.
+    """
+
+    def __init__(self, db_path=None, max_bytes=None):
+        self.db_path = Config.GENERATION_CACHE_PATH if db_path is None else db_path
+        self.max_bytes = max_bytes or Config.GENERATION_CACHE_MAX_BYTES
+        self._local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.db_path)
+
+    @staticmethod
+    def key_for(generation_type: str, source_material: Optional[str], subject: Optional[str], max_items: int,
+                focus_areas: Optional[List[str]] = None, pdf_content: Optional[Union[bytes, SpooledUpload]] = None,
+                images: Optional[List[Union[bytes, SpooledUpload]]] = None, model: str = '',
+                page_range: Optional[str] = None) -> str:
+        """Hash of the normalized inputs, file digests and settings of a generation"""
+        parts = {
+            'type': generation_type,
+            'source': hashlib.sha256(_collapse_whitespace(source_material).encode('utf-8')).hexdigest(),
+            'pdf': as_upload(pdf_content).sha256() if pdf_content else None,
+            'pages': ''.join((page_range or '').split()) if pdf_content else None,
+            'images': [as_upload(image).sha256() for image in (images or [])[:5]],
+            'subject': _normalize(subject),
+            'max_items': int(max_items),
+            'focus_areas': sorted(_normalize(area) for area in (focus_areas or []) if area.strip()),
+            'model': model
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _connection(self):
+        """Get this thread's connection, creating the table on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+
+        if not self._initialized:
+            with self._init_lock:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS generation_cache ("
+                    "key TEXT PRIMARY KEY, items BLOB NOT NULL, size INTEGER NOT NULL, "
+                    "latency_ms REAL NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS ix_generation_cache_last_used ON generation_cache (last_used_at)"
+                )
+                self._initialized = True
+        return conn
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return {'items': [...], 'latency_ms': original generation time} or None on a miss"""
+        if not self.enabled:
+            return None
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT items, latency_ms FROM generation_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE generation_cache SET last_used_at = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            print(f"Generation cache read failed: {e}")
+            row = None
+
+        GENERATION_CACHE_LOOKUPS.inc(result='hit' if row else 'miss')
+        if row is None:
+            return None
+        return {'items': json.loads(row[0]), 'latency_ms': row[1]}
+
+    def put(self, key: str, items: List[Dict], latency_ms: float):
+        """Store parsed items for key, evicting old entries if the cache is over its size cap"""
+        if not self.enabled or not items:
+            return
+        blob = json.dumps(items, ensure_ascii=False).encode('utf-8')
+        if len(blob) > self.max_bytes:
+            return
+
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO generation_cache (key, items, size, latency_ms, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, blob, len(blob), latency_ms, now, now)
+            )
+            self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"Generation cache write failed: {e}")
+
+    def _evict(self, conn):
+        """Drop least recently used entries until stored items fit in 90% of max_bytes"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM generation_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        to_free = total - int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM generation_cache ORDER BY last_used_at"):
+            victims.append((key,))
+            to_free -= size
+            if to_free <= 0:
+                break
+        conn.executemany("DELETE FROM generation_cache WHERE key = ?", victims)
+
+    def clear(self):
+        if self.enabled:
+            self._connection().execute("DELETE FROM generation_cache")
+
+
+# Singleton instance
+generation_cache = GenerationCache()
@@ -0,0 +1,396 @@
+"""
+Background Content Generation Jobs
+Runs PDF/image extraction, the OpenAI calls and card inserts on a bounded worker pool
+so web requests only create a ContentGeneration row and return its id
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Union
+from app.models import Card, ContentGeneration
+from app.config import Config
+from app.services.ai_content_generator import AIContentGenerator
+from app.services.duplicate_index import duplicate_index
+from app.services.generation_cache import generation_cache
+from app.utils.metrics import metrics
+from app.utils.uploads import SpooledUpload, as_upload
+from app import db
+
+GENERATION_JOBS = metrics.counter('content_generation_jobs_total', 'Content generation jobs by outcome', ['result'])
+GENERATION_SECONDS = metrics.histogram(
+    'content_generation_seconds', 'Time from job start to completion',
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+
+
+def friendly_error(error_message: str) -> str:
+    """Turn a generation exception into a message suitable for the user"""
+    if "Failed to extract text from PDF" in error_message:
+        return "Unable to process the uploaded PDF file. Please ensure it's a valid PDF with extractable text."
+    if "Failed to process image" in error_message:
+        return "Unable to process one or more uploaded images. Please ensure they are valid image files."
+    if "OpenAI" in error_message or "API" in error_message:
+        return "AI service temporarily unavailable. Please try again in a moment."
+    return error_message
+
+
+def _close_uploads(pdf_content, images):
+    for upload in [pdf_content] + list(images):
+        if upload is not None:
+            upload.close()
+
+
+class CardBatcher:
+    """Inserts a generation's cards in small batches while the job is still running
+
+    The first card is written straight away; after that the buffer is committed when
+    it reaches `batch_size` cards or when a card arrives `flush_seconds` after the
+    previous write, so streamed cards show up within about a second without a commit
+    per card. add() is called from the generator's chunk threads, so every write uses
+    its own app context (and session), and on_flush is called after each commit.
+
+    With skip_duplicates, items that are near-duplicates of the user's existing cards
+    (or of earlier items) are counted in `skipped` instead of saved.
+    """
+
+    def __init__(self, app, generation_id: int, user_id: int, folder_id: Optional[int], subject: Optional[str],
+                 on_flush=None, batch_size=None, flush_seconds=None, skip_duplicates=False):
+        self.app = app
+        self.generation_id = generation_id
+        self.user_id = user_id
+        self.folder_id = folder_id
+        self.subject = subject
+        self.on_flush = on_flush
+        self.batch_size = batch_size or Config.GENERATION_STREAM_BATCH_SIZE
+        self.flush_seconds = Config.GENERATION_STREAM_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self.added = 0  # Cards received
+        self.count = 0  # Cards committed so far
+        self.skipped = 0  # Near-duplicates not saved
+        self._duplicates = None
+        if skip_duplicates:
+            with app.app_context():
+                self._duplicates = duplicate_index.batch(user_id)
+        self.error = None
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, item: dict):
+        with self._lock:
+            if self.error is not None:
+                raise self.error
+            self.added += 1
+            if self._duplicates is not None and self._duplicates.check(item['front'], item.get('back')):
+                self.skipped += 1
+                return
+            self._pending.append(item)
+            if (self.count == 0 or len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_seconds):
+                self._flush()
+
+    def flush(self):
+        """Write whatever is still buffered"""
+        with self._lock:
+            if self.error is not None:
+                raise self.error
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        items, self._pending = self._pending, []
+        try:
+            with self.app.app_context():
+                db.session.add_all([
+                    Card(
+                        user_id=self.user_id,
+                        folder_id=self.folder_id,
+                        generation_id=self.generation_id,
+                        content_type=item['content_type'],
+                        front=item['front'],
+                        back=item.get('back'),
+                        subject=self.subject,
+                        is_ai_generated=True
+                    )
+                    for item in items
+                ])
+                ContentGeneration.query.filter_by(id=self.generation_id).update(
+                    {'cards_generated': ContentGeneration.cards_generated + len(items)}, synchronize_session=False
+                )
+                db.session.commit()
+        except Exception as e:
+            self.error = e
+            raise
+        self.count += len(items)
+        self._last_flush = time.monotonic()
+        if self.on_flush is not None:
+            self.on_flush()
+
+
+class GenerationJobQueue:
+    """Bounded pool of generation workers backed by ContentGeneration.generation_status
+
+    Status moves pending -> processing -> completed | failed. Uploaded files are
+    kept (spooled) only until their job runs, so jobs lost to a restart are marked
+    failed when the next process starts taking work.
+    """
+
+    def __init__(self, workers=None, max_pending=None, generator=None):
+        self.workers = workers or Config.GENERATION_WORKERS
+        self.max_pending = max_pending or Config.GENERATION_MAX_PENDING
+        self.generator = generator or AIContentGenerator()
+        self._executor = None
+        self._app = None
+        self._pending = 0  # Queued or running jobs in this process
+        self._lock = threading.Lock()
+        self._updates = threading.Condition()
+        self._version = 0  # Bumped on every notify_update
+        self._streams = {}  # user_id -> open event streams in this process
+
+    def is_available(self) -> bool:
+        return self.generator.is_available()
+
+    def enqueue(self, user_id: int, source_material: str, generation_type: str, subject: Optional[str] = None,
+                max_cards: int = 10, focus_areas: Optional[List[str]] = None, folder_id: Optional[int] = None,
+                images: Optional[List[Union[bytes, SpooledUpload]]] = None,
+                pdf_content: Optional[Union[bytes, SpooledUpload]] = None, page_range: Optional[str] = None) -> dict:
+        """Record a pending generation and queue it; requires an app context
+
+        The queue takes ownership of the uploads: they are detached from the caller's
+        handles, so the spooled files outlive the request that uploaded them, and
+        closed when the job ends (or straight away if it is rejected). Returns
+        {'success': True, 'generation': ContentGeneration} or, when the queue is full,
+        {'success': False, 'error': ..., 'retry_after': seconds}.
+        """
+        images = [as_upload(image).detach() for image in images or []]
+        pdf_content = as_upload(pdf_content).detach() if pdf_content is not None else None
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                GENERATION_JOBS.inc(result='rejected')
+                _close_uploads(pdf_content, images)
+                return {
+                    'success': False,
+                    'error': 'Too many content generations in progress. Please try again shortly.',
+                    'retry_after': Config.GENERATION_RETRY_AFTER_SECONDS
+                }
+            self._pending += 1
+
+        try:
+            generation = ContentGeneration(
+                user_id=user_id,
+                source_material=source_material or "File-based generation",
+                generation_type=generation_type,
+                subject=subject,
+                max_cards=max_cards,
+                focus_areas=','.join(focus_areas) if focus_areas else None,
+                generation_status='pending'
+            )
+            db.session.add(generation)
+            db.session.commit()
+
+            self._ensure_executor().submit(
+                self._run_job, generation.id, source_material, focus_areas or [], folder_id,
+                images, pdf_content, page_range
+            )
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            _close_uploads(pdf_content, images)
+            raise
+
+        return {'success': True, 'generation': generation}
+
+    def notify_update(self):
+        """Wake stream listeners after cards were saved or a generation finished"""
+        with self._updates:
+            self._version += 1
+            self._updates.notify_all()
+
+    def update_version(self) -> int:
+        """Take before reading the database, then pass to wait_for_update so no update is missed"""
+        return self._version
+
+    def wait_for_update(self, version: int, timeout: float) -> bool:
+        """Block until a job in this process saves cards or finishes after `version`, or timeout passes
+
+        Listeners re-read the database either way, so jobs running in other processes
+        are picked up at the timeout.
+        """
+        with self._updates:
+            return self._updates.wait_for(lambda: self._version != version, timeout)
+
+    def open_stream(self, user_id: int) -> dict:
+        """Reserve one of the event-stream slots; each open stream holds a server thread
+
+        Returns {'success': True} or, over the per-user or per-process cap,
+        {'success': False, 'error': ..., 'retry_after': seconds}. Every successful
+        call must be paired with close_stream().
+        """
+        with self._lock:
+            open_streams = self._streams.get(user_id, 0)
+            if open_streams >= Config.GENERATION_STREAM_MAX_PER_USER:
+                error = 'Too many generation streams open. Close another tab or poll the generation instead.'
+            elif sum(self._streams.values()) >= Config.GENERATION_STREAM_MAX_STREAMS:
+                error = 'Too many generation streams open. Please poll the generation instead.'
+            else:
+                self._streams[user_id] = open_streams + 1
+                return {'success': True}
+        return {'success': False, 'error': error, 'retry_after': Config.GENERATION_RETRY_AFTER_SECONDS}
+
+    def close_stream(self, user_id: int):
+        with self._lock:
+            remaining = self._streams.get(user_id, 0) - 1
+            if remaining > 0:
+                self._streams[user_id] = remaining
+            else:
+                self._streams.pop(user_id, None)
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        """Start the pool with the current app, failing jobs an earlier process left unfinished"""
+        if self._executor is not None:
+            return self._executor
+
+        from flask import current_app
+
+        with self._lock:
+            if self._executor is None:
+                self._app = current_app._get_current_object()
+                self.fail_abandoned()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='content-generation')
+        return self._executor
+
+    def fail_abandoned(self) -> int:
+        """Mark generations still pending/processing from before this process started as failed"""
+        cutoff = datetime.utcnow() - timedelta(seconds=Config.GENERATION_ABANDONED_SECONDS)
+        count = ContentGeneration.query.filter(
+            ContentGeneration.generation_status.in_(['pending', 'processing']),
+            ContentGeneration.created_at < cutoff
+        ).update({
+            'generation_status': 'failed',
+            'error_message': 'Generation was interrupted. Please try again.',
+            'completed_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        return count
+
+    def _run_job(self, generation_id, source_material, focus_areas, folder_id, images, pdf_content, page_range):
+        try:
+            with self._app.app_context():
+                self.process(generation_id, source_material, focus_areas, folder_id, images, pdf_content, page_range)
+        except Exception as e:
+            print(f"Content generation job {generation_id} crashed: {e}")
+        finally:
+            _close_uploads(pdf_content, images)
+            with self._lock:
+                self._pending -= 1
+
+    def process(self, generation_id: int, source_material: str, focus_areas: List[str],
+                folder_id: Optional[int], images: List[SpooledUpload], pdf_content: Optional[SpooledUpload],
+                page_range: Optional[str] = None) -> bool:
+        """Generate and save the cards for one generation; requires an app context
+
+        Cards are saved in batches as the reply streams in (see CardBatcher), so
+        clients following the generation see them before the job completes.
+        """
+        generation = db.session.get(ContentGeneration, generation_id)
+        if generation is None or generation.generation_status != 'pending':
+            return False
+
+        # Copied out so the LLM call below does not reload the row and hold a pooled connection
+        user_id, generation_type = generation.user_id, generation.generation_type
+        subject, max_cards = generation.subject, generation.max_cards
+        generation.generation_status = 'processing'
+        db.session.commit()
+        started = datetime.utcnow()
+        from flask import current_app
+
+        batcher = None
+        try:
+            batcher = CardBatcher(
+                current_app._get_current_object(), generation_id, user_id, folder_id, subject,
+                self.notify_update, skip_duplicates=Config.DEDUPE_GENERATED_CARDS
+            )
+
+            # Identical inputs and settings reuse the parsed items of an earlier generation
+            cache_key = generation_cache.key_for(
+                generation_type, source_material, subject, max_cards, focus_areas,
+                pdf_content, images, self.generator.MODEL, page_range
+            )
+            cached = generation_cache.get(cache_key)
+            timer = time.perf_counter()
+            if cached is not None:
+                generated_items = cached['items']
+            else:
+                generate = {
+                    'flashcards': self.generator.generate_flashcards,
+                    'information': self.generator.generate_information_pieces,
+                    'mixed': self.generator.generate_mixed_content
+                }[generation_type]
+                generated_items = generate(
+                    source_material, subject, max_cards, focus_areas, images, pdf_content, page_range,
+                    on_item=batcher.add
+                )
+
+            # An insert that failed inside the generator's on_item callback fails the job;
+            # later failures are raised by add() and flush() themselves, on either path
+            if batcher.error is not None:
+                raise batcher.error
+            if not generated_items:
+                raise Exception("No content was generated. Please check your input and try again.")
+            generated_items = generated_items[:max_cards]
+            if batcher.added == 0:
+                # Cached items, or a generator that did not stream, are saved in one go
+                for item in generated_items:
+                    batcher.add(item)
+            batcher.flush()
+            generation_ms = (time.perf_counter() - timer) * 1000
+            if cached is None:
+                generation_cache.put(cache_key, generated_items, generation_ms)
+
+            generation.cards_generated = batcher.count
+            generation.duplicates_skipped = batcher.skipped
+            generation.cache_hit = cached is not None
+            generation.generation_ms = generation_ms
+            generation.latency_saved_ms = cached['latency_ms'] if cached is not None else None
+            generation.generation_status = 'completed'
+            generation.completed_at = datetime.utcnow()
+            db.session.commit()
+            GENERATION_JOBS.inc(result='completed')
+            self.notify_update()
+            return True
+
+        except Exception as e:
+            print(f"AI Generation Error: {str(e)}")
+            db.session.rollback()
+
+            # Cards already streamed to the user are kept
+            generation = db.session.get(ContentGeneration, generation_id)
+            generation.generation_status = 'failed'
+            generation.error_message = friendly_error(str(e))
+            generation.cards_generated = batcher.count if batcher is not None else 0
+            generation.completed_at = datetime.utcnow()
+            db.session.commit()
+            GENERATION_JOBS.inc(result='failed')
+            self.notify_update()
+            return False
+
+        finally:
+            GENERATION_SECONDS.observe((datetime.utcnow() - started).total_seconds())
+
+    def __len__(self):
+        return self._pending
+
+    def shutdown(self, wait: bool = True):
+        """Stop taking jobs and optionally wait for running ones"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+# Singleton instance
+generation_jobs = GenerationJobQueue()
+
+metrics.gauge('content_generation_jobs_pending', 'Queued or running generation jobs', callback=lambda: len(generation_jobs))
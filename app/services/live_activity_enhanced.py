@@ -2,16 +2,20 @@
 Enhanced Live Activity Service for Active Recall
 Displays study content when phone is unlocked
 """
-import os
-import jwt
 import time
-import httpx
-import asyncio
-import random
-from datetime import datetime, timedelta
+import threading
 from typing import Dict, Any, Optional, List
+from flask import current_app
 from app.models import User, Card
 from app.config import Config
+from app.services.apns import APNsResponse, apns_credentials
+from app.services.outbox_worker import OutboxWorker
+from app.services.push_dispatcher import PushJob, push_dispatcher
+from app.services.push_payloads import push_payloads
+from app.services.spaced_repetition import SpacedRepetitionService
+from app.services.unlock_ready_queue import unlock_ready_queue
+from app.services.unlock_debounce import unlock_debouncer
+from app.utils.async_runner import background_loop, run_async
 from app import db
 
 class LiveActivityService:
@@ -21,25 +25,10 @@ class LiveActivityService:
         self.config = Config()
     
     def _create_apns_token(self):
-        """Generate JWT token for APNs authentication"""
-        if not os.path.exists(self.config.APNS_KEY_PATH):
-            raise Exception("APNs key file not found")
-            
-        with open(self.config.APNS_KEY_PATH, "r") as f:
-            secret = f.read()
-
-        token = jwt.encode(
-            {
-                "iss": self.config.APNS_TEAM_ID,
-                "iat": time.time(),
-            },
-            secret,
-            algorithm="ES256",
-            headers={"alg": "ES256", "kid": self.config.APNS_AUTH_KEY_ID},
-        )
-        return token
+        """Get the shared, cached JWT token for APNs authentication"""
+        return apns_credentials.get_token()
     
-    async def start_live_activity(self, user_id: int) -> Dict[str, Any]:
+    def start_live_activity(self, user_id: int) -> Dict[str, Any]:
         """Start a Live Activity for a user with initial study content"""
         user = User.query.get(user_id)
         if not user or not user.live_activity_enabled:
@@ -55,15 +44,14 @@ class LiveActivityService:
         
         try:
             # Send to APNs
-            response_code = await self._send_live_activity_update(
+            response_code = self._send_live_activity_update(
                 user.active_activity_token or user.device_token,
                 payload
             )
             
             if response_code == 200:
-                # Update user's last activity time
-                user.last_notification_time = datetime.utcnow()
-                db.session.commit()
+                # Throttle unlock updates from now on; the time is written back in the next batch
+                unlock_debouncer.touch(user.id)
                 
                 return {
                     "success": True,
@@ -77,49 +65,41 @@ class LiveActivityService:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    async def update_live_activity_on_unlock(self, user_id: int) -> Dict[str, Any]:
+    def update_live_activity_on_unlock(self, user_id: int) -> Dict[str, Any]:
         """Update Live Activity with new study content when phone is unlocked"""
+        # Claim the update slot before any query; unlocks during the push are throttled too
+        if unlock_debouncer.acquire(user_id):
+            return {"success": False, "error": "Too soon for content update"}
+        
         user = User.query.get(user_id)
         if not user or not user.live_activity_enabled:
+            unlock_debouncer.release(user_id)
             return {"success": False, "error": "User not found or Live Activities disabled"}
         
-        # Check if enough time has passed since last update
-        if not self._should_update_content(user):
-            return {"success": False, "error": "Too soon for content update"}
-        
-        # Get a new random study card
-        study_card = self._get_random_study_card(user)
-        if not study_card:
+        # Take a card prepared in the background, or pick one now on a miss
+        prepared = unlock_ready_queue.pop(user.id) or unlock_ready_queue.prepare(user)
+        if not prepared:
+            unlock_debouncer.release(user_id)
             return {"success": False, "error": "No study content available"}
         
-        # Create update payload
-        payload = self._create_live_activity_payload(study_card, "update")
+        unlock_debouncer.record_update(user.id)
         
-        try:
-            response_code = await self._send_live_activity_update(
-                user.active_activity_token or user.device_token,
-                payload
-            )
-            
-            if response_code == 200:
-                # Update user's last activity time
-                user.last_notification_time = datetime.utcnow()
-                db.session.commit()
-                
-                return {
-                    "success": True,
-                    "card_id": study_card.id,
-                    "content_type": study_card.content_type,
-                    "content": study_card.front,
-                    "message": "Live Activity updated with new study content"
-                }
-            else:
-                return {"success": False, "error": f"APNs request failed: {response_code}"}
-                
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        # Respond without waiting for APNs; only the send runs on the shared event loop
+        job = PushJob(user.active_activity_token or user.device_token, prepared.payload(),
+                      push_type="liveactivity", user_id=user.id)
+        app = current_app._get_current_object()
+        future = background_loop.submit(push_dispatcher.dispatch([job]))
+        future.add_done_callback(lambda _: self._discard_dead_token_later(app, job))
+        
+        return {
+            "success": True,
+            "card_id": prepared.card_id,
+            "content_type": prepared.content_type,
+            "content": prepared.content,
+            "message": "Live Activity update sent with new study content"
+        }
     
-    async def end_live_activity(self, user_id: int) -> Dict[str, Any]:
+    def end_live_activity(self, user_id: int) -> Dict[str, Any]:
         """End the Live Activity for a user"""
         user = User.query.get(user_id)
         if not user:
@@ -134,7 +114,7 @@ class LiveActivityService:
         }
         
         try:
-            response_code = await self._send_live_activity_update(
+            response_code = self._send_live_activity_update(
                 user.active_activity_token or user.device_token,
                 payload
             )
@@ -149,110 +129,58 @@ class LiveActivityService:
     
     def _get_random_study_card(self, user: User) -> Optional[Card]:
         """Get a random study card based on user's notification preferences"""
-        # Base query for cards
-        query = Card.query.filter(Card.user_id == user.id)
-        
-        # Filter by selected folders if specified
-        if user.recall_folders:
-            folder_ids = [int(fid.strip()) for fid in user.recall_folders.split(',') if fid.strip().isdigit()]
-            if folder_ids:
-                query = query.filter(Card.folder_id.in_(folder_ids))
-        
-        # Get all eligible cards
-        cards = query.all()
-        
-        if not cards:
-            return None
-        
-        # Prioritize due cards, but include others for variety
-        due_cards = [card for card in cards if card.is_due_for_review()]
-        
-        if due_cards and random.random() < 0.7:  # 70% chance to show due cards
-            return random.choice(due_cards)
-        else:
-            return random.choice(cards)
+        # Prioritize due cards (70% of the time), but include others for variety
+        return SpacedRepetitionService.random_study_card(user, due_probability=0.7)
     
-    def _should_update_content(self, user: User) -> bool:
-        """Check if enough time has passed to update Live Activity content"""
-        if not user.last_notification_time:
-            return True
-        
-        # Minimum 5 minutes between updates to avoid spam
-        min_interval = timedelta(minutes=5)
-        time_since_last = datetime.utcnow() - user.last_notification_time
-        
-        return time_since_last >= min_interval
-    
-    def _create_live_activity_payload(self, card: Card, event_type: str = "update") -> Dict[str, Any]:
+    def _create_live_activity_payload(self, card: Card, event_type: str = "update") -> bytes:
         """Create Live Activity payload with study content"""
-        
-        # Format content based on card type
-        if card.content_type == 'flashcard':
-            content_state = {
-                "cardId": card.id,
-                "cardType": "flashcard",
-                "question": card.front,
-                "answer": card.back,
-                "subject": card.subject or "Study",
-                "showAnswer": False,  # Initially hide answer
-                "isOverdue": card.is_due_for_review(),
-                "folderName": card.folder.name if card.folder else None,
-                "lastUpdated": int(time.time())
-            }
-        else:  # information piece
-            content_state = {
-                "cardId": card.id,
-                "cardType": "information",
-                "information": card.front,
-                "subject": card.subject or "Knowledge",
-                "showAnswer": True,  # Always show for info pieces
-                "isOverdue": card.is_due_for_review(),
-                "folderName": card.folder.name if card.folder else None,
-                "lastUpdated": int(time.time())
-            }
-        
-        payload = {
-            "aps": {
-                "timestamp": int(time.time()),
-                "event": event_type,
-                "content-state": content_state,
-                "alert": {
-                    "title": "🧠 Active Recall",
-                    "body": f"New {card.content_type}: {card.front[:50]}..." if len(card.front) > 50 else card.front
-                } if event_type == "start" else None
-            }
-        }
-        
-        return payload
+        return push_payloads.study_card_activity(card, event_type)
     
-    async def _send_live_activity_update(self, activity_token: str, payload: Dict[str, Any]) -> int:
-        """Send Live Activity update to APNs"""
+    def _send_live_activity_update(self, activity_token: str, payload: bytes) -> int:
+        """Send a Live Activity update and wait for the APNs status
+        
+        Only the send runs on the shared event loop; the database work before and
+        after it stays in the calling thread. The request thread waits for the
+        result, so throttled sends are not retried with backoff here.
+        """
+        job = PushJob(activity_token, payload, push_type="liveactivity")
         try:
-            token = self._create_apns_token()
-            url = f"https://api.development.push.apple.com/3/device/{activity_token}"
-            
-            headers = {
-                "apns-topic": f"{self.config.BUNDLE_ID}.push-type.liveactivity",
-                "authorization": f"bearer {token}",
-                "apns-push-type": "liveactivity",
-                "apns-priority": "10"
-            }
-
-            async with httpx.AsyncClient(http2=True) as client:
-                response = await client.post(url, headers=headers, json=payload)
-                return response.status_code
-                
+            status_code = run_async(push_dispatcher.dispatch([job], Config.PUSH_REQUEST_RETRY_ATTEMPTS))[0]
         except Exception as e:
             print(f"Failed to send Live Activity update: {e}")
             return 500
+        
+        if job.outcome == APNsResponse.DEAD_TOKEN:
+            # The activity ended or the token was revoked; stop pushing to it
+            self._discard_dead_tokens([job])
+        return status_code
+    
+    @staticmethod
+    def _discard_dead_tokens(jobs: List[PushJob]):
+        OutboxWorker.discard_dead_tokens(push_dispatcher.dead_tokens(jobs))
+        db.session.commit()
+    
+    def _discard_dead_token_later(self, app, job: PushJob):
+        """Done callback of a background send: runs on the loop thread, so the cleanup gets its own thread"""
+        if job.outcome != APNsResponse.DEAD_TOKEN:
+            return
+        
+        def discard():
+            with app.app_context():
+                try:
+                    self._discard_dead_tokens([job])
+                except Exception as e:
+                    print(f"Failed to clear dead Live Activity token: {e}")
+        
+        threading.Thread(target=discard, name='live-activity-dead-token', daemon=True).start()
     
     # Webhook endpoint for iOS to call when phone is unlocked
-    async def handle_unlock_webhook(self, user_id: int, device_info: Dict[str, Any] = None) -> Dict[str, Any]:
+    def handle_unlock_webhook(self, user_id: int, device_info: Dict[str, Any] = None) -> Dict[str, Any]:
         """Handle webhook from iOS when phone is unlocked"""
         print(f"Phone unlock detected for user {user_id}")
         
         # Update Live Activity with new content
-        result = await self.update_live_activity_on_unlock(user_id)
+        result = self.update_live_activity_on_unlock(user_id)
         
         # Log the interaction for analytics
         if result.get("success"):
@@ -266,11 +194,12 @@ class LiveActivityService:
         if not user:
             return {"error": "User not found"}
         
+        last_update = unlock_debouncer.last_update(user_id) or user.last_notification_time
         return {
             "user_id": user_id,
             "live_activity_enabled": user.live_activity_enabled,
             "has_activity_token": bool(user.active_activity_token),
-            "last_update": user.last_notification_time.isoformat() if user.last_notification_time else None,
+            "last_update": last_update.isoformat() if last_update else None,
             "recall_folders": user.recall_folders,
             "available_cards": Card.query.filter(Card.user_id == user_id).count()
         }
@@ -2,12 +2,12 @@
 iOS Live Activity Service for Active Recall
 Manages Live Activities on iOS home screen and lock screen
 """
-import json
-import asyncio
 from datetime import datetime, timedelta
 from app.services.notification_service import NotificationService
+from app.services.push_payloads import push_payloads
 from app.models import User, Card
 from app.services.spaced_repetition import SpacedRepetitionService
+from app.utils.async_runner import run_async
 from app import db
 
 class LiveActivityService:
@@ -16,48 +16,43 @@ class LiveActivityService:
     def __init__(self):
         self.notification_service = NotificationService()
     
-    async def start_study_session_activity(self, user_id: int, session_cards: list):
+    def start_study_session_activity(self, user_id: int, session_cards: list):
         """Start a Live Activity for a study session"""
         user = User.query.get(user_id)
         if not user or not user.active_activity_token:
             return {"success": False, "error": "No Live Activity token registered"}
         
         # Prepare Live Activity payload
-        payload = {
-            "aps": {
-                "timestamp": int(datetime.utcnow().timestamp()),
-                "event": "start",
-                "content-state": {
-                    "sessionId": f"session_{user_id}_{int(datetime.utcnow().timestamp())}",
-                    "totalCards": len(session_cards),
-                    "currentCard": 0,
-                    "cardsReviewed": 0,
-                    "sessionStartTime": datetime.utcnow().isoformat(),
-                    "currentCardContent": session_cards[0]['front'] if session_cards else "No cards available",
-                    "currentCardType": session_cards[0]['content_type'] if session_cards else "none",
-                    "userName": user.get_full_name()
-                }
-            }
+        content_state = {
+            "sessionId": f"session_{user_id}_{int(datetime.utcnow().timestamp())}",
+            "totalCards": len(session_cards),
+            "currentCard": 0,
+            "cardsReviewed": 0,
+            "sessionStartTime": datetime.utcnow().isoformat(),
+            "currentCardContent": session_cards[0]['front'] if session_cards else "No cards available",
+            "currentCardType": session_cards[0]['content_type'] if session_cards else "none",
+            "userName": user.get_full_name()
         }
+        payload = push_payloads.live_activity("start", content_state)
         
         # Send Live Activity start
-        status_code = await self.notification_service._send_push_notification(
+        status_code = run_async(self.notification_service._send_push_notification(
             device_token=user.device_token,
             payload=payload,
             push_type="liveactivity",
             activity_token=user.active_activity_token
-        )
+        ))
         
         if status_code == 200:
             return {
                 "success": True,
                 "message": "Study session Live Activity started",
-                "session_id": payload["aps"]["content-state"]["sessionId"]
+                "session_id": content_state["sessionId"]
             }
         else:
             return {"success": False, "error": f"Failed to start Live Activity: {status_code}"}
     
-    async def update_study_progress(self, user_id: int, session_id: str, current_card_index: int, 
+    def update_study_progress(self, user_id: int, session_id: str, current_card_index: int, 
                                   cards_reviewed: int, total_cards: int, current_card: dict = None):
         """Update Live Activity with study progress"""
         user = User.query.get(user_id)
@@ -67,65 +62,55 @@ class LiveActivityService:
         # Calculate progress
         progress = (cards_reviewed / total_cards) if total_cards > 0 else 0
         
-        payload = {
-            "aps": {
-                "timestamp": int(datetime.utcnow().timestamp()),
-                "event": "update",
-                "content-state": {
-                    "sessionId": session_id,
-                    "totalCards": total_cards,
-                    "currentCard": current_card_index,
-                    "cardsReviewed": cards_reviewed,
-                    "progress": round(progress * 100, 1),
-                    "currentCardContent": current_card['front'] if current_card else "Session complete",
-                    "currentCardType": current_card['content_type'] if current_card else "complete",
-                    "userName": user.get_full_name()
-                }
-            }
+        content_state = {
+            "sessionId": session_id,
+            "totalCards": total_cards,
+            "currentCard": current_card_index,
+            "cardsReviewed": cards_reviewed,
+            "progress": round(progress * 100, 1),
+            "currentCardContent": current_card['front'] if current_card else "Session complete",
+            "currentCardType": current_card['content_type'] if current_card else "complete",
+            "userName": user.get_full_name()
         }
+        payload = push_payloads.live_activity("update", content_state)
         
-        status_code = await self.notification_service._send_push_notification(
+        status_code = run_async(self.notification_service._send_push_notification(
             device_token=user.device_token,
             payload=payload,
             push_type="liveactivity",
             activity_token=user.active_activity_token
-        )
+        ))
         
         return {"success": status_code == 200, "status_code": status_code}
     
-    async def end_study_session_activity(self, user_id: int, session_id: str, 
+    def end_study_session_activity(self, user_id: int, session_id: str, 
                                        cards_reviewed: int, session_duration: int):
         """End a Live Activity study session"""
         user = User.query.get(user_id)
         if not user or not user.active_activity_token:
             return {"success": False, "error": "No Live Activity token registered"}
         
-        payload = {
-            "aps": {
-                "timestamp": int(datetime.utcnow().timestamp()),
-                "event": "end",
-                "dismissal-date": int((datetime.utcnow() + timedelta(seconds=30)).timestamp()),
-                "content-state": {
-                    "sessionId": session_id,
-                    "cardsReviewed": cards_reviewed,
-                    "sessionDuration": session_duration,
-                    "completionMessage": f"Great job! You reviewed {cards_reviewed} cards.",
-                    "userName": user.get_full_name(),
-                    "status": "completed"
-                }
-            }
+        content_state = {
+            "sessionId": session_id,
+            "cardsReviewed": cards_reviewed,
+            "sessionDuration": session_duration,
+            "completionMessage": f"Great job! You reviewed {cards_reviewed} cards.",
+            "userName": user.get_full_name(),
+            "status": "completed"
         }
+        dismissal_date = int((datetime.utcnow() + timedelta(seconds=30)).timestamp())
+        payload = push_payloads.live_activity("end", content_state, aps_fields={"dismissal-date": dismissal_date})
         
-        status_code = await self.notification_service._send_push_notification(
+        status_code = run_async(self.notification_service._send_push_notification(
             device_token=user.device_token,
             payload=payload,
             push_type="liveactivity",
             activity_token=user.active_activity_token
-        )
+        ))
         
         return {"success": status_code == 200, "status_code": status_code}
     
-    async def send_recall_reminder_activity(self, user_id: int, due_cards_count: int, 
+    def send_recall_reminder_activity(self, user_id: int, due_cards_count: int, 
                                           next_card: dict = None):
         """Send a Live Activity for recall reminders"""
         user = User.query.get(user_id)
@@ -136,32 +121,27 @@ class LiveActivityService:
         recall_frequency = getattr(user, 'recall_frequency_minutes', 30)
         next_recall_time = datetime.utcnow() + timedelta(minutes=recall_frequency)
         
-        payload = {
-            "aps": {
-                "timestamp": int(datetime.utcnow().timestamp()),
-                "event": "start",
-                "content-state": {
-                    "activityType": "recall_reminder",
-                    "dueCardsCount": due_cards_count,
-                    "nextRecallTime": next_recall_time.isoformat(),
-                    "previewCard": next_card['front'] if next_card else "Ready to study?",
-                    "previewCardType": next_card['content_type'] if next_card else "flashcard",
-                    "userName": user.get_full_name(),
-                    "reminderMessage": f"{due_cards_count} cards ready for review"
-                }
-            }
+        content_state = {
+            "activityType": "recall_reminder",
+            "dueCardsCount": due_cards_count,
+            "nextRecallTime": next_recall_time.isoformat(),
+            "previewCard": next_card['front'] if next_card else "Ready to study?",
+            "previewCardType": next_card['content_type'] if next_card else "flashcard",
+            "userName": user.get_full_name(),
+            "reminderMessage": f"{due_cards_count} cards ready for review"
         }
+        payload = push_payloads.live_activity("start", content_state)
         
-        status_code = await self.notification_service._send_push_notification(
+        status_code = run_async(self.notification_service._send_push_notification(
             device_token=user.device_token,
             payload=payload,
             push_type="liveactivity",
             activity_token=user.active_activity_token
-        )
+        ))
         
         return {"success": status_code == 200, "status_code": status_code}
     
-    async def send_daily_progress_activity(self, user_id: int):
+    def send_daily_progress_activity(self, user_id: int):
         """Send daily progress Live Activity"""
         user = User.query.get(user_id)
         if not user or not user.active_activity_token:
@@ -173,28 +153,23 @@ class LiveActivityService:
         # Calculate streak (simplified - you might want to implement proper streak tracking)
         streak_days = getattr(user, 'current_streak', 0)
         
-        payload = {
-            "aps": {
-                "timestamp": int(datetime.utcnow().timestamp()),
-                "event": "start",
-                "content-state": {
-                    "activityType": "daily_progress",
-                    "totalCards": stats['total_cards'],
-                    "dueCards": stats['due_cards'],
-                    "matureCards": stats['mature_cards'],
-                    "streakDays": streak_days,
-                    "userName": user.get_full_name(),
-                    "progressMessage": f"Keep it up! {stats['due_cards']} cards due today."
-                }
-            }
+        content_state = {
+            "activityType": "daily_progress",
+            "totalCards": stats['total_cards'],
+            "dueCards": stats['due_cards'],
+            "matureCards": stats['mature_cards'],
+            "streakDays": streak_days,
+            "userName": user.get_full_name(),
+            "progressMessage": f"Keep it up! {stats['due_cards']} cards due today."
         }
+        payload = push_payloads.live_activity("start", content_state)
         
-        status_code = await self.notification_service._send_push_notification(
+        status_code = run_async(self.notification_service._send_push_notification(
             device_token=user.device_token,
             payload=payload,
             push_type="liveactivity",
             activity_token=user.active_activity_token
-        )
+        ))
         
         return {"success": status_code == 200, "status_code": status_code}
     
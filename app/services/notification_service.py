@@ -1,36 +1,64 @@
 """
 Notification Service for push notifications and scheduling
 """
-import os
-import jwt
 import time
-import httpx
 import schedule
 import threading
-from datetime import datetime, time as dt_time
-from app.models import User
+from sqlalchemy import and_, or_, func
+from datetime import datetime, timedelta, time as dt_time
+from app.models import User, NotificationOutbox, DailyRecallCount
 from app.services.spaced_repetition import SpacedRepetitionService
+from app.services.recall_scheduler import recall_scheduler
 from app.config import Config
+from app.services.apns import apns_credentials, apns_client
+from app.services.push_dispatcher import PushJob
+from app.services.push_payloads import push_payloads
+from app.services.outbox_worker import OutboxWorker
+from app.utils.metrics import metrics
+
+SCHEDULER_TICK_SECONDS = metrics.histogram(
+    'recall_scheduler_tick_duration_seconds', 'Time spent selecting and queueing due recalls per tick'
+)
+SCHEDULER_USERS_DUE = metrics.counter('recall_scheduler_users_due_total', 'Users popped from the recall heap')
+SCHEDULER_USERS_ELIGIBLE = metrics.counter(
+    'recall_scheduler_users_eligible_total', 'Due users passing the eligibility and daily cap filters'
+)
+SCHEDULER_RECALLS_QUEUED = metrics.counter(
+    'recall_scheduler_pushes_queued_total', 'Recall pushes written to the outbox', ['push_type']
+)
+metrics.gauge('recall_scheduler_heap_size', 'Users with a scheduled recall slot', callback=lambda: len(recall_scheduler))
 
 class NotificationService:
     """Service for managing push notifications and smart scheduling"""
     
+    # Due user ids processed per query
+    DUE_USER_BATCH_SIZE = 500
+    
     def __init__(self):
         self.config = Config()
         self.scheduler_running = False
+        self.app = None
+        self.outbox_worker = None
     
-    def start_scheduler(self):
-        """Start the notification scheduler in a background thread"""
+    def start_scheduler(self, app=None):
+        """Start the notification scheduler in a background thread
+        
+        The Flask app is needed so each tick can run inside an application context.
+        """
         if self.scheduler_running:
             return
+        
+        self.app = app
             
         def run_scheduler():
             while self.scheduler_running:
                 schedule.run_pending()
-                time.sleep(60)  # Check every minute
+                time.sleep(self.config.RECALL_SCHEDULER_TICK_SECONDS)
         
-        # Schedule notifications check every 5 minutes (will respect individual user frequencies)
-        schedule.every(5).minutes.do(self._send_scheduled_notifications)
+        # Each tick only pops users whose next_recall_at slot has arrived
+        schedule.every(self.config.RECALL_SCHEDULER_TICK_SECONDS).seconds.do(self._run_in_app_context, self._send_scheduled_notifications)
+        schedule.every(self.config.RECALL_SCHEDULER_RESYNC_MINUTES).minutes.do(self._run_in_app_context, recall_scheduler.load)
+        schedule.every(6).hours.do(self._run_in_app_context, self._expire_daily_counts)
         
         self.scheduler_running = True
         scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
@@ -42,73 +70,192 @@ class NotificationService:
         self.scheduler_running = False
         schedule.clear()
     
+    def _run_in_app_context(self, job):
+        """Run a scheduled job inside the Flask application context"""
+        if self.app is None:
+            return job()
+        with self.app.app_context():
+            return job()
+    
     def _send_scheduled_notifications(self):
-        """Send notifications to users with due cards"""
+        """Send notifications to users whose recall slot has arrived"""
+        from app import db
+        
+        started = time.perf_counter()
         try:
-            # Get users with recall notifications enabled
-            users = User.query.filter(
-                User.device_token.isnot(None),
-                User.recall_enabled == True
-            ).all()
+            if not recall_scheduler.loaded:
+                recall_scheduler.load()
+            
+            now = datetime.utcnow()
+            due_user_ids = recall_scheduler.pop_due(now)
+            SCHEDULER_USERS_DUE.inc(len(due_user_ids))
+            
+            # Keep IN lists under SQLite's bound-parameter limit
+            for offset in range(0, len(due_user_ids), self.DUE_USER_BATCH_SIZE):
+                self._process_due_users(due_user_ids[offset:offset + self.DUE_USER_BATCH_SIZE], now)
             
-            for user in users:
-                if self._should_send_notification(user) and self._is_time_for_notification(user):
-                    # Get cards from selected folders or all folders
-                    due_cards = self._get_recall_cards(user)
-                    if due_cards:
-                        # Pick a random card to show in notification
-                        import random
-                        selected_card = random.choice(due_cards)
-                        self._send_card_notification(user, selected_card)
-                        self._update_last_notification_time(user)
+            # Outbox rows and rescheduled slots commit together
+            db.session.commit()
                         
         except Exception as e:
+            db.session.rollback()
             print(f"Error in scheduled notifications: {e}")
-    
-    def _get_recall_cards(self, user):
-        """Get cards for recall based on user's folder selection"""
-        from app.models import Card
+        SCHEDULER_TICK_SECONDS.observe(time.perf_counter() - started)
         
-        # Base query for due cards
-        query = Card.query.filter(
-            Card.user_id == user.id,
-            Card.next_review <= datetime.utcnow()
-        )
-        
-        # Filter by selected folders if specified
-        if user.recall_folders:
-            folder_ids = [int(fid.strip()) for fid in user.recall_folders.split(',') if fid.strip().isdigit()]
-            if folder_ids:
-                query = query.filter(Card.folder_id.in_(folder_ids))
-        
-        return query.limit(10).all()  # Limit to prevent too many options
+        # Single-process runs deliver from the outbox here; otherwise run_outbox_worker.py does
+        if self.config.OUTBOX_INLINE_WORKER:
+            self._drain_outbox()
+    
+    def _expire_daily_counts(self):
+        """Drop per-day recall counters past the retention period"""
+        try:
+            DailyRecallCount.expire(self.config.DAILY_RECALL_COUNT_RETENTION_DAYS)
+        except Exception as e:
+            print(f"Error expiring daily recall counts: {e}")
     
-    def _is_time_for_notification(self, user):
-        """Check if enough time has passed since last notification"""
-        from datetime import datetime, timedelta
+    def _drain_outbox(self):
+        """Send everything due in the outbox from this process"""
+        try:
+            if self.outbox_worker is None:
+                self.outbox_worker = OutboxWorker(worker_id='inline')
+            self.outbox_worker.recover_stale()
+            stats = self.outbox_worker.drain()
+            if stats['claimed']:
+                print(f"Sent {stats['sent']}/{stats['claimed']} outbox pushes, wasted {stats['wasted']} "
+                      f"({stats['dead_tokens']} dead tokens cleared, {stats['retried']} retrying, {stats['failed']} failed)")
+        except Exception as e:
+            print(f"Error draining notification outbox: {e}")
+    
+    def _process_due_users(self, user_ids, now):
+        """Notify eligible users from one batch of due ids and reschedule the rest"""
+        # Only users passing every recall rule and under their daily cap leave the database
+        today = datetime.now().date()
+        users = User.query.outerjoin(
+            DailyRecallCount,
+            and_(DailyRecallCount.user_id == User.id, DailyRecallCount.day == today)
+        ).filter(
+            User.id.in_(user_ids),
+            self.recall_eligibility_filter(),
+            self.daily_cap_filter()
+        ).all()
+        SCHEDULER_USERS_ELIGIBLE.inc(len(users))
         
-        # If no last notification time recorded, it's time to send
-        if not hasattr(user, 'last_notification_time') or not user.last_notification_time:
-            return True
+        outbox_rows = []
+        for user in users:
+            # Another process moved this user's slot; follow the persisted value
+            if user.next_recall_at and user.next_recall_at > now:
+                recall_scheduler.schedule(user.id, user.next_recall_at)
+                continue
+            
+            # Pick a random due card from selected folders or all folders
+            selected_card = SpacedRepetitionService.random_due_card(user)
+            if selected_card:
+                outbox_rows.extend(self._outbox_rows(user, self._build_card_notification(user, selected_card), now))
+                user.last_notification_time = now
+                recall_scheduler.reschedule_user(user, after=now, commit=False)
+            else:
+                self._defer_user(user, now)
         
-        # Check if frequency interval has passed
-        frequency_minutes = user.recall_frequency_minutes or 30
-        time_since_last = datetime.utcnow() - user.last_notification_time
+        # Queue the batch; outbox workers fan it out to APNs
+        if outbox_rows:
+            # Daily counts go up when APNs accepts the alert (OutboxWorker._finish), not here
+            queued = OutboxWorker.enqueue(outbox_rows)
+            for row in outbox_rows:
+                SCHEDULER_RECALLS_QUEUED.inc(push_type=row['push_type'])
+            print(f"Queued {queued} recall pushes")
         
-        return time_since_last >= timedelta(minutes=frequency_minutes)
+        # Due users filtered out by SQL (preferences changed since their slot was computed, or capped today)
+        ineligible_ids = set(user_ids) - {user.id for user in users}
+        if ineligible_ids:
+            for user in User.query.filter(User.id.in_(ineligible_ids)).all():
+                if user.next_recall_at and user.next_recall_at > now:
+                    recall_scheduler.schedule(user.id, user.next_recall_at)
+                elif self._is_capped(user, today):
+                    self._defer_user_until_tomorrow(user)
+                else:
+                    self._defer_user(user, now)
     
-    def _update_last_notification_time(self, user):
-        """Update the last notification time for user"""
-        from datetime import datetime
-        from app import db
+    @staticmethod
+    def _outbox_rows(user, jobs, now):
+        """Outbox rows for a user's recall pushes, keyed by the slot they were sent for"""
+        slot = user.next_recall_at or now
+        return [
+            NotificationOutbox.row_for(
+                user.id,
+                job.push_type,
+                job.device_token,
+                job.payload,
+                dedupe_key=f"recall:{user.id}:{job.push_type}:{slot:%Y%m%dT%H%M%S}"
+            )
+            for job in jobs
+        ]
+    
+    def _defer_user(self, user, now):
+        """Reschedule a due user that was not notified a full frequency interval from now"""
+        next_after = now + timedelta(minutes=user.recall_frequency_minutes or 30)
+        recall_scheduler.reschedule_user(user, after=next_after, commit=False)
+    
+    def _defer_user_until_tomorrow(self, user):
+        """Reschedule a user who reached max_daily_recalls to the next local day"""
+        recall_scheduler.reschedule_user(user, after=recall_scheduler.start_of_next_local_day(), commit=False)
+    
+    @staticmethod
+    def _daily_limit():
+        """A user's recall cap, falling back to the column default when unset"""
+        return func.coalesce(User.max_daily_recalls, User.max_daily_recalls.default.arg)
+    
+    @classmethod
+    def daily_cap_filter(cls):
+        """SQL predicate for users under their daily cap (requires the DailyRecallCount outer join)"""
+        return func.coalesce(DailyRecallCount.count, 0) < cls._daily_limit()
+    
+    @staticmethod
+    def _is_capped(user, today=None):
+        """Whether a user has already received max_daily_recalls today"""
+        limit = user.max_daily_recalls if user.max_daily_recalls is not None else User.max_daily_recalls.default.arg
+        return DailyRecallCount.count_for(user.id, today) >= limit
+    
+    @staticmethod
+    def recall_eligibility_filter(now=None):
+        """SQL predicate equivalent to _should_send_notification for users with a device token
         
-        user.last_notification_time = datetime.utcnow()
-        db.session.commit()
+        Uses the normalized recall schedule columns so the rules run inside the database.
+        `now` is server local time, like the Python checks, and both compare whole seconds.
+        """
+        now = now or datetime.now()
+        now_seconds = User.seconds_of_day(now)
+        day_bit = 1 << (now.isoweekday() - 1)
+        
+        return and_(
+            User.device_token.isnot(None),
+            User.recall_enabled == True,
+            User.recall_paused == False,
+            User.focus_mode == False,
+            User.recall_days_mask.op('&')(day_bit) != 0,
+            or_(
+                User.recall_start_seconds.is_(None),
+                User.recall_end_seconds.is_(None),
+                and_(User.recall_start_seconds <= now_seconds, User.recall_end_seconds >= now_seconds)
+            ),
+            or_(
+                User.sleep_start_seconds.is_(None),
+                User.sleep_end_seconds.is_(None),
+                # Same-day sleep window
+                and_(
+                    User.sleep_start_seconds <= User.sleep_end_seconds,
+                    or_(User.sleep_start_seconds > now_seconds, User.sleep_end_seconds < now_seconds)
+                ),
+                # Overnight sleep window
+                and_(
+                    User.sleep_start_seconds > User.sleep_end_seconds,
+                    User.sleep_start_seconds > now_seconds,
+                    User.sleep_end_seconds < now_seconds
+                )
+            )
+        )
     
     def _should_send_notification(self, user):
         """Check if we should send a notification to this user"""
-        from datetime import datetime
-        
         # Check if recalls are enabled
         if not user.recall_enabled:
             return False
@@ -121,22 +268,27 @@ class NotificationService:
         if user.focus_mode:
             return False
         
-        # Check time range
-        current_time = datetime.now().time()
-        if user.recall_start_time and user.recall_end_time:
-            if not (user.recall_start_time <= current_time <= user.recall_end_time):
+        # Check time range, in whole seconds of the day like recall_eligibility_filter
+        now = datetime.now()
+        current_seconds = User.seconds_of_day(now)
+        start_seconds = User.seconds_of_day(user.recall_start_time)
+        end_seconds = User.seconds_of_day(user.recall_end_time)
+        if start_seconds is not None and end_seconds is not None:
+            if not (start_seconds <= current_seconds <= end_seconds):
                 return False
         
         # Check day of week
         if user.recall_days_of_week:
-            current_day = str(datetime.now().isoweekday())  # 1=Monday, 7=Sunday
+            current_day = str(now.isoweekday())  # 1=Monday, 7=Sunday
             active_days = user.recall_days_of_week.split(',')
             if current_day not in active_days:
                 return False
         
         # Check sleep schedule
-        if user.sleep_start and user.sleep_end:
-            if self._is_sleep_time(current_time, user.sleep_start, user.sleep_end):
+        sleep_start = User.seconds_of_day(user.sleep_start)
+        sleep_end = User.seconds_of_day(user.sleep_end)
+        if sleep_start is not None and sleep_end is not None:
+            if self._is_sleep_time(current_seconds, sleep_start, sleep_end):
                 return False
         
         return True
@@ -151,143 +303,64 @@ class NotificationService:
             return current_time >= sleep_start or current_time <= sleep_end
     
     def _create_apns_token(self):
-        """Generate JWT token for APNs authentication"""
-        if not os.path.exists(self.config.APNS_KEY_PATH):
-            raise Exception("APNs key file not found")
-            
-        with open(self.config.APNS_KEY_PATH, "r") as f:
-            secret = f.read()
-
-        token = jwt.encode(
-            {
-                "iss": self.config.APNS_TEAM_ID,
-                "iat": time.time(),
-            },
-            secret,
-            algorithm=self.config.ALGORITHM,
-            headers={"alg": self.config.ALGORITHM, "kid": self.config.APNS_AUTH_KEY_ID},
-        )
-        return token
+        """Get the shared, cached JWT token for APNs authentication"""
+        return apns_credentials.get_token()
     
     async def _send_push_notification(self, device_token, payload, push_type="alert", activity_token=None):
-        """Send push notification via APNs"""
+        """Send push notification via the shared APNs HTTP/2 client"""
         try:
-            token = self._create_apns_token()
-            url = f"https://api.development.push.apple.com/3/device/{device_token if not activity_token else activity_token}"
-            
-            headers = {
-                "apns-topic": self.config.BUNDLE_ID if push_type == "alert" else f"{self.config.BUNDLE_ID}.push-type.liveactivity",
-                "authorization": f"bearer {token}",
-                "apns-push-type": push_type,
-                "apns-priority": "10"
-            }
-
-            async with httpx.AsyncClient(http2=True) as client:
-                response = await client.post(url, headers=headers, json=payload)
-                return response.status_code
+            response = await apns_client.send(
+                activity_token or device_token,
+                payload,
+                push_type=push_type
+            )
+            return response.status_code
                 
         except Exception as e:
             print(f"Failed to send push notification: {e}")
             return 500
     
-    def _send_card_notification(self, user, card):
-        """Send notification with actual card content"""
+    def _build_card_notification(self, user, card):
+        """Build the push jobs (alert plus optional Live Activity update) showing a card"""
         if not user.device_token:
-            return
+            return []
         
-        # Format card content for notification
-        if card.content_type == 'flashcard':
-            title = "🧠 Quick Recall"
-            body = f"Q: {card.front}"
-            # For flashcards, we could show the question and let them think, then reveal answer
-            subtitle = f"Tap to see answer"
-        else:  # information piece
-            title = "💡 Remember This"
-            body = card.front
-            subtitle = f"Subject: {card.subject}" if card.subject else "Key Information"
-        
-        # Truncate long content for notification
-        if len(body) > 100:
-            body = body[:97] + "..."
-        
-        payload = {
-            "aps": {
-                "alert": {
-                    "title": title,
-                    "subtitle": subtitle,
-                    "body": body
-                },
-                "badge": 1,
-                "sound": "default",
-                "category": "RECALL_CARD"  # For custom actions
-            },
-            "card_id": card.id,
-            "content_type": card.content_type,
-            "card_back": card.back if card.content_type == 'flashcard' else None
-        }
+        payload = push_payloads.recall_alert(card)
+        jobs = [PushJob(user.device_token, payload, push_type="alert", user_id=user.id)]
         
         # Send Live Activity update if enabled
         if user.live_activity_enabled and user.active_activity_token:
-            self._send_live_activity_update(user, card)
+            live_activity_job = self._build_live_activity_update(user, card)
+            if live_activity_job:
+                jobs.append(live_activity_job)
         
-        # Note: In a real app, you'd use asyncio.run() or run this in an async context
-        # For now, we'll just log the notification
-        print(f"Would send card notification to {user.username}:")
-        print(f"  Title: {title}")
-        print(f"  Body: {body}")
-        print(f"  Card ID: {card.id}")
+        return jobs
     
-    def _send_live_activity_update(self, user, card):
-        """Send Live Activity update with card content"""
+    def _build_live_activity_update(self, user, card):
+        """Build the Live Activity update job showing card content"""
         if not user.active_activity_token:
-            return
+            return None
         
-        # Format content for Live Activity
-        if card.content_type == 'flashcard':
-            content_state = {
-                "question": card.front,
-                "answer": card.back,
-                "cardType": "flashcard",
-                "subject": card.subject or "Study",
-                "showAnswer": False  # Initially hide answer
-            }
-        else:
-            content_state = {
-                "information": card.front,
-                "cardType": "information", 
-                "subject": card.subject or "Knowledge",
-                "showAnswer": True  # Always show for info pieces
-            }
-        
-        payload = {
-            "aps": {
-                "timestamp": int(time.time()),
-                "event": "update",
-                "content-state": content_state
-            }
-        }
-        
-        print(f"Would send Live Activity update to {user.username}:")
-        print(f"  Content: {content_state}")
+        payload = push_payloads.recall_live_activity(card)
+        return PushJob(user.active_activity_token, payload, push_type="liveactivity", user_id=user.id)
     
-    def _send_study_reminder(self, user, due_count):
-        """Legacy method - kept for compatibility"""
-        # This is now replaced by _send_card_notification
-        pass
+    @staticmethod
+    def _get_user(user):
+        """Accept either a User entity or a user id"""
+        return user if isinstance(user, User) else User.query.get(user)
     
-    def register_device_token(self, user_id, device_token):
-        """Register device token for push notifications"""
-        user = User.query.get(user_id)
+    def register_device_token(self, user, device_token):
+        """Register device token for push notifications (User entity or id)"""
+        user = self._get_user(user)
         if user:
             user.device_token = device_token
-            from app import db
-            db.session.commit()
+            recall_scheduler.reschedule_user(user)
             return True
         return False
     
-    def register_live_activity_token(self, user_id, activity_token):
-        """Register Live Activity token"""
-        user = User.query.get(user_id)
+    def register_live_activity_token(self, user, activity_token):
+        """Register Live Activity token (User entity or id)"""
+        user = self._get_user(user)
         if user:
             user.active_activity_token = activity_token
             from app import db
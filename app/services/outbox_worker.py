@@ -0,0 +1,364 @@
+"""
+Outbox Worker for delivering queued push notifications
+The scheduler writes NotificationOutbox rows; workers claim the rows of their shards,
+send them through the push dispatcher and record the outcome
+"""
+import os
+import time
+import uuid
+import random
+import socket
+from datetime import datetime, timedelta
+from typing import Dict, List
+from sqlalchemy import select, update, delete
+from app.models import User, NotificationOutbox, DailyRecallCount, UPSERT_DIALECTS
+from app.services.apns import APNsResponse
+from app.config import Config
+from app.services.push_dispatcher import PushJob, push_dispatcher
+from app.utils.metrics import metrics
+from app import db
+
+OUTBOX_PROCESSED = metrics.counter('notification_outbox_processed_total', 'Claimed outbox rows by result', ['result'])
+OUTBOX_RECOVERED = metrics.counter('notification_outbox_recovered_total', 'Claimed rows returned to pending after lease expiry')
+
+
+def _outbox_depth():
+    """Current outbox row counts by status (sampled when metrics are scraped)"""
+    rows = db.session.query(NotificationOutbox.status, db.func.count(NotificationOutbox.id)).group_by(
+        NotificationOutbox.status
+    ).all()
+    return {(status,): count for status, count in rows}
+
+
+metrics.gauge('notification_outbox_depth', 'Outbox rows by status', ['status'], callback=_outbox_depth)
+
+
+class OutboxWorker:
+    """Drains the notification outbox for shards where shard % shard_count == shard_index"""
+
+    # Retry delays grow from RETRY_BASE_SECONDS up to RETRY_MAX_SECONDS
+    RETRY_BASE_SECONDS = 15
+    RETRY_MAX_SECONDS = 15 * 60
+
+    # Per-batch counters; 'wasted' counts pushes that reached APNs without being delivered
+    EMPTY_STATS = {'claimed': 0, 'sent': 0, 'dead_tokens': 0, 'retried': 0, 'failed': 0, 'wasted': 0}
+
+    def __init__(self, shard_index=0, shard_count=1, worker_id=None, batch_size=None, lease_seconds=None,
+                 max_attempts=None, dispatcher=None):
+        if not 0 <= shard_index < shard_count:
+            raise ValueError("shard_index must be between 0 and shard_count - 1")
+
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{shard_index}/{shard_count}"
+        self.batch_size = batch_size or Config.OUTBOX_BATCH_SIZE
+        self.lease_seconds = lease_seconds or Config.OUTBOX_LEASE_SECONDS
+        self.max_attempts = max_attempts or Config.OUTBOX_MAX_ATTEMPTS
+        self.dispatcher = dispatcher or push_dispatcher
+        self.running = False
+
+    # --- Producing ---
+
+    @staticmethod
+    def enqueue(rows: List[Dict]) -> int:
+        """Insert outbox rows, skipping any whose dedupe_key is already queued
+
+        Runs in the caller's transaction so enqueueing commits together with the
+        scheduler state that produced the rows.
+        """
+        if not rows:
+            return 0
+
+        dialect = UPSERT_DIALECTS.get(db.engine.dialect.name)
+        if dialect is None:
+            # No native upsert: filter out keys that already exist
+            existing = {key for (key,) in db.session.query(NotificationOutbox.dedupe_key).filter(
+                NotificationOutbox.dedupe_key.in_([row['dedupe_key'] for row in rows])
+            )}
+            rows = [row for row in rows if row['dedupe_key'] not in existing]
+            if rows:
+                db.session.execute(NotificationOutbox.__table__.insert(), rows)
+            return len(rows)
+
+        stmt = dialect.insert(NotificationOutbox.__table__).on_conflict_do_nothing(index_elements=['dedupe_key'])
+        result = db.session.execute(stmt, rows)
+        return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
+
+    # --- Claiming ---
+
+    def _in_my_shards(self):
+        """SQL condition selecting this worker's shards"""
+        if self.shard_count == 1:
+            return NotificationOutbox.shard >= 0
+        return NotificationOutbox.shard % self.shard_count == self.shard_index
+
+    def recover_stale(self, now=None) -> int:
+        """Return rows whose lease expired (crashed or stuck worker) to the pending state"""
+        now = now or datetime.utcnow()
+        result = db.session.execute(
+            update(NotificationOutbox)
+            .where(
+                NotificationOutbox.status == 'claimed',
+                NotificationOutbox.claimed_at < now - timedelta(seconds=self.lease_seconds),
+                self._in_my_shards()
+            )
+            .values(status='pending', claimed_by=None, claimed_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        OUTBOX_RECOVERED.inc(result.rowcount)
+        return result.rowcount
+
+    def claim_batch(self, now=None) -> List[NotificationOutbox]:
+        """Atomically claim up to batch_size due rows
+
+        The UPDATE only flips rows that are still pending, so two workers racing for
+        the same row cannot both claim it; each batch gets its own claim id.
+        """
+        now = now or datetime.utcnow()
+        claim_id = f"{self.worker_id}:{uuid.uuid4().hex[:8]}"
+
+        candidates = (
+            select(NotificationOutbox.id)
+            .where(
+                NotificationOutbox.status == 'pending',
+                NotificationOutbox.available_at <= now,
+                self._in_my_shards()
+            )
+            .order_by(NotificationOutbox.available_at)
+            .limit(self.batch_size)
+        )
+        result = db.session.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(candidates), NotificationOutbox.status == 'pending')
+            .values(
+                status='claimed',
+                claimed_by=claim_id,
+                claimed_at=now,
+                attempts=NotificationOutbox.attempts + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        if not result.rowcount:
+            return []
+        rows = NotificationOutbox.query.filter_by(claimed_by=claim_id, status='claimed').all()
+        # Detached, so the commits between waves in run_once don't expire and reload them
+        for row in rows:
+            db.session.expunge(row)
+        return rows
+
+    def extend_lease(self, rows, now=None) -> List[NotificationOutbox]:
+        """Renew the claim on rows about to be sent; returns the ones this worker still holds
+
+        A row whose lease already ran out may have been recovered and claimed by another
+        worker, so it is left out rather than sent a second time.
+        """
+        now = now or datetime.utcnow()
+        claim_id = rows[0].claimed_by
+        ids = [row.id for row in rows]
+        result = db.session.execute(
+            update(NotificationOutbox)
+            .where(
+                NotificationOutbox.id.in_(ids),
+                NotificationOutbox.claimed_by == claim_id,
+                NotificationOutbox.status == 'claimed'
+            )
+            .values(claimed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        if result.rowcount == len(rows):
+            return rows
+        held = {row_id for (row_id,) in db.session.query(NotificationOutbox.id).filter(
+            NotificationOutbox.id.in_(ids),
+            NotificationOutbox.claimed_by == claim_id,
+            NotificationOutbox.status == 'claimed'
+        )}
+        return [row for row in rows if row.id in held]
+
+    # --- Sending ---
+
+    def _retry_delay(self, row, response) -> float:
+        """Seconds before a failed row is tried again: exponential backoff with jitter, honouring Retry-After"""
+        ceiling = min(self.RETRY_MAX_SECONDS, self.RETRY_BASE_SECONDS * 2 ** max(row.attempts - 1, 0))
+        delay = random.uniform(ceiling / 2, ceiling)
+        if response is not None and response.retry_after:
+            delay = max(delay, response.retry_after)
+        return delay
+
+    def _finish(self, rows, jobs, now) -> Dict[str, int]:
+        """Record the outcome of a sent batch, guarded by the claim so a reclaimed row is left alone"""
+        claim_id = rows[0].claimed_by
+        stats = dict(self.EMPTY_STATS, claimed=len(rows))
+        sent_ids = []
+        for row, job in zip(rows, jobs):
+            outcome = job.outcome
+            if outcome == APNsResponse.SENT:
+                sent_ids.append(row.id)
+                continue
+
+            response = job.response
+            values = {
+                'last_status': response.status_code if response is not None else 500,
+                'error_message': (response.reason if response is not None else None) or 'Send failed',
+                'claimed_by': None,
+                'claimed_at': None
+            }
+            # Throttling, server errors and network failures are retried; other rejections are final
+            if outcome == APNsResponse.RETRY and row.attempts < self.max_attempts:
+                values['status'] = 'pending'
+                values['available_at'] = now + timedelta(seconds=self._retry_delay(row, response))
+                stats['retried'] += 1
+            else:
+                values['status'] = 'failed'
+                stats['dead_tokens' if outcome == APNsResponse.DEAD_TOKEN else 'failed'] += 1
+
+            db.session.execute(
+                update(NotificationOutbox)
+                .where(NotificationOutbox.id == row.id, NotificationOutbox.claimed_by == claim_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+
+        if sent_ids:
+            db.session.execute(
+                update(NotificationOutbox)
+                .where(NotificationOutbox.id.in_(sent_ids), NotificationOutbox.claimed_by == claim_id)
+                .values(status='sent', sent_at=now, last_status=200, error_message=None)
+                .execution_options(synchronize_session=False)
+            )
+            # Only delivered recalls use up the user's max_daily_recalls
+            DailyRecallCount.increment([
+                row.user_id for row, job in zip(rows, jobs)
+                if job.outcome == APNsResponse.SENT and row.is_recall_alert
+            ])
+        stats['sent'] = len(sent_ids)
+
+        dead_tokens = self.dispatcher.dead_tokens(jobs)
+        if dead_tokens:
+            self.discard_dead_tokens(dead_tokens)
+
+        db.session.commit()
+        stats['wasted'] = stats['claimed'] - stats['sent']
+        for result in ('sent', 'dead_tokens', 'retried', 'failed'):
+            if stats[result]:
+                OUTBOX_PROCESSED.inc(stats[result], result=result)
+        return stats
+
+    @staticmethod
+    def discard_dead_tokens(dead_tokens) -> int:
+        """Clear invalid tokens from users and drop pushes still queued for them (caller commits)"""
+        cleared = User.clear_push_tokens(dead_tokens)
+        for push_type, tokens in dead_tokens.items():
+            db.session.execute(
+                update(NotificationOutbox)
+                .where(
+                    NotificationOutbox.status == 'pending',
+                    NotificationOutbox.push_type == push_type,
+                    NotificationOutbox.device_token.in_(list(tokens))
+                )
+                .values(status='failed', error_message='Token no longer valid')
+                .execution_options(synchronize_session=False)
+            )
+        return cleared
+
+    def run_once(self) -> Dict[str, int]:
+        """Claim and send one batch; requires an app context
+
+        The batch goes out in waves of at most one dispatch's concurrency, renewing the
+        lease before each, so a large batch slowed by timeouts and retries never outlives
+        its lease and gets reclaimed while it is still being sent.
+        """
+        rows = self.claim_batch()
+        if not rows:
+            return dict(self.EMPTY_STATS)
+
+        totals = dict(self.EMPTY_STATS, claimed=len(rows))
+        wave_size = max(1, self.dispatcher.concurrency)
+        for offset in range(0, len(rows), wave_size):
+            wave = self.extend_lease(rows[offset:offset + wave_size])
+            if not wave:
+                continue
+
+            jobs = [
+                PushJob(
+                    row.device_token,
+                    row.payload.encode('utf-8'),
+                    push_type=row.push_type,
+                    user_id=row.user_id,
+                    apns_id=row.apns_id
+                )
+                for row in wave
+            ]
+            self.dispatcher.dispatch_sync(jobs)
+            stats = self._finish(wave, jobs, datetime.utcnow())
+            for key in totals:
+                if key != 'claimed':
+                    totals[key] += stats[key]
+        return totals
+
+    def drain(self, max_batches=100) -> Dict[str, int]:
+        """Send batches until nothing due is left (or max_batches is reached)"""
+        totals = dict(self.EMPTY_STATS)
+        for _ in range(max_batches):
+            stats = self.run_once()
+            for key in totals:
+                totals[key] += stats[key]
+            if not stats['claimed']:
+                break
+        return totals
+
+    def purge(self, now=None) -> int:
+        """Delete finished rows older than the retention period"""
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(hours=Config.OUTBOX_RETENTION_HOURS)
+        result = db.session.execute(
+            delete(NotificationOutbox)
+            .where(
+                NotificationOutbox.status.in_(['sent', 'failed']),
+                NotificationOutbox.created_at < cutoff,
+                self._in_my_shards()
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount
+
+    def pending_count(self) -> int:
+        """Rows waiting to be sent in this worker's shards"""
+        return NotificationOutbox.query.filter(
+            NotificationOutbox.status == 'pending',
+            self._in_my_shards()
+        ).count()
+
+    def run_forever(self, poll_seconds=None):
+        """Worker loop: recover expired leases, drain due rows, sleep when idle"""
+        poll_seconds = poll_seconds or Config.OUTBOX_POLL_SECONDS
+        last_maintenance = 0.0
+        self.running = True
+
+        while self.running:
+            try:
+                if time.monotonic() - last_maintenance > self.lease_seconds:
+                    recovered = self.recover_stale()
+                    purged = self.purge()
+                    if recovered or purged:
+                        print(f"Outbox worker {self.worker_id}: recovered {recovered}, purged {purged}")
+                    last_maintenance = time.monotonic()
+
+                stats = self.run_once()
+                if stats['claimed']:
+                    print(f"Outbox worker {self.worker_id}: sent {stats['sent']}/{stats['claimed']}, "
+                          f"wasted {stats['wasted']} ({stats['dead_tokens']} dead tokens, {stats['retried']} retrying)")
+                    continue
+            except Exception as e:
+                db.session.rollback()
+                print(f"Outbox worker error: {e}")
+
+            time.sleep(poll_seconds)
+
+    def stop(self):
+        self.running = False
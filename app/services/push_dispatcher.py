@@ -0,0 +1,189 @@
+"""
+Push Dispatcher for fanning notifications out to APNs
+Sends a batch of pushes concurrently under a concurrency limit and a global rate limit
+"""
+import time
+import random
+import asyncio
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+from app.config import Config
+from app.services.apns import APNsResponse, apns_client
+from app.utils.metrics import metrics
+from app.utils.async_runner import background_loop
+
+PUSHES_DISPATCHED = metrics.counter('push_dispatch_total', 'Pushes dispatched by final outcome', ['push_type', 'outcome'])
+PUSH_RETRIES = metrics.counter('push_dispatch_retries_total', 'Inline resends after 429/5xx or connection errors')
+DISPATCH_SECONDS = metrics.histogram(
+    'push_dispatch_batch_duration_seconds', 'Wall time to fan out one batch of pushes',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+
+
+class PushJob:
+    """One push to deliver: target token, payload and APNs push type"""
+
+    __slots__ = ('device_token', 'payload', 'push_type', 'topic', 'user_id', 'apns_id', 'response')
+
+    def __init__(self, device_token: str, payload: Any, push_type: str = "alert", topic: Optional[str] = None,
+                 user_id: Optional[int] = None, apns_id: Optional[str] = None):
+        self.device_token = device_token
+        self.payload = payload
+        self.push_type = push_type
+        self.topic = topic
+        self.user_id = user_id
+        self.apns_id = apns_id  # Stable id so resends of the same notification are recognisable
+        self.response = None  # APNsResponse once sent
+
+    @property
+    def outcome(self) -> str:
+        """sent, dead_token, retry or rejected; a push that raised is retryable"""
+        return self.response.outcome if self.response is not None else APNsResponse.RETRY
+
+    def __repr__(self):
+        return f"<PushJob {self.push_type} user={self.user_id}>"
+
+
+class TokenBucket:
+    """Async token bucket allowing `rate` acquisitions per second with bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PushDispatcher:
+    """Concurrent APNs fan-out with bounded in-flight pushes and a global send rate"""
+
+    def __init__(self, concurrency=None, rate_per_second=None, client=None, retry_attempts=None):
+        self.concurrency = concurrency or Config.PUSH_DISPATCH_CONCURRENCY
+        self.rate_per_second = Config.PUSH_DISPATCH_RATE_PER_SECOND if rate_per_second is None else rate_per_second
+        self.client = client or apns_client
+        self.retry_attempts = Config.PUSH_RETRY_ATTEMPTS if retry_attempts is None else retry_attempts
+        self.retry_base_seconds = Config.PUSH_RETRY_BASE_SECONDS
+        self.retry_max_seconds = Config.PUSH_RETRY_MAX_SECONDS
+
+        # Statistics for the most recent dispatch
+        self.last_statuses = Counter()
+        self.last_outcomes = Counter()
+        self.last_elapsed = 0.0
+
+    def _retry_delay(self, retry: int, response: Optional[APNsResponse]) -> Optional[float]:
+        """Backoff before retry number `retry` (full jitter), or None if it is too long to wait inline
+
+        APNs' Retry-After wins when it asks for a longer pause; anything beyond
+        retry_max_seconds is left to the caller (e.g. the outbox) to reschedule.
+        """
+        delay = random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** retry))
+        if response is not None and response.retry_after:
+            delay = max(delay, response.retry_after)
+        return delay if delay <= self.retry_max_seconds else None
+
+    async def dispatch(self, jobs: List[PushJob], retry_attempts: Optional[int] = None) -> List[int]:
+        """Send every job and return their status codes in job order (500 when sending failed)
+
+        retry_attempts overrides the inline retry count, e.g. 0 when a request is waiting on the result.
+        """
+        if not jobs:
+            return []
+        retry_attempts = self.retry_attempts if retry_attempts is None else retry_attempts
+
+        # Recycle a pool that sat idle or kept failing before fanning out over it
+        await self.client.check_health()
+
+        # Semaphores and locks are bound to the running loop, so build them per dispatch
+        slots = asyncio.Semaphore(self.concurrency)
+        bucket = TokenBucket(self.rate_per_second) if self.rate_per_second else None
+
+        async def send_once(job):
+            async with slots:
+                if bucket is not None:
+                    await bucket.acquire()
+                try:
+                    job.response = await self.client.send(
+                        job.device_token,
+                        job.payload,
+                        push_type=job.push_type,
+                        topic=job.topic,
+                        apns_id=job.apns_id
+                    )
+                    # Retries reuse the id APNs assigned so they are recognisable as the same push
+                    job.apns_id = job.apns_id or job.response.apns_id
+                    return job.response.status_code
+                except Exception as e:
+                    job.response = None
+                    print(f"Failed to send push to user {job.user_id}: {e}")
+                    return 500
+
+        async def send(job):
+            status = await send_once(job)
+            for retry in range(retry_attempts):
+                if job.outcome != APNsResponse.RETRY:
+                    break
+                delay = self._retry_delay(retry, job.response)
+                if delay is None:
+                    break
+                # Sleep outside the concurrency slot so other pushes keep flowing
+                await asyncio.sleep(delay)
+                PUSH_RETRIES.inc()
+                status = await send_once(job)
+            return status
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(send(job) for job in jobs))
+        self.last_elapsed = time.perf_counter() - start
+        self.last_statuses = Counter(statuses)
+        self.last_outcomes = Counter(job.outcome for job in jobs)
+
+        DISPATCH_SECONDS.observe(self.last_elapsed)
+        for (push_type, outcome), count in Counter((job.push_type, job.outcome) for job in jobs).items():
+            PUSHES_DISPATCHED.inc(count, push_type=push_type, outcome=outcome)
+        return statuses
+
+    def dispatch_sync(self, jobs: List[PushJob], retry_attempts: Optional[int] = None) -> List[int]:
+        """Run dispatch() from synchronous code such as the scheduler thread
+
+        Runs on the shared background loop, so batches reuse its pooled APNs connections.
+        """
+        if not jobs:
+            return []
+        return background_loop.run(self.dispatch(jobs, retry_attempts))
+
+    @property
+    def last_wasted(self) -> int:
+        """Pushes in the most recent dispatch that were not delivered"""
+        return sum(self.last_outcomes.values()) - self.last_outcomes[APNsResponse.SENT]
+
+    @staticmethod
+    def dead_tokens(jobs: List[PushJob]) -> Dict[str, Set[str]]:
+        """Tokens APNs reported as permanently invalid, grouped by push type"""
+        dead = {}
+        for job in jobs:
+            if job.outcome == APNsResponse.DEAD_TOKEN:
+                dead.setdefault(job.push_type, set()).add(job.device_token)
+        return dead
+
+    @property
+    def last_rate(self) -> float:
+        """Pushes per second achieved by the most recent dispatch"""
+        total = sum(self.last_statuses.values())
+        return total / self.last_elapsed if self.last_elapsed else 0.0
+
+
+# Singleton instance
+push_dispatcher = PushDispatcher()
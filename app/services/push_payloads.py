@@ -0,0 +1,251 @@
+"""
+Push Payload Builder for APNs notifications and Live Activities
+One place that formats cards into payloads, keeps them under the APNs size limit
+and serializes them to JSON bytes
+"""
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the stdlib encoder produces the same bytes
+    orjson = None
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact UTF-8 JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def truncate_utf8(text: str, max_bytes: int, ellipsis: str = "...") -> str:
+    """Shorten text so its UTF-8 encoding fits in max_bytes, never splitting a character"""
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return text
+
+    suffix = ellipsis.encode('utf-8')
+    if max_bytes < len(suffix):
+        suffix = b''
+    # errors='ignore' drops a multi-byte character cut in half by the slice
+    return encoded[:max_bytes - len(suffix)].decode('utf-8', errors='ignore') + suffix.decode('utf-8')
+
+
+def truncate_chars(text: str, max_chars: int, ellipsis: str = "...") -> str:
+    """Shorten text to max_chars characters for display"""
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars - len(ellipsis)] + ellipsis
+
+
+class PushPayloadBuilder:
+    """Builds APNs payload bytes for cards, caching the parts that only change when the card does
+
+    A card's alert payload never changes between sends, and its Live Activity
+    content-state only differs in the timestamp fields, so both are serialized
+    (and truncated) once per card version and spliced together per push.
+    """
+
+    # APNs rejects alert and Live Activity payloads larger than 4 KB
+    MAX_PAYLOAD_BYTES = 4096
+    # Room kept free for fields filled in per push (timestamps, event, isOverdue)
+    DYNAMIC_RESERVE_BYTES = 128
+    # Room kept in a study card's state for the alert sent with its "start" event
+    ACTIVITY_ALERT_RESERVE_BYTES = 256
+
+    ALERT_BODY_CHARS = 100
+    ACTIVITY_ALERT_BODY_CHARS = 50
+
+    def __init__(self, max_bytes: Optional[int] = None, cache_size: int = 10000):
+        self.max_bytes = max_bytes or self.MAX_PAYLOAD_BYTES
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Size limit ---
+
+    def fit(self, payload: Dict[str, Any], fields, reserve: int = 0) -> bytes:
+        """Serialize payload, truncating the given string fields (longest first) until it fits
+
+        fields is a list of (container dict, key) pairs that may be shortened.
+        Truncation is measured on the serialized bytes, so JSON escaping is
+        accounted for.
+        """
+        limit = self.max_bytes - reserve
+        body = dumps(payload)
+        while len(body) > limit:
+            candidates = [
+                (container, key) for container, key in fields
+                if isinstance(container.get(key), str) and container[key]
+            ]
+            if not candidates:
+                raise ValueError(f"Payload is {len(body)} bytes and has nothing left to truncate (limit {limit})")
+
+            container, key = max(candidates, key=lambda field: len(field[0][field[1]].encode('utf-8')))
+            value = container[key]
+            overflow = len(body) - limit
+            shortened = truncate_utf8(value, max(len(value.encode('utf-8')) - overflow, 0))
+            if shortened == value:
+                # Only the ellipsis is left; drop the field's content
+                shortened = ""
+            container[key] = shortened
+            body = dumps(payload)
+        return body
+
+    # --- Per-card cache ---
+
+    @staticmethod
+    def _card_version(card):
+        """Fingerprint of the card fields that end up in payloads"""
+        return (card.content_type, card.front, card.back, card.subject, card.folder_id)
+
+    def _cached(self, kind: str, card, build):
+        """Return the cached part for (kind, card), rebuilding it when the card changed"""
+        key = (kind, card.id)
+        version = self._card_version(card)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == version:
+                self._cache.move_to_end(key)
+                return entry[1]
+
+        value = build(card)
+        with self._lock:
+            self._cache[key] = (version, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def invalidate(self, card_id: Optional[int] = None):
+        """Forget cached parts for one card, or for every card"""
+        with self._lock:
+            if card_id is None:
+                self._cache.clear()
+                return
+            for key in [key for key in self._cache if key[1] == card_id]:
+                del self._cache[key]
+
+    # --- Recall pushes ---
+
+    def _build_recall_alert(self, card) -> bytes:
+        if card.content_type == 'flashcard':
+            alert = {"title": "🧠 Quick Recall", "subtitle": "Tap to see answer", "body": f"Q: {card.front}"}
+        else:  # information piece
+            alert = {
+                "title": "💡 Remember This",
+                "subtitle": f"Subject: {card.subject}" if card.subject else "Key Information",
+                "body": card.front
+            }
+        alert["body"] = truncate_chars(alert["body"], self.ALERT_BODY_CHARS)
+
+        payload = {
+            "aps": {
+                "alert": alert,
+                "badge": 1,
+                "sound": "default",
+                "category": "RECALL_CARD"  # For custom actions
+            },
+            "card_id": card.id,
+            "content_type": card.content_type,
+            "card_back": card.back if card.content_type == 'flashcard' else None
+        }
+        return self.fit(payload, [(payload, "card_back"), (alert, "body"), (alert, "subtitle")])
+
+    def recall_alert(self, card) -> bytes:
+        """Alert notification showing a card (identical for every send of the same card)"""
+        return self._cached('alert', card, self._build_recall_alert)
+
+    @staticmethod
+    def _recall_content_state(card) -> Dict[str, Any]:
+        if card.content_type == 'flashcard':
+            return {
+                "question": card.front,
+                "answer": card.back,
+                "cardType": "flashcard",
+                "subject": card.subject or "Study",
+                "showAnswer": False  # Initially hide answer
+            }
+        return {
+            "information": card.front,
+            "cardType": "information",
+            "subject": card.subject or "Knowledge",
+            "showAnswer": True  # Always show for info pieces
+        }
+
+    def _build_recall_activity_state(self, card) -> bytes:
+        state = self._recall_content_state(card)
+        fields = [(state, key) for key in ("answer", "question", "information", "subject")]
+        # The state is wrapped in {"aps":{...}} per push, so measure it inside the envelope
+        self.fit({"aps": {"content-state": state}}, fields, reserve=self.DYNAMIC_RESERVE_BYTES)
+        return dumps(state)
+
+    def recall_live_activity(self, card, event: str = "update", timestamp: Optional[int] = None) -> bytes:
+        """Live Activity update showing a card; only the timestamp is filled in per push"""
+        state = self._cached('activity', card, self._build_recall_activity_state)
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        return b'{"aps":{"timestamp":%d,"event":%s,"content-state":%s}}' % (timestamp, dumps(event), state)
+
+    # --- Study card Live Activities ---
+
+    def _build_study_card_state(self, card) -> bytes:
+        state = {"cardId": card.id}
+        state.update(self._recall_content_state(card))
+        state["folderName"] = card.folder.name if card.folder else None
+        fields = [(state, key) for key in ("answer", "question", "information", "subject", "folderName")]
+        reserve = self.DYNAMIC_RESERVE_BYTES + self.ACTIVITY_ALERT_RESERVE_BYTES
+        self.fit({"aps": {"content-state": state}}, fields, reserve=reserve)
+        # Drop the closing brace so per-push fields can be appended
+        return dumps(state)[:-1]
+
+    def study_card_state(self, card) -> bytes:
+        """Cached, truncated content-state of a study card without the per-push fields (open-ended JSON)"""
+        return self._cached('study', card, self._build_study_card_state)
+
+    def stamp_study_card(self, state: bytes, is_overdue: bool, event: str = "update", now: Optional[float] = None,
+                         alert: Optional[Dict[str, str]] = None) -> bytes:
+        """Complete a study_card_state() into a payload with the current timestamps"""
+        now = int(time.time() if now is None else now)
+        dynamic = b',"isOverdue":%s,"lastUpdated":%d}' % (b'true' if is_overdue else b'false', now)
+        # Update and end events carry no alert; leave the key out rather than sending null
+        tail = b',"alert":%s}}' % dumps(alert) if alert is not None else b'}}'
+        return b'{"aps":{"timestamp":%d,"event":%s,"content-state":%s%s%s' % (
+            now, dumps(event), state, dynamic, tail
+        )
+
+    def _study_card_alert(self, card) -> Dict[str, str]:
+        """Alert for a study card's "start" event, truncated to ACTIVITY_ALERT_RESERVE_BYTES"""
+        body = card.front
+        if len(body) > self.ACTIVITY_ALERT_BODY_CHARS:
+            body = f"New {card.content_type}: {body[:self.ACTIVITY_ALERT_BODY_CHARS]}..."
+        alert = {"title": "🧠 Active Recall", "body": body}
+        self.fit(alert, [(alert, "body")], reserve=self.max_bytes - self.ACTIVITY_ALERT_RESERVE_BYTES)
+        return alert
+
+    def study_card_activity(self, card, event: str = "update", now: Optional[float] = None) -> bytes:
+        """Live Activity start/update for a study card, with overdue flag and timestamps filled in per push"""
+        alert = self._study_card_alert(card) if event == "start" else None
+        return self.stamp_study_card(self.study_card_state(card), card.is_due_for_review(), event, now, alert)
+
+    # --- Ad-hoc Live Activities (study sessions, reminders) ---
+
+    def live_activity(self, event: str, content_state: Dict[str, Any], timestamp: Optional[int] = None,
+                      aps_fields: Optional[Dict[str, Any]] = None) -> bytes:
+        """Live Activity payload for one-off content; long string fields are truncated to fit"""
+        aps = {
+            "timestamp": int(time.time()) if timestamp is None else timestamp,
+            "event": event,
+            "content-state": content_state
+        }
+        aps.update(aps_fields or {})
+        payload = {"aps": aps}
+        fields = [(content_state, key) for key, value in content_state.items() if isinstance(value, str)]
+        return self.fit(payload, fields)
+
+
+# Singleton instance
+push_payloads = PushPayloadBuilder()
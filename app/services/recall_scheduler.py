@@ -0,0 +1,186 @@
+"""
+Recall Scheduler for timed push notifications
+Keeps every schedulable user in an in-memory min-heap keyed by User.next_recall_at
+so a scheduler tick only touches users whose slot has arrived
+"""
+import heapq
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional
+from app.models import User
+from app import db
+
+
+class RecallScheduler:
+    """Min-heap of (next_recall_at, user_id) mirroring the persisted User.next_recall_at column"""
+
+    # Upper bound on window/day/sleep boundary jumps when searching for the next allowed slot
+    MAX_BOUNDARY_JUMPS = 16
+
+    def __init__(self):
+        self._heap = []
+        self._slots = {}  # user_id -> currently scheduled time (heap entries not matching are stale)
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    # --- In-memory heap ---
+
+    def schedule(self, user_id: int, when: Optional[datetime]):
+        """Put a user in the heap at `when` (None removes them)"""
+        with self._lock:
+            if when is None:
+                self._slots.pop(user_id, None)
+                return
+            self._slots[user_id] = when
+            heapq.heappush(self._heap, (when, user_id))
+
+    def unschedule(self, user_id: int):
+        """Remove a user from the heap"""
+        self.schedule(user_id, None)
+
+    def pop_due(self, now: datetime) -> List[int]:
+        """Pop every user whose slot is at or before `now`"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, user_id = heapq.heappop(self._heap)
+                if self._slots.get(user_id) == when:
+                    del self._slots[user_id]
+                    due.append(user_id)
+            # Drop stale entries once they dominate the heap
+            if len(self._heap) > 2 * len(self._slots) + 64:
+                self._heap = [(when, uid) for uid, when in self._slots.items()]
+                heapq.heapify(self._heap)
+        return due
+
+    def next_due_at(self) -> Optional[datetime]:
+        """Earliest scheduled slot, if any"""
+        with self._lock:
+            while self._heap and self._slots.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def __len__(self):
+        return len(self._slots)
+
+    # --- Persistence ---
+
+    def load(self):
+        """Rebuild the heap from the database (requires an app context)
+
+        Users that were never scheduled (e.g. right after the migration) get a slot computed now.
+        """
+        rows = db.session.query(User.id, User.next_recall_at).filter(
+            User.next_recall_at.isnot(None)
+        ).all()
+
+        with self._lock:
+            self._slots = {user_id: when for user_id, when in rows}
+            self._heap = [(when, user_id) for user_id, when in self._slots.items()]
+            heapq.heapify(self._heap)
+
+        unscheduled = User.query.filter(
+            User.next_recall_at.is_(None),
+            User.device_token.isnot(None),
+            User.recall_enabled == True
+        ).all()
+        for user in unscheduled:
+            self.reschedule_user(user, commit=False)
+        db.session.commit()
+
+        self.loaded = True
+        print(f"Recall scheduler loaded {len(self)} scheduled users")
+
+    def reschedule_user(self, user: User, after: Optional[datetime] = None, commit: bool = True):
+        """Recompute, persist and heap-schedule a user's next recall slot
+
+        Call after every send and whenever recall preferences or tokens change.
+        """
+        user.next_recall_at = self.compute_next_recall_at(user, after)
+        if commit:
+            db.session.commit()
+        self.schedule(user.id, user.next_recall_at)
+        return user.next_recall_at
+
+    # --- Slot computation ---
+
+    @classmethod
+    def compute_next_recall_at(cls, user: User, after: Optional[datetime] = None) -> Optional[datetime]:
+        """Next UTC time a recall may be sent to `user`, or None if they should not be scheduled"""
+        if not user.device_token or not user.recall_enabled or user.recall_paused or user.focus_mode:
+            return None
+
+        # Existing semantics: a start time after the end time never matches
+        if user.recall_start_time and user.recall_end_time and user.recall_start_time > user.recall_end_time:
+            return None
+
+        active_days = cls._active_days(user)
+        if active_days is not None and not active_days:
+            return None
+
+        earliest = after or datetime.utcnow()
+        if user.last_notification_time:
+            frequency = timedelta(minutes=user.recall_frequency_minutes or 30)
+            earliest = max(earliest, user.last_notification_time + frequency)
+
+        # Recall windows are expressed in server local time, slots are stored in UTC
+        offset = cls._local_offset()
+        local = earliest + offset
+        for _ in range(cls.MAX_BOUNDARY_JUMPS):
+            blocked_until = cls._blocked_until(user, local, active_days)
+            if blocked_until is None:
+                return local - offset
+            local = blocked_until
+
+        return None
+
+    @classmethod
+    def start_of_next_local_day(cls) -> datetime:
+        """UTC time of the next server-local midnight (when daily caps reset)"""
+        tomorrow = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+        return tomorrow - cls._local_offset()
+
+    @staticmethod
+    def _local_offset() -> timedelta:
+        """Offset between server local time and UTC, rounded to the minute"""
+        seconds = (datetime.now() - datetime.utcnow()).total_seconds()
+        return timedelta(minutes=round(seconds / 60))
+
+    @staticmethod
+    def _active_days(user: User):
+        """Parse recall_days_of_week into a set of ISO weekdays (None = every day)"""
+        if not user.recall_days_of_week:
+            return None
+        return {int(day) for day in user.recall_days_of_week.split(',') if day.strip().isdigit()}
+
+    @staticmethod
+    def _blocked_until(user: User, local: datetime, active_days) -> Optional[datetime]:
+        """If recalls are not allowed at local time `local`, return when the block ends"""
+        current_time = local.time()
+        next_midnight = datetime.combine(local.date() + timedelta(days=1), datetime.min.time())
+
+        if active_days is not None and local.isoweekday() not in active_days:
+            return next_midnight
+
+        if user.recall_start_time and user.recall_end_time:
+            if current_time < user.recall_start_time:
+                return datetime.combine(local.date(), user.recall_start_time)
+            if current_time > user.recall_end_time:
+                return datetime.combine(next_midnight.date(), user.recall_start_time)
+
+        if user.sleep_start and user.sleep_end:
+            sleep_start, sleep_end = user.sleep_start, user.sleep_end
+            one_minute = timedelta(minutes=1)
+            if sleep_start <= sleep_end:
+                if sleep_start <= current_time <= sleep_end:
+                    return datetime.combine(local.date(), sleep_end) + one_minute
+            elif current_time >= sleep_start:
+                return datetime.combine(next_midnight.date(), sleep_end) + one_minute
+            elif current_time <= sleep_end:
+                return datetime.combine(local.date(), sleep_end) + one_minute
+
+        return None
+
+
+# Singleton instance
+recall_scheduler = RecallScheduler()
@@ -1,6 +1,7 @@
 """
 Spaced Repetition Service implementing SM-2 algorithm
 """
+import random
 from datetime import datetime, timedelta
 from app.models import Card
 from app import db
@@ -9,8 +10,14 @@ class SpacedRepetitionService:
     """Service for managing spaced repetition logic"""
     
     @staticmethod
-    def get_due_cards(user_id, limit=None):
-        """Get cards due for review for a specific user"""
+    def _user_id(user):
+        """Accept either a User entity or a user id"""
+        return getattr(user, 'id', user)
+    
+    @staticmethod
+    def get_due_cards(user, limit=None):
+        """Get cards due for review for a specific user (User entity or id)"""
+        user_id = SpacedRepetitionService._user_id(user)
         query = Card.query.filter(
             Card.user_id == user_id,
             Card.next_review <= datetime.utcnow()
@@ -22,8 +29,17 @@ class SpacedRepetitionService:
         return query.all()
     
     @staticmethod
-    def get_user_stats(user_id):
-        """Get learning statistics for a user"""
+    def count_due_cards(user):
+        """Count cards due for review without loading them"""
+        return Card.query.filter(
+            Card.user_id == SpacedRepetitionService._user_id(user),
+            Card.next_review <= datetime.utcnow()
+        ).count()
+    
+    @staticmethod
+    def get_user_stats(user):
+        """Get learning statistics for a user (User entity or id)"""
+        user_id = SpacedRepetitionService._user_id(user)
         total_cards = Card.query.filter_by(user_id=user_id).count()
         due_cards = Card.query.filter(
             Card.user_id == user_id,
@@ -67,8 +83,9 @@ class SpacedRepetitionService:
         return card
     
     @staticmethod
-    def get_next_review_batch(user_id, batch_size=5):
+    def get_next_review_batch(user, batch_size=5):
         """Get the next batch of cards for review session"""
+        user_id = SpacedRepetitionService._user_id(user)
         due_cards = SpacedRepetitionService.get_due_cards(user_id, batch_size)
         
         # If not enough due cards, add some new cards
@@ -82,4 +99,45 @@ class SpacedRepetitionService:
             
             due_cards.extend(new_cards)
         
-        return due_cards
\ No newline at end of file
+        return due_cards
+    
+    @staticmethod
+    def _recall_card_query(user):
+        """Cards of the user's recall folders (all cards when no folder is selected)"""
+        query = Card.query.filter(Card.user_id == user.id)
+        if user.recall_folders:
+            folder_ids = [int(fid.strip()) for fid in user.recall_folders.split(',') if fid.strip().isdigit()]
+            if folder_ids:
+                query = query.filter(Card.folder_id.in_(folder_ids))
+        return query
+    
+    @staticmethod
+    def sample_card(query):
+        """Pick one card of query uniformly at random, loading only that card
+        
+        Counts the matches, then skips to a random offset in (next_review, id)
+        order selecting only ids, so ix_card_user_next_review answers both steps
+        without touching the card rows; only the chosen card is then loaded.
+        """
+        count = query.with_entities(db.func.count(Card.id)).scalar()
+        if not count:
+            return None
+        card_id = query.with_entities(Card.id).order_by(Card.next_review, Card.id).offset(
+            random.randrange(count)
+        ).limit(1).scalar()
+        return db.session.get(Card, card_id) if card_id is not None else None
+    
+    @staticmethod
+    def random_due_card(user, now=None):
+        """A random due card from the user's recall folders, or None"""
+        query = SpacedRepetitionService._recall_card_query(user)
+        return SpacedRepetitionService.sample_card(query.filter(Card.next_review <= (now or datetime.utcnow())))
+    
+    @staticmethod
+    def random_study_card(user, due_probability=0.7, now=None):
+        """A random card from the user's recall folders, preferring due cards with due_probability"""
+        if random.random() < due_probability:
+            card = SpacedRepetitionService.random_due_card(user, now)
+            if card:
+                return card
+        return SpacedRepetitionService.sample_card(SpacedRepetitionService._recall_card_query(user))
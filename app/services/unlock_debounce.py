@@ -0,0 +1,148 @@
+"""
+Unlock Debounce for Live Activity updates
+Rejects unlocks that arrive too soon after the last update without touching the database,
+and writes users' last_notification_time back in batches
+"""
+import atexit
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import bindparam, case, or_, update
+from app.models import User
+from app.config import Config
+from app.utils.rate_limiter import MemoryRateLimitStore, SQLiteRateLimitStore, SlidingWindowRateLimiter
+from app.utils.metrics import metrics
+from app import db
+
+UNLOCKS_DEBOUNCED = metrics.counter('unlock_debounce_total', 'Unlock updates by debounce decision', ['result'])
+
+
+class UnlockDebouncer:
+    """At most one Live Activity content update per user every `interval_seconds`
+
+    Decisions come from an in-memory sliding window (or the shared SQLite rate
+    limit file, in its own table, when RATE_LIMIT_STORAGE_PATH is set for
+    multi-worker runs). The time of each update is kept in memory and flushed to
+    User.last_notification_time in one bulk UPDATE every `flush_seconds`.
+    """
+
+    def __init__(self, interval_seconds=None, flush_seconds=None, storage_path=None, max_keys=None):
+        self.interval_seconds = interval_seconds or Config.UNLOCK_MIN_INTERVAL_SECONDS
+        self.flush_seconds = flush_seconds or Config.UNLOCK_FLUSH_SECONDS
+        storage_path = Config.RATE_LIMIT_STORAGE_PATH if storage_path is None else storage_path
+        if storage_path:
+            # Own table, so purging its short-lived hits leaves the login limiter's alone
+            store = SQLiteRateLimitStore(storage_path, max_age_seconds=self.interval_seconds,
+                                         table='unlock_debounce_hit')
+        else:
+            store = MemoryRateLimitStore(max_keys=max_keys or Config.UNLOCK_DEBOUNCE_MAX_USERS)
+        self.limiter = SlidingWindowRateLimiter(1, self.interval_seconds, store)
+
+        self._pending: Dict[int, datetime] = {}  # user id -> last update not yet written
+        self._lock = threading.Lock()
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _key(user_id):
+        return f"unlock:{user_id}"
+
+    def retry_after(self, user_id: int) -> float:
+        """Seconds until the user may get another update, without claiming it (0 = allowed)"""
+        return self.limiter.retry_after(self._key(user_id))
+
+    def acquire(self, user_id: int) -> float:
+        """Claim the user's next update slot; returns 0 when claimed, else seconds to wait"""
+        wait = self.limiter.acquire(self._key(user_id))
+        UNLOCKS_DEBOUNCED.inc(result='rejected' if wait else 'allowed')
+        return wait
+
+    def release(self, user_id: int):
+        """Give a claimed slot back when no update was sent"""
+        self.limiter.reset(self._key(user_id))
+
+    def touch(self, user_id: int):
+        """Count an update sent outside acquire() (e.g. starting an activity) and record its time"""
+        self.limiter.hit(self._key(user_id))
+        self.record_update(user_id)
+
+    def record_update(self, user_id: int, when: Optional[datetime] = None):
+        """Remember the time of a sent update for the next batched write"""
+        with self._lock:
+            self._pending[user_id] = when or datetime.utcnow()
+        self._ensure_flusher()
+
+    def last_update(self, user_id: int) -> Optional[datetime]:
+        """Unflushed update time for a user, if any"""
+        return self._pending.get(user_id)
+
+    def flush(self) -> int:
+        """Write pending update times in one bulk UPDATE; requires an app context"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        # Never move a user's time backwards: a scheduler push may have written a newer one
+        # after this update was buffered
+        column = User.__table__.c.last_notification_time
+        statement = (
+            update(User.__table__)
+            .where(User.__table__.c.id == bindparam('user_id'))
+            .values(last_notification_time=case(
+                (or_(column.is_(None), column < bindparam('when')), bindparam('when')),
+                else_=column
+            ))
+        )
+        try:
+            db.session.execute(
+                statement,
+                [{'user_id': user_id, 'when': when} for user_id, when in pending.items()]
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Keep the times for the next flush unless a newer one was recorded meanwhile
+            with self._lock:
+                for user_id, when in pending.items():
+                    self._pending.setdefault(user_id, when)
+            raise
+        return len(pending)
+
+    def _ensure_flusher(self):
+        """Start the flush thread with the current app the first time an update is recorded"""
+        if self._thread is not None:
+            return
+
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return
+
+        with self._lock:
+            if self._thread is None:
+                self._app = current_app._get_current_object()
+                self._thread = threading.Thread(target=self._run_flusher, name='unlock-debounce-flush', daemon=True)
+                self._thread.start()
+                atexit.register(self._flush_in_app_context)
+
+    def _run_flusher(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self._flush_in_app_context()
+            except Exception as e:
+                print(f"Failed to flush unlock times: {e}")
+
+    def _flush_in_app_context(self):
+        with self._app.app_context():
+            return self.flush()
+
+    def stop(self):
+        """Stop the flush thread after writing what is pending"""
+        self._stop.set()
+        if self._app is not None:
+            self._flush_in_app_context()
+
+
+# Singleton instance
+unlock_debouncer = UnlockDebouncer()
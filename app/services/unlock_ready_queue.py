@@ -0,0 +1,230 @@
+"""
+Unlock Ready Queue for instant Live Activity updates
+Keeps a few prepared study cards per user so a phone unlock can pop one instead of
+querying and formatting a card in the request path
+"""
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+from app.models import User, Card
+from app.config import Config
+from app.services.push_payloads import push_payloads
+from app.services.spaced_repetition import SpacedRepetitionService
+from app.utils.metrics import metrics
+from app import db
+
+UNLOCK_QUEUE_POPS = metrics.counter('unlock_ready_queue_pops_total', 'Unlock updates by ready queue result', ['result'])
+UNLOCK_QUEUE_INVALIDATIONS = metrics.counter('unlock_ready_queue_invalidations_total', 'User queues dropped')
+
+
+class PreparedCard:
+    """A study card chosen and formatted ahead of time; timestamps are stamped in when it is sent"""
+
+    __slots__ = ('card_id', 'content_type', 'content', 'next_review', 'state', 'prepared_at')
+
+    def __init__(self, card: Card):
+        self.card_id = card.id
+        self.content_type = card.content_type
+        self.content = card.front
+        self.next_review = card.next_review
+        self.state = push_payloads.study_card_state(card)
+        self.prepared_at = time.monotonic()
+
+    def payload(self) -> bytes:
+        """Live Activity update payload with the current timestamp and overdue flag"""
+        is_overdue = self.next_review is not None and datetime.utcnow() >= self.next_review
+        return push_payloads.stamp_study_card(self.state, is_overdue, "update")
+
+
+class UnlockReadyQueue:
+    """Per-user queues of prepared cards, refilled by a background thread
+
+    Queues are dropped when one of the user's cards is edited, reviewed or deleted,
+    and the total number of prepared cards is capped by evicting the least recently
+    used users. Entries older than max_age_seconds are discarded, which bounds how
+    stale a queue can get from edits made by other processes.
+    """
+
+    def __init__(self, depth=None, max_total=None, max_age_seconds=None):
+        self.depth = depth or Config.UNLOCK_QUEUE_DEPTH
+        self.max_total = max_total or Config.UNLOCK_QUEUE_MAX_PAYLOADS
+        self.max_age_seconds = max_age_seconds or Config.UNLOCK_QUEUE_MAX_AGE_SECONDS
+        self._queues = OrderedDict()  # user id -> deque of PreparedCard, least recently used first
+        self._total = 0
+        self._generations = {}  # user id -> invalidation count, so a refill racing an edit is discarded
+        self._lock = threading.Lock()
+
+        self._refill_requests = queue.Queue()
+        self._pending_refills = set()
+        self._app = None
+        self._thread = None
+
+    def __len__(self):
+        return self._total
+
+    # --- Consuming ---
+
+    def pop(self, user_id: int) -> Optional[PreparedCard]:
+        """Take the next prepared card for a user (None on a miss) and top the queue up in the background"""
+        now = time.monotonic()
+        prepared = None
+        with self._lock:
+            cards = self._queues.get(user_id)
+            while cards:
+                candidate = cards.popleft()
+                self._total -= 1
+                if now - candidate.prepared_at <= self.max_age_seconds:
+                    prepared = candidate
+                    break
+            if cards is not None:
+                self._queues.move_to_end(user_id)
+
+        UNLOCK_QUEUE_POPS.inc(result='hit' if prepared else 'miss')
+        self.request_refill(user_id)
+        return prepared
+
+    def prepare(self, user: User) -> Optional[PreparedCard]:
+        """Choose and format a card now (used on a miss and by the refill thread)"""
+        card = SpacedRepetitionService.random_study_card(user, due_probability=0.7)
+        return PreparedCard(card) if card else None
+
+    # --- Invalidation ---
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            cards = self._queues.pop(user_id, None)
+            if cards is None:
+                return
+            self._total -= len(cards)
+        UNLOCK_QUEUE_INVALIDATIONS.inc()
+
+    def clear(self):
+        with self._lock:
+            for user_id in self._queues:
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._queues.clear()
+            self._total = 0
+
+    # --- Refilling ---
+
+    def request_refill(self, user_id: int):
+        """Ask the background thread to top up a user's queue (no-op outside an app context)"""
+        if not self._ensure_worker():
+            return
+        with self._lock:
+            if user_id in self._pending_refills:
+                return
+            self._pending_refills.add(user_id)
+        self._refill_requests.put(user_id)
+
+    def refill(self, user_id: int) -> int:
+        """Prepare cards until the user's queue is `depth` deep; requires an app context"""
+        with self._lock:
+            generation = self._generations.get(user_id, 0)
+            missing = self.depth - len(self._queues.get(user_id, ()))
+        if missing <= 0:
+            return 0
+
+        user = db.session.get(User, user_id)
+        if not user or not user.live_activity_enabled:
+            return 0
+
+        # Prepared back to back, so avoid handing out the same card twice in a row
+        prepared, seen = [], set()
+        for _ in range(missing * 2):
+            if len(prepared) == missing:
+                break
+            card = self.prepare(user)
+            if card is None:
+                break
+            if card.card_id not in seen:
+                seen.add(card.card_id)
+                prepared.append(card)
+
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation or not prepared:
+                return 0
+            cards = self._queues.setdefault(user_id, deque())
+            self._queues.move_to_end(user_id)
+            prepared = prepared[:max(self.depth - len(cards), 0)]
+            cards.extend(prepared)
+            self._total += len(prepared)
+            self._evict_locked()
+        return len(prepared)
+
+    def _evict_locked(self):
+        """Drop whole queues of the least recently used users until under the cap"""
+        while self._total > self.max_total and self._queues:
+            _, cards = self._queues.popitem(last=False)
+            self._total -= len(cards)
+
+    def _ensure_worker(self) -> bool:
+        """Start the refill thread with the current app the first time it is needed"""
+        if self._thread is not None:
+            return True
+
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return False
+
+        with self._lock:
+            if self._thread is None:
+                self._app = current_app._get_current_object()
+                self._thread = threading.Thread(target=self._run_worker, name='unlock-ready-queue', daemon=True)
+                self._thread.start()
+        return True
+
+    def _run_worker(self):
+        while True:
+            user_id = self._refill_requests.get()
+            with self._lock:
+                self._pending_refills.discard(user_id)
+            try:
+                with self._app.app_context():
+                    self.refill(user_id)
+            except Exception as e:
+                print(f"Unlock ready queue refill failed for user {user_id}: {e}")
+
+
+# Singleton instance
+unlock_ready_queue = UnlockReadyQueue()
+
+metrics.gauge('unlock_ready_queue_size', 'Prepared cards across all users', callback=lambda: len(unlock_ready_queue))
+
+
+def _invalidate_now_and_after_commit(instance, user_id):
+    unlock_ready_queue.invalidate_user(user_id)
+    session = object_session(instance)
+    if session is not None:
+        session.info.setdefault('unlock_queue_users', set()).add(user_id)
+
+
+@event.listens_for(Card, 'after_insert')
+@event.listens_for(Card, 'after_update')
+@event.listens_for(Card, 'after_delete')
+def _invalidate_on_card_change(mapper, connection, card):
+    """Drop the owner's prepared cards now, and again after commit in case a refill read the old rows"""
+    _invalidate_now_and_after_commit(card, card.user_id)
+
+
+@event.listens_for(User, 'after_update')
+def _invalidate_on_recall_folders_change(mapper, connection, user):
+    if inspect(user).attrs.recall_folders.history.has_changes():
+        _invalidate_now_and_after_commit(user, user.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    for user_id in session.info.pop('unlock_queue_users', ()):
+        unlock_ready_queue.invalidate_user(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('unlock_queue_users', None)
@@ -0,0 +1,133 @@
+"""
+Background event loop for running async services from synchronous Flask code
+One long-lived loop in a daemon thread, so APNs connections and per-loop state are reused across requests
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Optional
+from sqlalchemy import event
+from app import db
+
+
+class BackgroundLoop:
+    """An asyncio event loop running forever in its own thread, started on first use"""
+
+    def __init__(self, name: str = 'async-runner'):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running loop, starting the thread if needed"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                ready = threading.Event()
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._loop, ready), name=self.name, daemon=True
+                )
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    @staticmethod
+    def _run(loop, ready):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable) -> Future:
+        """Schedule a coroutine on the loop and return a concurrent.futures.Future for its result
+
+        Coroutines must not use the database: a blocking query or commit would stall
+        every other coroutine on the loop, so callers do their database work first.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and block until it finishes (or raise on timeout)"""
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("BackgroundLoop.run() would deadlock when called from the loop thread")
+
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the loop and wait for its thread (a later submit starts a new one)"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+
+
+# Shared loop for the web process and scheduler threads
+background_loop = BackgroundLoop()
+
+
+def run_async(coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """Run a coroutine (such as an APNs send) on the shared loop from a Flask request or app context
+
+    The coroutine must not use the database; the caller does its queries and
+    writes in its own thread before and after.
+    """
+    from flask import has_app_context
+
+    if has_app_context():
+        _release_connection()
+    return background_loop.run(coro, timeout=timeout)
+
+
+def _release_connection():
+    """End the caller's read-only transaction so its pooled connection is free while it waits
+
+    Otherwise every blocked request holds a connection, and enough concurrent
+    requests exhaust the pool. A transaction that has written anything (pending,
+    flushed or bulk statements) is left open for the request to commit itself. The
+    read-only one is committed rather than rolled back, with expiry turned off, so
+    objects the request already loaded (such as g.current_user_obj) stay usable.
+    """
+    session = db.session()
+    if not session.in_transaction() or session.info.get('has_writes'):
+        return
+    if session.new or session.dirty or session.deleted:
+        return
+
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        session.commit()
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+
+@event.listens_for(db.session, 'after_flush')
+def _note_flush(session, flush_context):
+    session.info['has_writes'] = True
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _note_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['has_writes'] = True
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _forget_writes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('has_writes', None)
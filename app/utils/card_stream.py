@@ -0,0 +1,90 @@
+"""
+Incremental parsing of AI generation output
+Turns the Q<n>: / A<n>: / INFO<n>: line protocol into cards as the text streams in,
+and formats the server-sent events that relay them to the browser
+"""
+import re
+import json
+from typing import Any, Dict, List, Optional
+
+QUESTION_PATTERN = re.compile(r'^Q(\d+):\s*(.+)$', re.IGNORECASE)
+ANSWER_PATTERN = re.compile(r'^A(\d+):\s*(.+)$', re.IGNORECASE)
+INFO_PATTERN = re.compile(r'^INFO(\d+):\s*(.+)$', re.IGNORECASE)
+
+
+class CardLineParser:
+    """Line-protocol parser fed with arbitrary text fragments
+
+    A line is parsed once its newline arrives (or on close()), so a card is emitted
+    as soon as its answer or INFO line is complete. kind is 'flashcards',
+    'information' or 'mixed' and selects which line types are recognised; parsing
+    stops after max_items cards.
+    """
+
+    def __init__(self, kind: str, max_items: int):
+        self.flashcards = kind in ('flashcards', 'mixed')
+        self.information = kind in ('information', 'mixed')
+        self.max_items = max_items
+        self.count = 0
+        self._buffer = ''
+        self._question = None
+
+    @property
+    def done(self) -> bool:
+        return self.count >= self.max_items
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Cards completed by this fragment"""
+        self._buffer += text
+        if '\n' not in text:
+            return []
+        *lines, self._buffer = self._buffer.split('\n')
+        return self._parse_lines(lines)
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Cards completed by the final, unterminated line"""
+        rest, self._buffer = self._buffer, ''
+        return self._parse_lines([rest])
+
+    def parse(self, content: str) -> List[Dict[str, Any]]:
+        """Parse a complete reply in one go"""
+        return self.feed(content) + self.close()
+
+    def _parse_lines(self, lines: List[str]) -> List[Dict[str, Any]]:
+        cards = []
+        for line in lines:
+            if self.done:
+                break
+            card = self._parse_line(line.strip())
+            if card is not None:
+                cards.append(card)
+                self.count += 1
+        return cards
+
+    def _parse_line(self, line: str) -> Optional[Dict[str, Any]]:
+        if not line:
+            return None
+
+        if self.flashcards:
+            q_match = QUESTION_PATTERN.match(line)
+            if q_match:
+                self._question = q_match.group(2).strip()
+                return None
+
+            a_match = ANSWER_PATTERN.match(line)
+            if a_match and self._question:
+                question, self._question = self._question, None
+                return {'content_type': 'flashcard', 'front': question, 'back': a_match.group(2).strip()}
+
+        if self.information:
+            info_match = INFO_PATTERN.match(line)
+            if info_match:
+                return {'content_type': 'information', 'front': info_match.group(2).strip(), 'back': None}
+
+        return None
+
+
+def sse_event(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    """One server-sent event frame with a JSON payload; the id is sent back as Last-Event-ID on reconnect"""
+    frame = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{frame}event: {event}\ndata: {json.dumps(data)}\n\n"
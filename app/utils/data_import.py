@@ -4,21 +4,29 @@ Supports importing from CSV, Anki, and other formats
 """
 import csv
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from app.models import Card, User
+from app.services.duplicate_index import DuplicateBatch, duplicate_index
 from app import db
 
+# How near-duplicates of the user's cards (or of earlier rows) are handled:
+# 'skip' leaves them out, 'flag' imports them but reports them, 'allow' does not check
+DUPLICATE_MODES = ('skip', 'flag', 'allow')
+
 class DataImporter:
     """Utility class for importing cards from various formats"""
     
     @staticmethod
-    def import_from_csv(user_id: int, csv_content: str, delimiter: str = ',') -> Dict[str, Any]:
+    def import_from_csv(user_id: int, csv_content: str, delimiter: str = ',',
+                        on_duplicate: str = 'skip') -> Dict[str, Any]:
         """
         Import cards from CSV format
         Expected format: front,back,subject,tags
         """
         imported_cards = []
         errors = []
+        duplicates = []
+        checker = DataImporter._duplicate_checker(user_id, on_duplicate)
         
         try:
             # Parse CSV content
@@ -34,6 +42,10 @@ class DataImporter:
                     # Determine content type
                     content_type = 'flashcard' if row.get('back', '').strip() else 'information'
                     
+                    if DataImporter._is_skipped_duplicate(checker, on_duplicate, duplicates, 'row', row_num,
+                                                          row['front'], row.get('back')):
+                        continue
+                    
                     # Create card
                     card = Card(
                         user_id=user_id,
@@ -56,6 +68,8 @@ class DataImporter:
             return {
                 'success': True,
                 'imported_count': len(imported_cards),
+                'skipped_count': sum(1 for duplicate in duplicates if duplicate['skipped']),
+                'duplicates': duplicates,
                 'errors': errors,
                 'cards': [card.to_dict() for card in imported_cards]
             }
@@ -70,18 +84,20 @@ class DataImporter:
             }
     
     @staticmethod
-    def import_from_anki_json(user_id: int, json_content: str) -> Dict[str, Any]:
+    def import_from_anki_json(user_id: int, json_content: str, on_duplicate: str = 'skip') -> Dict[str, Any]:
         """
         Import cards from Anki JSON export format
         """
         imported_cards = []
         errors = []
+        duplicates = []
         
         try:
             data = json.loads(json_content)
             
             # Handle different Anki export formats
             cards_data = data.get('cards', data.get('notes', []))
+            checker = DataImporter._duplicate_checker(user_id, on_duplicate)
             
             for card_num, card_data in enumerate(cards_data, start=1):
                 try:
@@ -103,6 +119,10 @@ class DataImporter:
                     # Determine content type
                     content_type = 'flashcard' if back.strip() else 'information'
                     
+                    if DataImporter._is_skipped_duplicate(checker, on_duplicate, duplicates, 'card', card_num,
+                                                          front, back):
+                        continue
+                    
                     # Extract metadata
                     subject = card_data.get('deck', card_data.get('subject', ''))
                     tags = card_data.get('tags', [])
@@ -131,6 +151,8 @@ class DataImporter:
             return {
                 'success': True,
                 'imported_count': len(imported_cards),
+                'skipped_count': sum(1 for duplicate in duplicates if duplicate['skipped']),
+                'duplicates': duplicates,
                 'errors': errors,
                 'cards': [card.to_dict() for card in imported_cards]
             }
@@ -151,6 +173,32 @@ class DataImporter:
                 'errors': errors
             }
     
+    @staticmethod
+    def _duplicate_checker(user_id: int, on_duplicate: str) -> Optional[DuplicateBatch]:
+        if on_duplicate not in DUPLICATE_MODES:
+            raise ValueError(f"on_duplicate must be one of {', '.join(DUPLICATE_MODES)}")
+        return duplicate_index.batch(user_id) if on_duplicate != 'allow' else None
+    
+    @staticmethod
+    def _is_skipped_duplicate(checker: Optional[DuplicateBatch], on_duplicate: str, duplicates: List[Dict[str, Any]],
+                              label: str, number: int, front: str, back: Optional[str]) -> bool:
+        """Record a near-duplicate row in duplicates; True when it should be left out"""
+        if checker is None:
+            return False
+        
+        match = checker.check(front, back, key=number)
+        if match is None:
+            return False
+        
+        duplicate = {label: number, 'front': front.strip(), 'similarity': match['similarity'],
+                     'skipped': on_duplicate == 'skip'}
+        if match['card_id'] is not None:
+            duplicate['duplicate_of'] = match['card_id']
+        else:
+            duplicate[f'duplicate_of_{label}'] = match['batch_key']
+        duplicates.append(duplicate)
+        return duplicate['skipped']
+    
     @staticmethod
     def export_to_csv(user_id: int) -> str:
         """Export user's cards to CSV format"""
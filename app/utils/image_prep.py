@@ -0,0 +1,142 @@
+"""
+Image preprocessing for AI content generation
+Downscales and JPEG-encodes uploaded photos on a thread pool, drops exact duplicates,
+and keeps the base64 results for retries and regenerations
+"""
+import io
+import base64
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Union
+from PIL import Image
+from app.config import Config
+from app.utils.uploads import SpooledUpload, as_upload
+
+
+def target_size(width: int, height: int, max_dimension: int, max_short_side: int = 0) -> Tuple[int, int]:
+    """Largest size that fits in a max_dimension square (and max_short_side, if set) keeping the aspect ratio"""
+    scale = min(1.0, max_dimension / max(width, height))
+    if max_short_side:
+        scale = min(scale, max_short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+class ImagePreprocessor:
+    """Thread-pooled image downscaling with content-hash caching and exact-duplicate removal
+
+    JPEGs are decoded with Pillow's draft() so the decoder does a cheap DCT-domain
+    downscale (1/2, 1/4 or 1/8) before the final LANCZOS resize. Results are cached by
+    the upload's SHA-256 in an LRU bounded by `max_cache_bytes`; Pillow releases the
+    GIL while decoding and resizing, so a thread pool is enough for parallelism.
+    """
+
+    def __init__(self, workers=None, max_dimension=None, max_short_side=None,
+                 max_cache_bytes=None):
+        self.workers = workers or Config.IMAGE_PREP_WORKERS
+        self.max_dimension = max_dimension or Config.IMAGE_MAX_DIMENSION
+        self.max_short_side = Config.IMAGE_MAX_SHORT_SIDE if max_short_side is None else max_short_side
+        self.max_cache_bytes = max_cache_bytes or Config.IMAGE_CACHE_MAX_BYTES
+        self._cache = OrderedDict()  # sha256 -> base64 JPEG, least recently used first
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    # --- Single image ---
+
+    def encode(self, image_content: Union[bytes, SpooledUpload]) -> str:
+        """Base64 JPEG of one image, from the cache when it was seen before"""
+        return self._encode(as_upload(image_content))
+
+    def _encode(self, upload: SpooledUpload) -> str:
+        key = upload.sha256()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        with upload.open() as image_file:
+            image = Image.open(image_file)
+            size = target_size(image.width, image.height, self.max_dimension, self.max_short_side)
+            if image.format == 'JPEG':
+                image.draft('RGB', size)
+
+            # Convert to RGB if necessary
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            if image.size != size:
+                image.thumbnail(size, Image.Resampling.LANCZOS)
+
+            img_buffer = io.BytesIO()
+            image.save(img_buffer, format='JPEG', quality=85)
+
+        result = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+        self._store(key, result)
+        return result
+
+    # --- Batches ---
+
+    def encode_many(self, images: List[Union[bytes, SpooledUpload]]) -> List[str]:
+        """Base64 JPEGs for a batch, processed concurrently, in upload order
+
+        Identical files are processed once, and an image whose normalized JPEG is
+        byte-identical to an earlier one is dropped. Similar-looking images are kept:
+        photos of different pages of dense text can look alike at thumbnail size.
+        Images that fail to decode are skipped with a warning.
+        """
+        uploads, seen = [], set()
+        for image in images:
+            upload = as_upload(image)
+            if upload.sha256() not in seen:
+                seen.add(upload.sha256())
+                uploads.append(upload)
+
+        if len(uploads) > 1 and self.workers > 1:
+            futures = [self._pool().submit(self._encode, upload) for upload in uploads]
+        else:
+            futures = None
+
+        encoded = []
+        for index, upload in enumerate(uploads):
+            try:
+                data = futures[index].result() if futures else self._encode(upload)
+            except Exception as e:
+                print(f"Warning: Failed to process image: {e}")
+                continue
+            if data not in encoded:
+                encoded.append(data)
+        return encoded
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-prep')
+        return self._executor
+
+    # --- Cache ---
+
+    def _store(self, key: str, result: str):
+        size = len(result)
+        if size > self.max_cache_bytes:
+            return
+        with self._lock:
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._cache_bytes -= len(previous)
+            self._cache[key] = result
+            self._cache_bytes += size
+            while self._cache_bytes > self.max_cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+
+# Singleton instance
+image_preprocessor = ImagePreprocessor()
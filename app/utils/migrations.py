@@ -57,6 +57,24 @@ class DatabaseMigrator:
             print(f"Failed to add column '{column_name}' to table '{table_name}': {e}")
             return False
     
+    def add_index(self, index_name, table_name, column_names):
+        """Create an index if it does not exist"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            columns = ', '.join(column_names)
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns})")
+            conn.commit()
+            conn.close()
+            
+            print(f"Index '{index_name}' is present on table '{table_name}'")
+            return True
+            
+        except Exception as e:
+            print(f"Failed to create index '{index_name}' on table '{table_name}': {e}")
+            return False
+    
     def run_migration(self, migration_name, migration_func):
         """Run a migration with logging"""
         print(f"\n🔄 Running migration: {migration_name}")
@@ -100,6 +118,101 @@ def migrate_add_parent_folder_id():
     migrator = DatabaseMigrator()
     return migrator.add_column('folder', 'parent_folder_id', 'INTEGER', None)
 
+def migrate_add_next_recall_at():
+    """Migration: Add indexed next_recall_at column to User table for the recall scheduler"""
+    migrator = DatabaseMigrator()
+    success1 = migrator.add_column('user', 'next_recall_at', 'DATETIME', None)
+    success2 = migrator.add_index('ix_user_next_recall_at', 'user', ['next_recall_at'])
+    return success1 and success2
+
+def migrate_add_recall_schedule_columns():
+    """Migration: Add normalized recall schedule columns used by the SQL eligibility filter"""
+    from app.models import User
+    
+    migrator = DatabaseMigrator()
+    columns = [
+        ('recall_days_mask', 'INTEGER', 127),
+        ('recall_start_seconds', 'INTEGER', None),
+        ('recall_end_seconds', 'INTEGER', None),
+        ('sleep_start_seconds', 'INTEGER', None),
+        ('sleep_end_seconds', 'INTEGER', None)
+    ]
+    success = all(migrator.add_column('user', name, column_type, default) for name, column_type, default in columns)
+    if not success:
+        return False
+    
+    # Backfill the normalized columns from the existing settings
+    conn = migrator.get_connection()
+    cursor = conn.cursor()
+    rows = cursor.execute(
+        "SELECT id, recall_days_of_week, recall_start_time, recall_end_time, sleep_start, sleep_end FROM user"
+    ).fetchall()
+    updates = []
+    for user_id, days, start, end, sleep_start, sleep_end in rows:
+        normalized = User.recall_schedule_columns(days, start, end, sleep_start, sleep_end)
+        updates.append((
+            normalized['recall_days_mask'], normalized['recall_start_seconds'], normalized['recall_end_seconds'],
+            normalized['sleep_start_seconds'], normalized['sleep_end_seconds'], user_id
+        ))
+    cursor.executemany(
+        "UPDATE user SET recall_days_mask = ?, recall_start_seconds = ?, recall_end_seconds = ?, "
+        "sleep_start_seconds = ?, sleep_end_seconds = ? WHERE id = ?",
+        updates
+    )
+    conn.commit()
+    conn.close()
+    print(f"Backfilled recall schedule columns for {len(updates)} users")
+    
+    return success
+
+def migrate_add_card_review_index():
+    """Migration: Index cards by (user_id, next_review) for due-card counts and random sampling"""
+    migrator = DatabaseMigrator()
+    return migrator.add_index('ix_card_user_next_review', 'card', ['user_id', 'next_review'])
+
+def migrate_add_card_generation_id():
+    """Migration: Link AI-generated cards to the ContentGeneration job that created them"""
+    migrator = DatabaseMigrator()
+    success1 = migrator.add_column('card', 'generation_id', 'INTEGER', None)
+    success2 = migrator.add_index('ix_card_generation_id', 'card', ['generation_id'])
+    return success1 and success2
+
+def migrate_add_generation_cache_columns():
+    """Migration: Add generation cache hit and latency columns to ContentGeneration table"""
+    migrator = DatabaseMigrator()
+    columns = [
+        ('cache_hit', 'BOOLEAN', 0),
+        ('generation_ms', 'FLOAT', None),
+        ('latency_saved_ms', 'FLOAT', None)
+    ]
+    return all(migrator.add_column('content_generation', name, column_type, default) for name, column_type, default in columns)
+
+def migrate_add_card_minhash():
+    """Migration: Store a MinHash signature on every card for near-duplicate detection"""
+    from app.utils.minhash import signature, pack
+    
+    migrator = DatabaseMigrator()
+    success1 = migrator.add_column('card', 'minhash', 'BLOB', None)
+    success2 = migrator.add_column('content_generation', 'duplicates_skipped', 'INTEGER', 0)
+    if not (success1 and success2):
+        return False
+    
+    # Backfill signatures for existing cards
+    conn = migrator.get_connection()
+    cursor = conn.cursor()
+    rows = cursor.execute("SELECT id, front, back FROM card WHERE minhash IS NULL").fetchall()
+    updates = []
+    for card_id, front, back in rows:
+        sig = signature(front, back)
+        if sig:
+            updates.append((pack(sig), card_id))
+    cursor.executemany("UPDATE card SET minhash = ? WHERE id = ?", updates)
+    conn.commit()
+    conn.close()
+    print(f"Backfilled MinHash signatures for {len(updates)} cards")
+    
+    return True
+
 def run_all_migrations():
     """Run all pending migrations"""
     migrator = DatabaseMigrator()
@@ -109,6 +222,12 @@ def run_all_migrations():
         ("Add folder support", migrate_add_folders),
         ("Add recall_folders column", migrate_add_recall_folders),
         ("Add parent_folder_id for hierarchical folders", migrate_add_parent_folder_id),
+        ("Add next_recall_at for recall scheduler", migrate_add_next_recall_at),
+        ("Add normalized recall schedule columns", migrate_add_recall_schedule_columns),
+        ("Add card review index", migrate_add_card_review_index),
+        ("Add card generation_id", migrate_add_card_generation_id),
+        ("Add generation cache columns", migrate_add_generation_cache_columns),
+        ("Add card MinHash signatures", migrate_add_card_minhash),
         # Add future migrations here
     ]
     
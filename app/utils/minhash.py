@@ -0,0 +1,92 @@
+"""
+MinHash signatures for near-duplicate card detection
+One-permutation MinHash over character shingles of normalized card text: a single hash
+per shingle, so a signature costs well under a millisecond and packs into 256 bytes
+"""
+import re
+import struct
+import hashlib
+from typing import Optional, Set, Tuple
+
+NUM_HASHES = 64
+SHINGLE_SIZE = 4
+_VALUE_MASK = 0xFFFFFFFF
+_EMPTY = _VALUE_MASK + 1  # Larger than any stored value
+_ROTATION_OFFSET = 0x9E3779B1  # Keeps borrowed values distinct from the bin they came from
+_PACKED = struct.Struct(f'<{NUM_HASHES}I')
+_LANE_LOW_BITS = int.from_bytes(_PACKED.pack(*[1] * NUM_HASHES), 'little')
+
+Signature = Tuple[int, ...]
+
+
+def normalize_card_text(front: Optional[str], back: Optional[str] = None) -> str:
+    """Case-folded words of the front and back, ignoring punctuation and spacing"""
+    front_words = ' '.join(re.findall(r'\w+', (front or '').casefold()))
+    back_words = ' '.join(re.findall(r'\w+', (back or '').casefold()))
+    return f"{front_words} | {back_words}" if back_words else front_words
+
+
+def shingles(text: str) -> Set[str]:
+    """Overlapping SHINGLE_SIZE-character substrings (the whole text when shorter)"""
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def signature(front: Optional[str], back: Optional[str] = None) -> Optional[Signature]:
+    """NUM_HASHES-value MinHash of a card's text, or None when it has no words
+
+    Each shingle is hashed once; the low bits pick one of NUM_HASHES bins and the high
+    32 bits compete for that bin's minimum. Empty bins borrow from the next filled bin
+    to the right (rotation densification), so two signatures agree in a position with
+    probability close to the Jaccard similarity of the shingle sets.
+    """
+    items = shingles(normalize_card_text(front, back))
+    if not items:
+        return None
+
+    bins = [_EMPTY] * NUM_HASHES
+    for shingle in items:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        index = value % NUM_HASHES
+        value >>= 32
+        if value < bins[index]:
+            bins[index] = value
+
+    if _EMPTY in bins:
+        filled = list(bins)
+        for index in range(NUM_HASHES):
+            if filled[index] == _EMPTY:
+                step = 1
+                while filled[(index + step) % NUM_HASHES] == _EMPTY:
+                    step += 1
+                bins[index] = (filled[(index + step) % NUM_HASHES] + step * _ROTATION_OFFSET) & _VALUE_MASK
+    return tuple(bins)
+
+
+def similarity(first: Signature, second: Signature) -> float:
+    """Estimated Jaccard similarity: the fraction of positions where the signatures agree"""
+    return sum(a == b for a, b in zip(first, second)) / NUM_HASHES
+
+
+def packed_similarity(first: int, second: int) -> float:
+    """similarity() of two packed signatures read as little-endian integers, without unpacking
+
+    XOR leaves a 32-bit lane zero where the signatures agree; folding each lane onto its
+    lowest bit and counting those bits gives the disagreements in a few big-int operations.
+    """
+    diff = first ^ second
+    for shift in (16, 8, 4, 2, 1):
+        diff |= diff >> shift
+    return 1 - (diff & _LANE_LOW_BITS).bit_count() / NUM_HASHES
+
+
+def pack(sig: Signature) -> bytes:
+    return _PACKED.pack(*sig)
+
+
+def unpack(data: bytes) -> Optional[Signature]:
+    """Signature stored by pack(), or None for missing or malformed data"""
+    if not data or len(data) != _PACKED.size:
+        return None
+    return _PACKED.unpack(data)
@@ -0,0 +1,202 @@
+"""
+PDF text extraction for AI content generation
+Extracts pages in parallel worker processes and keeps the text of every PDF seen on
+disk, keyed by the file's SHA-256, so re-uploads skip extraction
+"""
+import os
+import json
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+import PyPDF2
+from app.config import Config
+from app.utils.uploads import SpooledUpload, as_upload
+
+# Workers are never forked from the web process: its scheduler, event loop and generation
+# threads may hold locks that a forked child would inherit in the locked state
+WORKER_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def page_intervals(spec: Optional[str]) -> List[Tuple[int, Optional[int]]]:
+    """Parse a 1-based selector like "1-5, 8, 12-" into (first, last) pairs (last None = to the end)
+
+    Raises ValueError for malformed selectors.
+    """
+    intervals = []
+    for part in (spec or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                first = int(start) if start.strip() else 1
+                last = int(end) if end.strip() else None
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid page range: {spec}")
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"Invalid page range: {spec}")
+        intervals.append((first, last))
+    return intervals
+
+
+def parse_page_range(spec: Optional[str], page_count: int) -> List[int]:
+    """Sorted 0-based page indices selected by spec; empty selects every page, pages past the end are ignored"""
+    intervals = page_intervals(spec)
+    if not intervals:
+        return list(range(page_count))
+
+    pages = set()
+    for first, last in intervals:
+        pages.update(range(first - 1, page_count if last is None else min(last, page_count)))
+    return sorted(pages)
+
+
+def _extract_pages(source: Union[str, bytes], page_indices: List[int]) -> Dict[int, str]:
+    """Extract the given pages from one parsed copy of the PDF (runs in a worker process)
+
+    source is the path of a spooled upload, which each worker maps itself so the file
+    is not pickled to every process, or the bytes of a small in-memory upload.
+    """
+    if isinstance(source, str):
+        upload = SpooledUpload(path=source, size=os.path.getsize(source))
+    else:
+        upload = SpooledUpload.from_bytes(source)
+    with upload.open() as f:
+        return _extract_from_reader(PyPDF2.PdfReader(f), page_indices)
+
+
+def _extract_from_reader(reader, page_indices: List[int]) -> Dict[int, str]:
+    return {index: reader.pages[index].extract_text() or '' for index in page_indices}
+
+
+class PdfTextExtractor:
+    """Page-parallel PyPDF2 extraction with a per-page disk cache
+
+    Documents with at least `parallel_min_pages` uncached pages are split into
+    contiguous page batches, one per worker process; smaller ones are extracted in
+    the calling thread. Cached text lives in `<cache_dir>/<sha256>.json`, holding
+    only the pages extracted so far, and the directory is trimmed to `max_cache_bytes`
+    by dropping the least recently used files.
+    """
+
+    def __init__(self, workers=None, parallel_min_pages=None, cache_dir=None, max_cache_bytes=None):
+        self.workers = workers or Config.PDF_EXTRACT_WORKERS
+        self.parallel_min_pages = parallel_min_pages or Config.PDF_PARALLEL_MIN_PAGES
+        self.cache_dir = Config.PDF_TEXT_CACHE_DIR if cache_dir is None else cache_dir
+        self.max_cache_bytes = max_cache_bytes or Config.PDF_TEXT_CACHE_MAX_BYTES
+        self._pool = None
+        self._lock = threading.Lock()
+
+    # --- Extraction ---
+
+    def extract(self, pdf_content: Union[bytes, SpooledUpload], page_range: Optional[str] = None) -> str:
+        """Text of the selected pages (all by default) in page order"""
+        upload = as_upload(pdf_content)
+        digest = upload.sha256()
+        cached = self._read_cache(digest)
+
+        with upload.open() as f:
+            reader = None
+            if cached is not None:
+                page_count, pages = cached['page_count'], cached['pages']
+            else:
+                reader = PyPDF2.PdfReader(f)
+                page_count, pages = len(reader.pages), {}
+
+            selected = parse_page_range(page_range, page_count)
+            missing = [index for index in selected if index not in pages]
+            if missing:
+                pages.update(self._extract(upload, missing, reader or PyPDF2.PdfReader(f)))
+                self._write_cache(digest, page_count, pages)
+
+        return '\n'.join(pages[index] for index in selected if pages[index]).strip()
+
+    def _extract(self, upload: SpooledUpload, page_indices: List[int], reader) -> Dict[int, str]:
+        if self.workers <= 1 or len(page_indices) < self.parallel_min_pages:
+            return _extract_from_reader(reader, page_indices)
+
+        batch_count = min(self.workers, len(page_indices))
+        size = -(-len(page_indices) // batch_count)
+        batches = [page_indices[i:i + size] for i in range(0, len(page_indices), size)]
+        source = upload.path or upload.read()
+        try:
+            pages = {}
+            for result in self._executor().map(_extract_pages, [source] * len(batches), batches):
+                pages.update(result)
+            return pages
+        except Exception as e:
+            # A crashed or unavailable pool should not fail the generation
+            print(f"Warning: Parallel PDF extraction failed, extracting in-process: {e}")
+            self._reset_executor()
+            return _extract_from_reader(reader, page_indices)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(WORKER_START_METHOD)
+                )
+            return self._pool
+
+    def _reset_executor(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- Disk cache ---
+
+    def _cache_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _read_cache(self, digest: str) -> Optional[dict]:
+        if not self.cache_dir:
+            return None
+        path = self._cache_path(digest)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            os.utime(path)  # Mark as recently used for eviction
+        except (OSError, ValueError):
+            return None
+        return {'page_count': data['page_count'], 'pages': {int(index): text for index, text in data['pages'].items()}}
+
+    def _write_cache(self, digest: str, page_count: int, pages: Dict[int, str]):
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write then rename so concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'page_count': page_count, 'pages': pages}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._cache_path(digest))
+            self._evict()
+        except OSError as e:
+            print(f"Warning: Failed to cache PDF text: {e}")
+
+    def _evict(self):
+        """Delete least recently used cache files while the directory is over max_cache_bytes"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+# Singleton instance
+pdf_text_extractor = PdfTextExtractor()
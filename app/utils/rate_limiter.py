@@ -0,0 +1,258 @@
+"""
+Sliding-window rate limiting for Active Recall
+Keeps a bounded in-memory log per key, or a shared SQLite log for multi-worker runs
+"""
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+
+
+class MemoryRateLimitStore:
+    """In-process hit log with LRU eviction of idle keys"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._hits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hits_since(self, key, since, limit):
+        """Return the recorded timestamps for key newer than since (oldest first)"""
+        with self._lock:
+            log = self._hits.get(key)
+            if not log:
+                return []
+            while log and log[0] <= since:
+                log.popleft()
+            return list(log)
+
+    def add(self, key, now, limit):
+        """Record a hit for key, keeping at most limit timestamps"""
+        with self._lock:
+            self._append(key, now, limit)
+
+    def _append(self, key, now, limit):
+        log = self._hits.get(key)
+        if log is None:
+            log = deque(maxlen=limit)
+            self._hits[key] = log
+            # Evict the least recently used keys once the table is full
+            while len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+        else:
+            self._hits.move_to_end(key)
+        log.append(now)
+
+    def add_if_under(self, key, now, since, limit):
+        """Atomically record a hit unless key already has limit hits newer than since
+
+        Returns the timestamps that blocked the hit (oldest first), or [] when it was recorded.
+        """
+        with self._lock:
+            log = self._hits.get(key)
+            if log:
+                while log and log[0] <= since:
+                    log.popleft()
+                if len(log) >= limit:
+                    return list(log)
+            self._append(key, now, limit)
+            return []
+
+    def remove(self, key, ts):
+        """Forget one recorded hit for key, if it is still there"""
+        with self._lock:
+            log = self._hits.get(key)
+            if log and ts in log:
+                log.remove(ts)
+
+    def clear(self, key):
+        """Forget all hits for key"""
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def __len__(self):
+        return len(self._hits)
+
+
+class SQLiteRateLimitStore:
+    """Hit log shared between worker processes through a small SQLite file"""
+
+    def __init__(self, db_path, max_age_seconds=3600, table='rate_limit_hit'):
+        # Limiters with different windows need their own table: the purge in add()
+        # drops every row older than this store's max_age_seconds
+        if not table.isidentifier():
+            raise ValueError(f"Invalid rate limit table name: {table!r}")
+        self.db_path = db_path
+        self.max_age_seconds = max_age_seconds
+        self.table = table
+        self._local = threading.local()
+        self._last_purge = 0.0
+
+        conn = self._connection()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_key_ts ON {table} (key, ts)"
+        )
+        conn.commit()
+
+    def _connection(self):
+        """Get this thread's connection to the shared store"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def hits_since(self, key, since, limit):
+        """Return the recorded timestamps for key newer than since (oldest first)"""
+        rows = self._connection().execute(
+            f"SELECT ts FROM (SELECT ts FROM {self.table} WHERE key = ? AND ts > ? "
+            "ORDER BY ts DESC LIMIT ?) ORDER BY ts ASC",
+            (key, since, limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def add(self, key, now, limit):
+        """Record a hit for key and periodically drop expired rows"""
+        conn = self._connection()
+        conn.execute(f"INSERT INTO {self.table} (key, ts) VALUES (?, ?)", (key, now))
+
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            conn.execute(f"DELETE FROM {self.table} WHERE ts < ?", (now - self.max_age_seconds,))
+
+    def add_if_under(self, key, now, since, limit):
+        """Atomically record a hit unless key already has limit hits newer than since
+
+        BEGIN IMMEDIATE takes the write lock up front, so two workers cannot both
+        see room for the same hit.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            hits = self.hits_since(key, since, limit)
+            if len(hits) >= limit:
+                conn.execute("COMMIT")
+                return hits
+            self.add(key, now, limit)
+            conn.execute("COMMIT")
+            return []
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def remove(self, key, ts):
+        """Forget one recorded hit for key, if it is still there"""
+        self._connection().execute(
+            f"DELETE FROM {self.table} WHERE rowid = (SELECT rowid FROM {self.table} WHERE key = ? AND ts = ? LIMIT 1)",
+            (key, ts)
+        )
+
+    def clear(self, key):
+        """Forget all hits for key"""
+        self._connection().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+
+class SlidingWindowRateLimiter:
+    """Allow at most `limit` hits per key within a sliding `window_seconds` window"""
+
+    def __init__(self, limit, window_seconds, store=None):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.store = store if store is not None else MemoryRateLimitStore()  # An empty store is falsy (__len__)
+
+    def retry_after(self, key, now=None):
+        """Seconds until key may be hit again (0 when it is allowed now)"""
+        now = time.time() if now is None else now
+        hits = self.store.hits_since(key, now - self.window_seconds, self.limit)
+        if len(hits) < self.limit:
+            return 0
+        return max(0.0, hits[-self.limit] + self.window_seconds - now)
+
+    def is_allowed(self, key, now=None):
+        """Check whether key is currently under its limit"""
+        return self.retry_after(key, now) == 0
+
+    def hit(self, key, now=None):
+        """Record a hit for key"""
+        now = time.time() if now is None else now
+        self.store.add(key, now, self.limit)
+
+    def acquire(self, key, now=None):
+        """Record a hit only if key is under its limit, atomically
+
+        Returns 0 when the hit was recorded, otherwise the seconds until it would be allowed.
+        """
+        now = time.time() if now is None else now
+        hits = self.store.add_if_under(key, now, now - self.window_seconds, self.limit)
+        if not hits:
+            return 0
+        return max(0.0, hits[-self.limit] + self.window_seconds - now)
+
+    def release(self, key, now):
+        """Give back the hit acquire() recorded for key at now"""
+        self.store.remove(key, now)
+
+    def reset(self, key):
+        """Clear the history for key"""
+        self.store.clear(key)
+
+
+class LoginRateLimiter:
+    """Throttle login attempts by client IP and by account identifier"""
+
+    def __init__(self, ip_limit=20, account_limit=5, window_seconds=300,
+                 max_keys=10000, storage_path=None):
+        if storage_path:
+            store = SQLiteRateLimitStore(storage_path, max_age_seconds=window_seconds)
+        else:
+            store = MemoryRateLimitStore(max_keys=max_keys)
+
+        self.by_ip = SlidingWindowRateLimiter(ip_limit, window_seconds, store)
+        self.by_account = SlidingWindowRateLimiter(account_limit, window_seconds, store)
+
+    @staticmethod
+    def _ip_key(ip_address):
+        return f"login:ip:{ip_address or 'unknown'}"
+
+    @staticmethod
+    def _account_key(username_or_email):
+        return f"login:account:{(username_or_email or '').strip().lower()}"
+
+    def check(self, ip_address, username_or_email):
+        """Return seconds the caller must wait before trying again (0 = allowed)"""
+        now = time.time()
+        return max(
+            self.by_ip.retry_after(self._ip_key(ip_address), now),
+            self.by_account.retry_after(self._account_key(username_or_email), now)
+        )
+
+    def acquire(self, ip_address, username_or_email, now):
+        """Reserve an attempt against both the IP and the account before the password is checked
+
+        Returns 0 when the attempt was recorded, otherwise the seconds the caller must
+        wait. Reserving up front means concurrent attempts cannot all pass a check made
+        before any of them failed, and throttled ones never reach the password hash.
+        A failed attempt simply keeps its reservation.
+        """
+        ip_key = self._ip_key(ip_address)
+        retry_after = self.by_ip.acquire(ip_key, now)
+        if retry_after:
+            return retry_after
+        retry_after = self.by_account.acquire(self._account_key(username_or_email), now)
+        if retry_after:
+            self.by_ip.release(ip_key, now)
+        return retry_after
+
+    def record_success(self, ip_address, username_or_email, now):
+        """Give back the IP attempt reserved at now and clear the account's failure history"""
+        self.by_ip.release(self._ip_key(ip_address), now)
+        self.by_account.reset(self._account_key(username_or_email))
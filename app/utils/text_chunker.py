@@ -0,0 +1,134 @@
+"""
+Token-bounded text chunking for LLM prompts
+Splits long source material into overlapping segments on paragraph and sentence
+boundaries, and spreads a card budget over the segments by size
+"""
+import re
+from functools import lru_cache
+from typing import List
+
+try:
+    import tiktoken
+except ImportError:  # Optional dependency; token counts fall back to an estimate
+    tiktoken = None
+
+CHARS_PER_TOKEN = 4  # Rough average for English text when tiktoken is unavailable
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """The gpt-4o / gpt-4o-mini tokenizer, or None to estimate
+
+    Loaded on first use rather than at import: on a cold cache tiktoken downloads
+    the BPE file, which would block (or, offline, fail) app startup.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding('o200k_base')
+    except Exception as e:
+        print(f"Warning: tiktoken encoding unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Number of model tokens in text (estimated from length without tiktoken)"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _split_oversized(text: str, tokens: int, max_tokens: int) -> List[str]:
+    """Cut a single paragraph/sentence that is larger than a chunk at whitespace"""
+    window = max(1, int(len(text) * max_tokens / tokens * 0.95))
+    pieces = []
+    while len(text) > window:
+        cut = text.rfind(' ', window // 2, window)
+        cut = window if cut == -1 else cut
+        pieces.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def _units(text: str, max_tokens: int) -> List[tuple]:
+    """Break text into (piece, tokens) units no larger than max_tokens, preferring paragraphs, then sentences"""
+    units = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        if tokens <= max_tokens:
+            units.append((paragraph, tokens))
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            tokens = count_tokens(sentence)
+            if tokens <= max_tokens:
+                units.append((sentence, tokens))
+            else:
+                units.extend((piece, count_tokens(piece)) for piece in _split_oversized(sentence, tokens, max_tokens))
+    return units
+
+
+def chunk_text(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """Split text into chunks of at most max_tokens, each starting with up to
+    overlap_tokens of the previous chunk's tail so facts on a boundary are kept whole
+    """
+    text = (text or '').strip()
+    if not text:
+        return []
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    chunks = []
+    current, current_tokens = [], 0
+    for unit in _units(text, max_tokens):
+        if current and current_tokens + unit[1] > max_tokens:
+            chunks.append(current)
+            # Carry whole trailing units into the next chunk, never the entire previous chunk
+            carried, carried_tokens = [], 0
+            for previous in reversed(current[1:]):
+                if carried_tokens + previous[1] > overlap_tokens or carried_tokens + previous[1] + unit[1] > max_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous[1]
+            current, current_tokens = carried, carried_tokens
+        current.append(unit)
+        current_tokens += unit[1]
+    if current:
+        chunks.append(current)
+
+    return ['\n\n'.join(piece for piece, _ in chunk) for chunk in chunks]
+
+
+def allocate_budget(sizes: List[int], budget: int) -> List[int]:
+    """Split budget over chunks in proportion to their sizes
+
+    Each unit of budget goes to the chunk containing its evenly spaced position in
+    the concatenated text, so allocations always sum to budget and, when there are
+    more chunks than budget, the chunks that get one are spread across the source.
+    """
+    total = sum(sizes)
+    allocation = [0] * len(sizes)
+    if budget <= 0 or not sizes:
+        return allocation
+    if total <= 0:
+        sizes, total = [1] * len(sizes), len(sizes)
+
+    index, end = 0, sizes[0]
+    for k in range(budget):
+        position = (k + 0.5) * total / budget
+        while position > end and index < len(sizes) - 1:
+            index += 1
+            end += sizes[index]
+        allocation[index] += 1
+    return allocation
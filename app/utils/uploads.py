@@ -0,0 +1,306 @@
+"""
+Spooled upload handling for content generation
+In views marked with accepts_uploads, UploadRequest makes werkzeug parse each uploaded
+file into an UploadSpool, which checks the size limits on every chunk it is given, so an
+oversized upload is rejected mid-body and large PDFs and photos live in a single
+temporary file instead of request memory
+"""
+import io
+import os
+import mmap
+import hashlib
+import tempfile
+from functools import wraps
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional, Union
+from flask import Request, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.config import Config
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """An upload exceeded its per-file or per-request size limit"""
+
+
+class UploadBudget:
+    """Running total of bytes spooled for one request, capped at max_bytes"""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or Config.UPLOAD_MAX_REQUEST_BYTES
+        self.used = 0
+
+    def consume(self, size: int):
+        self.used += size
+        if self.used > self.max_bytes:
+            raise UploadTooLarge(f"Uploads exceed the {self.max_bytes // (1024 * 1024)} MB limit per request")
+
+
+def _file_limit(filename: str) -> int:
+    """Per-file cap for an upload, going by its name as it arrives"""
+    return Config.UPLOAD_MAX_PDF_BYTES if filename.lower().endswith('.pdf') else Config.UPLOAD_MAX_IMAGE_BYTES
+
+
+class UploadSpool:
+    """Writable stream werkzeug parses one uploaded file into
+
+    Keeps the file in memory while small and spills it to a temporary file once it
+    grows, hashing it on the way. Limits are checked on every write; crossing one
+    raises RequestEntityTooLarge, which stops the multipart parser (a ValueError
+    would be swallowed by it) and becomes a 413.
+    """
+
+    def __init__(self, filename: str = '', max_bytes: Optional[int] = None,
+                 budget: Optional[UploadBudget] = None, memory_limit: Optional[int] = None):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.budget = budget
+        self.memory_limit = Config.UPLOAD_SPOOL_MEMORY_BYTES if memory_limit is None else memory_limit
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = io.BytesIO()
+        self._spilled = False
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"{self.filename or 'Upload'} is larger than {self.max_bytes // (1024 * 1024)} MB")
+        if self.budget is not None:
+            try:
+                self.budget.consume(len(data))
+            except UploadTooLarge as e:
+                raise RequestEntityTooLarge(str(e))
+        self._digest.update(data)
+
+        if not self._spilled and self.size > self.memory_limit:
+            spill = tempfile.NamedTemporaryFile(prefix='upload-', dir=Config.UPLOAD_TMP_DIR or None, delete=False)
+            spill.write(self._file.getvalue())
+            self._file = spill
+            self._spilled = True
+        return self._file.write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def readline(self, size: int = -1) -> bytes:
+        return self._file.readline(size)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def seekable(self) -> bool:
+        return True
+
+    def detach(self) -> 'SpooledUpload':
+        """Hand the contents over to a SpooledUpload without copying them"""
+        if self._spilled:
+            self._file.close()
+            upload = SpooledUpload(self.filename, path=self._file.name, size=self.size)
+        else:
+            upload = SpooledUpload(self.filename, data=self._file.getvalue(), size=self.size)
+        upload._sha256 = self._digest.hexdigest()
+        self._file = io.BytesIO()
+        self._spilled = False
+        return upload
+
+    def close(self):
+        """Delete the temporary file unless detach() handed it over"""
+        if self._spilled:
+            self._file.close()
+            try:
+                os.unlink(self._file.name)
+            except OSError:
+                pass
+            self._spilled = False
+        self._file = io.BytesIO()
+
+
+class UploadRequest(Request):
+    """Request class that parses uploaded files into size-capped UploadSpools
+
+    Only requests to views marked with accepts_uploads get the spools and the
+    UPLOAD_MAX_BODY_BYTES body limit; every other endpoint keeps MAX_CONTENT_LENGTH
+    and werkzeug's own file handling.
+    """
+
+    accepts_uploads = False
+
+    @property
+    def max_content_length(self) -> Optional[int]:
+        if self.accepts_uploads:
+            return Config.UPLOAD_MAX_BODY_BYTES
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not self.accepts_uploads:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        if 'upload_budget' not in self.__dict__:
+            self.upload_budget = UploadBudget()
+            self.upload_spools = []
+        spool = UploadSpool(filename or '', _file_limit(filename or ''), self.upload_budget)
+        self.upload_spools.append(spool)
+        return spool
+
+    def close(self):
+        # Also removes the spools of a body that was rejected part-way through parsing
+        super().close()
+        for spool in self.__dict__.get('upload_spools', ()):
+            spool.close()
+
+
+def accepts_uploads(view):
+    """Decorator for views that take generation uploads: spooled files and the larger body limit
+
+    Must run before the view first touches request.form, request.files or the body.
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        request.accepts_uploads = True
+        return view(*args, **kwargs)
+
+    return decorated_function
+
+
+class SpooledUpload:
+    """An uploaded file kept in memory while small and in a temporary file once it grows
+
+    Consumers read it through open(), which yields a seekable binary file: a BytesIO
+    for small files, or a read-only memory map of the temporary file, so large files
+    are paged in by the OS rather than copied into the Python heap. The owner must
+    call close() to remove the temporary file.
+    """
+
+    def __init__(self, filename: str = '', data: Optional[bytes] = None, path: Optional[str] = None, size: int = 0):
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self._data = data
+        self._sha256 = None
+
+    @classmethod
+    def from_bytes(cls, data: bytes, filename: str = '') -> 'SpooledUpload':
+        return cls(filename, data=data, size=len(data))
+
+    @classmethod
+    def from_file_storage(cls, file_storage, max_bytes: Optional[int] = None,
+                          budget: Optional[UploadBudget] = None) -> 'SpooledUpload':
+        """Take over a parsed upload, raising UploadTooLarge if it is over max_bytes
+
+        Files parsed by UploadRequest are already spooled and counted against the
+        request's budget, so they are adopted as they are; other streams are copied.
+        """
+        stream = file_storage.stream
+        if not isinstance(stream, UploadSpool):
+            return cls.spool(stream, file_storage.filename, max_bytes, budget)
+        if max_bytes is not None and stream.size > max_bytes:
+            raise UploadTooLarge(f"{file_storage.filename or 'Upload'} is larger than {max_bytes // (1024 * 1024)} MB")
+        return stream.detach()
+
+    @classmethod
+    def spool(cls, stream: BinaryIO, filename: str = '', max_bytes: Optional[int] = None,
+              budget: Optional[UploadBudget] = None, memory_limit: Optional[int] = None) -> 'SpooledUpload':
+        """Copy a stream in chunks, raising UploadTooLarge as soon as a limit is crossed"""
+        memory_limit = Config.UPLOAD_SPOOL_MEMORY_BYTES if memory_limit is None else memory_limit
+        digest = hashlib.sha256()
+        buffer = bytearray()
+        spill = None
+        size = 0
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLarge(f"{filename or 'Upload'} is larger than {max_bytes // (1024 * 1024)} MB")
+                if budget is not None:
+                    budget.consume(len(chunk))
+                digest.update(chunk)
+
+                if spill is None and len(buffer) + len(chunk) > memory_limit:
+                    spill = tempfile.NamedTemporaryFile(prefix='upload-', dir=Config.UPLOAD_TMP_DIR or None, delete=False)
+                    spill.write(buffer)
+                    buffer = None
+                if spill is not None:
+                    spill.write(chunk)
+                else:
+                    buffer.extend(chunk)
+        except BaseException:
+            if spill is not None:
+                spill.close()
+                os.unlink(spill.name)
+            raise
+
+        if spill is not None:
+            spill.close()
+            upload = cls(filename, path=spill.name, size=size)
+        else:
+            upload = cls(filename, data=bytes(buffer), size=size)
+        upload._sha256 = digest.hexdigest()
+        return upload
+
+    @contextmanager
+    def open(self) -> Iterator[BinaryIO]:
+        """Seekable read-only view of the contents"""
+        if self.path is None or self.size == 0:
+            yield io.BytesIO(self._data or b'')
+            return
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield mapped
+            finally:
+                mapped.close()
+
+    def read(self) -> bytes:
+        """Whole contents as bytes (only for small files and fallbacks)"""
+        with self.open() as f:
+            return f.read()
+
+    def head(self, length: int = 8) -> bytes:
+        with self.open() as f:
+            return f.read(length)
+
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            with self.open() as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE * 16), b''):
+                    digest.update(chunk)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+    def __len__(self):
+        return self.size
+
+    def detach(self) -> 'SpooledUpload':
+        """Move the contents (and the duty to close them) to a new SpooledUpload
+
+        Leaves this one empty, so closing it afterwards cannot delete a file the new owner still reads.
+        """
+        upload = SpooledUpload(self.filename, data=self._data, path=self.path, size=self.size)
+        upload._sha256 = self._sha256
+        self.path = None
+        self._data = None
+        return upload
+
+    def close(self):
+        """Delete the temporary file, if any"""
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.path = None
+        self._data = None
+
+
+def as_upload(content: Union[bytes, SpooledUpload, None]) -> Optional[SpooledUpload]:
+    """Accept raw bytes (older callers) or a SpooledUpload"""
+    if content is None or isinstance(content, SpooledUpload):
+        return content
+    return SpooledUpload.from_bytes(content)
@@ -5,4 +5,4 @@ from flask import Blueprint
 
 web_bp = Blueprint('web', __name__)
 
-from app.web import routes, auth_routes, notification_routes
\ No newline at end of file
+from app.web import routes, auth_routes, notification_routes, metrics_routes
\ No newline at end of file
@@ -23,6 +23,9 @@ def login():
             # Set session
             session['session_token'] = result['session_token']
             return redirect(url_for('web.index'))
+        elif result.get('rate_limited'):
+            return render_template('auth/login.html', error=result['error']), 429, \
+                {'Retry-After': str(result['retry_after'])}
         else:
             return render_template('auth/login.html', error=result['error'])
     
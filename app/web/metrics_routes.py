@@ -0,0 +1,19 @@
+"""
+Metrics web route
+"""
+import hmac
+from flask import Response, request, current_app
+from app.web import web_bp
+from app.utils.metrics import metrics, CONTENT_TYPE
+
+@web_bp.route('/metrics')
+def prometheus_metrics():
+    """Process metrics in Prometheus text format"""
+    # Optional shared secret so scrapes can be restricted outside private networks
+    token = current_app.config.get('METRICS_AUTH_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '').replace('Bearer ', '', 1)
+        if not hmac.compare_digest(supplied, token):
+            return Response('Unauthorized\n', status=401, content_type='text/plain')
+    
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
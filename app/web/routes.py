@@ -5,14 +5,13 @@ from flask import render_template, request, jsonify, redirect, url_for, session,
 from app.web import web_bp
 from app.models import User, Card, Folder
 from app.services.spaced_repetition import SpacedRepetitionService
-from app.services.ai_content_generator import AIContentGenerator
+from app.services.generation_jobs import generation_jobs
+from app.utils.uploads import SpooledUpload, UploadBudget, UploadTooLarge, accepts_uploads
+from app.config import Config
 from app.services.auth_service import AuthService
-from app.middleware.auth_middleware import login_required, optional_auth
+from app.middleware.auth_middleware import login_required, optional_auth, get_current_user_obj
 from app import db
 
-# Initialize services
-ai_generator = AIContentGenerator()
-
 @web_bp.route('/')
 @login_required
 def index():
@@ -61,7 +60,7 @@ def get_user(user_id):
     if g.current_user['id'] != user_id:
         return jsonify({"error": "Access denied"}), 403
     
-    user = User.query.get(user_id)
+    user = get_current_user_obj(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
@@ -75,11 +74,11 @@ def get_user_stats(user_id):
     if g.current_user['id'] != user_id:
         return jsonify({"error": "Access denied"}), 403
     
-    user = User.query.get(user_id)
+    user = get_current_user_obj(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    stats = SpacedRepetitionService.get_user_stats(user_id)
+    stats = SpacedRepetitionService.get_user_stats(user)
     return jsonify(stats)
 
 @web_bp.route('/users/<int:user_id>/cards')
@@ -90,7 +89,7 @@ def get_user_cards(user_id):
     if g.current_user['id'] != user_id:
         return jsonify({"error": "Access denied"}), 403
     
-    user = User.query.get(user_id)
+    user = get_current_user_obj(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
@@ -143,6 +142,7 @@ def create_card():
     }), 201
 
 @web_bp.route('/generate-content', methods=['POST'])
+@accepts_uploads
 @login_required
 def generate_content():
     """Generate content (web interface compatibility)"""
@@ -160,23 +160,33 @@ def generate_content():
         if focus_areas:
             focus_areas_list = [area.strip() for area in focus_areas.split(',') if area.strip()]
         
-        # Process uploaded files
+        # Uploads were spooled and size-checked as the body was parsed (UploadRequest); adopt them as they are
         pdf_content = None
         images = []
+        budget = UploadBudget()
         
-        # Handle PDF upload
-        if 'pdf_file' in request.files:
-            pdf_file = request.files['pdf_file']
-            if pdf_file and pdf_file.filename and pdf_file.filename.lower().endswith('.pdf'):
-                pdf_content = pdf_file.read()
-        
-        # Handle image uploads
-        if 'images' in request.files:
-            image_files = request.files.getlist('images')
-            for image_file in image_files[:5]:  # Limit to 5 images
-                if image_file and image_file.filename:
-                    image_content = image_file.read()
-                    images.append(image_content)
+        try:
+            # Handle PDF upload
+            if 'pdf_file' in request.files:
+                pdf_file = request.files['pdf_file']
+                if pdf_file and pdf_file.filename and pdf_file.filename.lower().endswith('.pdf'):
+                    pdf_content = SpooledUpload.from_file_storage(
+                        pdf_file, Config.UPLOAD_MAX_PDF_BYTES, budget
+                    )
+            
+            # Handle image uploads
+            if 'images' in request.files:
+                image_files = request.files.getlist('images')
+                for image_file in image_files[:5]:  # Limit to 5 images
+                    if image_file and image_file.filename:
+                        images.append(SpooledUpload.from_file_storage(
+                            image_file, Config.UPLOAD_MAX_IMAGE_BYTES, budget
+                        ))
+        except UploadTooLarge as e:
+            for upload in [pdf_content] + images:
+                if upload is not None:
+                    upload.close()
+            return jsonify({"error": str(e)}), 413
     else:
         # Handle JSON data (legacy compatibility)
         data = request.json or {}
@@ -191,58 +201,35 @@ def generate_content():
     user_id = g.current_user['id']
     
     # Validate that at least one input is provided
+    error = None
     if not source_material and not pdf_content and not images:
-        return jsonify({"error": "Source material, PDF, or images are required"}), 400
-    
-    if not ai_generator.is_available():
-        return jsonify({
+        error = ({"error": "Source material, PDF, or images are required"}, 400)
+    elif generation_type not in ['flashcards', 'information', 'mixed']:
+        error = ({"error": "Invalid generation_type"}, 400)
+    elif not generation_jobs.is_available():
+        error = ({
             "error": "AI content generation not configured. Please set OPENAI_API_KEY environment variable."
-        }), 503
-    
-    try:
-        if generation_type == 'flashcards':
-            generated_items = ai_generator.generate_flashcards(
-                source_material, subject, max_cards, focus_areas_list, images, pdf_content
-            )
-        elif generation_type == 'information':
-            generated_items = ai_generator.generate_information_pieces(
-                source_material, subject, max_cards, focus_areas_list, images, pdf_content
-            )
-        elif generation_type == 'mixed':
-            generated_items = ai_generator.generate_mixed_content(
-                source_material, subject, max_cards, focus_areas_list, images, pdf_content
-            )
-        else:
-            return jsonify({"error": "Invalid generation_type"}), 400
-        
-        created_cards = []
-        for item in generated_items:
-            card = Card(
-                user_id=user_id,
-                content_type=item['content_type'],
-                front=item['front'],
-                back=item.get('back'),
-                subject=subject,
-                is_ai_generated=True
-            )
-            db.session.add(card)
-            created_cards.append({
-                'content_type': item['content_type'],
-                'front': item['front'],
-                'back': item.get('back')
-            })
-        
-        db.session.commit()
-        
-        return jsonify({
-            "message": "Content generated successfully",
-            "generation_id": "web-generated",
-            "cards_generated": len(created_cards),
-            "cards": created_cards
-        }), 201
-        
-    except Exception as e:
-        return jsonify({
-            "error": "Failed to generate content",
-            "details": str(e)
-        }), 500
\ No newline at end of file
+        }, 503)
+    if error:
+        for upload in [pdf_content] + images:
+            if upload is not None:
+                upload.close()
+        return jsonify(error[0]), error[1]
+    
+    result = generation_jobs.enqueue(
+        user_id, source_material, generation_type, subject, max_cards,
+        focus_areas_list, None, images, pdf_content
+    )
+    if not result['success']:
+        response = jsonify({"error": result['error']})
+        response.headers['Retry-After'] = str(result['retry_after'])
+        return response, 503
+    
+    generation = result['generation']
+    return jsonify({
+        "message": "Content generation started",
+        "generation_id": generation.id,
+        "generation_status": generation.generation_status,
+        "status_url": url_for('api.get_content_generation', generation_id=generation.id),
+        "stream_url": url_for('api.stream_content_generation', generation_id=generation.id)
+    }), 202
\ No newline at end of file
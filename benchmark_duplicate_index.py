@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark near-duplicate card detection: a linear scan comparing word sets against
+every card vs the per-user MinHash/LSH index, plus how many edited copies it catches
+and how many distinct cards it wrongly flags
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+DECK_SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+CANDIDATES = 1000
+VOCABULARY = [f"{stem}{suffix}" for stem in ['cell', 'atom', 'wave', 'gene', 'force', 'acid', 'star', 'rock', 'law', 'tax']
+              for suffix in ['', 's', 'ic', 'al', 'ion', 'ing', 'ed', 'ar', 'ism', 'ity', 'oid', 'ase', 'ure', 'ent']]
+TEMPLATES = ['What is the {0} of {1} in {2}?', 'How does {0} affect {1} during {2}?',
+             'Why is {0} needed for {1} and {2}?', 'Which {0} controls {1} near {2}?']
+
+
+def random_card(rng):
+    front = rng.choice(TEMPLATES).format(*rng.sample(VOCABULARY, 3))
+    back = ' '.join(rng.sample(VOCABULARY, rng.randint(3, 8))).capitalize() + '.'
+    return front, back
+
+
+def edited_copy(rng, front, back):
+    """The kind of near-duplicate an AI or a second import produces: case, punctuation and one word"""
+    words = back.rstrip('.').split()
+    words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+    return front.upper().replace('?', ' ?'), ' '.join(words) + '!'
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='bench-dedupe-')
+    os.environ.update({
+        'DEV_DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'PDF_TEXT_CACHE_DIR': os.path.join(workdir, 'pdf_text_cache'),
+    })
+
+    from app import create_app, db
+    from app.models import User, Card
+    from app.services.ai_content_generator import _dedupe_key, _is_duplicate
+    from app.services.duplicate_index import duplicate_index
+
+    rng = random.Random(42)
+    deck = [random_card(rng) for _ in range(DECK_SIZE)]
+    duplicates = [edited_copy(rng, *rng.choice(deck)) for _ in range(CANDIDATES // 2)]
+    distinct = [random_card(rng) for _ in range(CANDIDATES // 2)]
+
+    app = create_app('development')
+    with app.app_context():
+        user = User(username='bench-dedupe', email='bench-dedupe@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+
+        print(f"🗂  Saving a {DECK_SIZE:,}-card deck (signatures are computed on insert)")
+        start = time.perf_counter()
+        db.session.add_all([Card(user_id=user.id, content_type='flashcard', front=front, back=back)
+                            for front, back in deck])
+        db.session.commit()
+        print(f"   {(time.perf_counter() - start) / DECK_SIZE * 1e6:.0f} µs/card including the insert")
+
+        duplicate_index.clear()
+        start = time.perf_counter()
+        batch = duplicate_index.batch(user.id)
+        print(f"   Index loaded in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        print(f"\n🔍 Checking {CANDIDATES:,} candidates ({len(duplicates)} edited copies, {len(distinct)} new cards)")
+        scan_keys = [_dedupe_key(f"{front} {back}") for front, back in deck]
+        scan_count = min(CANDIDATES, 100)  # The scan is too slow to run on every candidate
+        start = time.perf_counter()
+        for front, back in (duplicates + distinct)[:scan_count]:
+            _is_duplicate(_dedupe_key(f"{front} {back}"), scan_keys)
+        scan = (time.perf_counter() - start) / scan_count
+
+        start = time.perf_counter()
+        found = [batch.check(front, back) for front, back in duplicates]
+        flagged = [duplicate_index.find(user.id, front, back) for front, back in distinct]
+        indexed = (time.perf_counter() - start) / CANDIDATES
+
+        print(f"   Linear word-set scan: {scan * 1000:8.3f} ms/candidate")
+        print(f"   MinHash/LSH index:    {indexed * 1000:8.3f} ms/candidate  ({scan / indexed:,.0f}x faster)")
+        print(f"   Edited copies caught: {sum(match is not None for match in found) / len(found):6.1%}")
+        print(f"   New cards flagged:    {sum(match is not None for match in flagged) / len(flagged):6.1%}")
+
+
+if __name__ == '__main__':
+    main()
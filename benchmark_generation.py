@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Benchmark AI content generation against mock_openai_server.py, so no API key is needed:
+reply parsing cost, card insert cost under concurrent generations, and end-to-end job
+throughput and time to first card with streamed vs whole-reply parsing
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+from statistics import median
+
+GENERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+CARDS_PER_GENERATION = 20
+LATENCY = float(os.environ.get('MOCK_OPENAI_LATENCY', 0.5))  # Seconds to first token
+TOKENS_PER_SECOND = float(os.environ.get('MOCK_OPENAI_TPS', 80))  # Output rate per request
+TOPICS = ['photosynthesis', 'mitochondria', 'thermodynamics', 'plate tectonics', 'the French Revolution',
+          'supply and demand', 'neural networks', 'the immune system', 'electromagnetism', 'organic chemistry']
+
+
+def study_material(index):
+    topic = TOPICS[index % len(TOPICS)]
+    return (f"Lecture {index} on {topic}. " * 3 +
+            f"Key terms for {topic}: energy, structure, regulation, equilibrium, feedback, adaptation, "
+            f"measurement, variation, transport, synthesis, gradient, catalyst, pathway, signal.")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench_parser():
+    from mock_openai_server import canned_reply, TOKEN_PATTERN
+    from app.utils.card_stream import CardLineParser
+
+    reply = canned_reply("GENERATE EXACTLY 100 FLASHCARDS AND 100 INFORMATION PIECES\n"
+                         "STUDY MATERIAL TO PROCESS:\n" + study_material(0) + "\nGENERATE EXACTLY")
+    fragments = TOKEN_PATTERN.findall(reply)
+    rounds = 50
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        cards = CardLineParser('mixed', 1000).parse(reply)
+    whole = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        parser = CardLineParser('mixed', 1000)
+        streamed = []
+        for fragment in fragments:
+            streamed.extend(parser.feed(fragment))
+        streamed.extend(parser.close())
+    incremental = (time.perf_counter() - start) / rounds
+
+    if streamed != cards:
+        print("❌ Incremental parse differs from the whole-reply parse")
+        sys.exit(1)
+    print(f"\n🔍 Parsing a {len(cards)}-item reply ({len(fragments):,} stream fragments)")
+    print(f"   Whole reply:  {whole * 1000:7.2f} ms  ({whole / len(cards) * 1e6:5.1f} µs/card)")
+    print(f"   Incremental:  {incremental * 1000:7.2f} ms  ({incremental / len(cards) * 1e6:5.1f} µs/card)")
+
+
+def bench_inserts(app):
+    from app import db
+    from app.models import User, Card, ContentGeneration
+    from app.services.generation_jobs import CardBatcher
+
+    concurrency = 8
+    with app.app_context():
+        user = User(username='bench-inserts', email='bench-inserts@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    print(f"\n💾 Card inserts: {concurrency} concurrent generations x {CARDS_PER_GENERATION} cards")
+    item = {'content_type': 'flashcard', 'front': 'What is the function of ATP synthase?', 'back': 'It makes ATP.'}
+    for label, batch_size in [('Commit per card', 1), ('Micro-batches of 5', 5),
+                              ('One commit per generation', CARDS_PER_GENERATION)]:
+        with app.app_context():
+            generations = [ContentGeneration(user_id=user_id, source_material='bench', generation_type='mixed',
+                                             generation_status='processing') for _ in range(concurrency)]
+            db.session.add_all(generations)
+            db.session.commit()
+            generation_ids = [generation.id for generation in generations]
+
+        def run(generation_id):
+            batcher = CardBatcher(app, generation_id, user_id, None, None, batch_size=batch_size, flush_seconds=3600)
+            for _ in range(CARDS_PER_GENERATION):
+                batcher.add(item)
+            batcher.flush()
+
+        threads = [threading.Thread(target=run, args=(generation_id,)) for generation_id in generation_ids]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        with app.app_context():
+            saved = Card.query.filter(Card.generation_id.in_(generation_ids)).count()
+        if saved != concurrency * CARDS_PER_GENERATION:
+            print(f"❌ Expected {concurrency * CARDS_PER_GENERATION} cards, saved {saved}")
+            sys.exit(1)
+        print(f"   {label:<26} {saved / elapsed:8,.0f} cards/s  ({elapsed * 1000:.0f} ms)")
+
+
+def bench_end_to_end(app, server):
+    from app import db
+    from app.models import User, Card, ContentGeneration
+    from app.services.ai_content_generator import AIContentGenerator
+    from app.services.generation_jobs import GenerationJobQueue
+
+    class WholeReplyGenerator(AIContentGenerator):
+        """Previous behaviour: cards are only handed over once the whole reply is parsed"""
+
+        def _generate_chunk(self, kind, content, subject, count, focus_areas, encoded_images, on_item=None):
+            items = super()._generate_chunk(kind, content, subject, count, focus_areas, encoded_images)
+            for item in items:
+                if on_item is not None:
+                    on_item(item)
+            return items
+
+    with app.app_context():
+        user = User(username='bench-e2e', email='bench-e2e@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    print(f"\n🚀 {GENERATIONS} generations of {CARDS_PER_GENERATION} mixed items "
+          f"({LATENCY * 1000:.0f} ms to first token, {TOKENS_PER_SECOND:.0f} tokens/s)")
+    for label, generator in [('Whole reply (previous)', WholeReplyGenerator()), ('Streamed', AIContentGenerator())]:
+        queue = GenerationJobQueue(generator=generator)
+        server.reset_stats()
+        with app.app_context():
+            start = time.perf_counter()
+            generation_ids = []
+            for index in range(GENERATIONS):
+                result = queue.enqueue(user_id, f"{label}: {study_material(index)}", 'mixed',
+                                       max_cards=CARDS_PER_GENERATION)
+                generation_ids.append(result['generation'].id)
+        queue.shutdown(wait=True)
+        elapsed = time.perf_counter() - start
+
+        with app.app_context():
+            first_card, total, cards = [], [], 0
+            for generation_id in generation_ids:
+                generation = db.session.get(ContentGeneration, generation_id)
+                if generation.generation_status != 'completed':
+                    print(f"❌ Generation {generation_id} {generation.generation_status}: {generation.error_message}")
+                    sys.exit(1)
+                first = Card.query.filter_by(generation_id=generation_id).order_by(Card.id).first()
+                first_card.append((first.created_at - generation.created_at).total_seconds())
+                total.append((generation.completed_at - generation.created_at).total_seconds())
+                cards += generation.cards_generated
+
+        print(f"   {label}")
+        print(f"      {GENERATIONS / elapsed:6.2f} generations/s, {cards / elapsed:7.1f} cards/s "
+              f"({queue.workers} workers, {server.max_in_flight} concurrent requests, {server.tokens_sent:,} tokens)")
+        # Both include time spent queued behind the worker pool, as a user would see it
+        print(f"      Time to first card  p50 {median(first_card):5.2f}s  p95 {percentile(first_card, 0.95):5.2f}s")
+        print(f"      Time to completion  p50 {median(total):5.2f}s  p95 {percentile(total, 0.95):5.2f}s")
+
+
+def main():
+    from mock_openai_server import MockOpenAIServer
+
+    server = MockOpenAIServer(port=0, latency=LATENCY, tokens_per_second=TOKENS_PER_SECOND).start_in_thread()
+    workdir = tempfile.mkdtemp(prefix='bench-generation-')
+    os.environ.update({
+        'OPENAI_API_KEY': 'mock',
+        'OPENAI_BASE_URL': server.base_url,
+        'DEV_DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'GENERATION_CACHE_PATH': '',  # Every generation should reach the mock
+        'DEDUPE_GENERATED_CARDS': 'false',  # Runs share a user, so later runs would skip earlier runs' cards
+        'PDF_TEXT_CACHE_DIR': os.path.join(workdir, 'pdf_text_cache'),
+    })
+    print(f"🤖 Mock OpenAI at {server.base_url}, database in {workdir}")
+
+    from app import create_app
+    app = create_app('development')
+    try:
+        bench_parser()
+        bench_inserts(app)
+        bench_end_to_end(app, server)
+    finally:
+        server.stop_thread()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark image preprocessing for AI generation on five 12MP photos: the previous
+serial decode/convert/thumbnail/encode loop vs the thread-pooled, draft()-decoded
+pipeline, a warm cache, and a batch with duplicate uploads
+"""
+import io
+import sys
+import time
+import base64
+import random
+
+PHOTO_COUNT = 5
+PHOTO_SIZE = (4000, 3000)  # 12 MP
+
+
+def build_photo(seed):
+    """Camera-like JPEG: random coloured shapes over a gradient, with sensor noise, q90"""
+    from PIL import Image, ImageChops, ImageDraw, ImageFilter
+    random.seed(seed)
+    width, height = PHOTO_SIZE
+    photo = Image.merge('RGB', [
+        Image.linear_gradient('L').resize(PHOTO_SIZE).rotate(random.randint(0, 359)) for _ in range(3)
+    ])
+    draw = ImageDraw.Draw(photo)
+    for _ in range(40):
+        x, y = random.randint(0, width), random.randint(0, height)
+        w, h = random.randint(100, 1500), random.randint(100, 1500)
+        fill = tuple(random.randint(0, 255) for _ in range(3))
+        (draw.ellipse if random.random() < 0.5 else draw.rectangle)((x - w, y - h, x + w, y + h), fill=fill)
+    noise = Image.merge('RGB', [Image.effect_noise((width, height), 24)] * 3)
+    photo = ImageChops.add(photo, noise, 1.5, -64).filter(ImageFilter.GaussianBlur(1))
+    out = io.BytesIO()
+    photo.save(out, format='JPEG', quality=90)
+    return out.getvalue()
+
+
+def legacy_encode(image_content):
+    """Previous behaviour: full decode, convert, LANCZOS thumbnail to 2048, JPEG q85"""
+    from PIL import Image
+    image = Image.open(io.BytesIO(image_content))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.width > 2048 or image.height > 2048:
+        image.thumbnail((2048, 2048), Image.Resampling.LANCZOS)
+    img_buffer = io.BytesIO()
+    image.save(img_buffer, format='JPEG', quality=85)
+    return base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    sizes = ", ".join(f"{len(data) * 3 // 4 // 1024} KB" for data in result)
+    print(f"   {label:<36} {elapsed * 1000:8.1f} ms   {len(result)} images ({sizes})")
+    return result, elapsed
+
+
+def main():
+    from PIL import Image
+    from app.utils.image_prep import ImagePreprocessor
+
+    photos = [build_photo(seed) for seed in range(PHOTO_COUNT)]
+    print(f"📷 {PHOTO_COUNT} photos at {PHOTO_SIZE[0]}x{PHOTO_SIZE[1]}, "
+          f"{sum(len(photo) for photo in photos) / 1024 / 1024:.1f} MB total")
+
+    _, legacy = timed("Serial (previous)", lambda: [legacy_encode(photo) for photo in photos])
+
+    box_only = ImagePreprocessor(max_short_side=0)
+    timed("Pool + draft, 2048 box", lambda: box_only.encode_many(photos))
+
+    pipeline = ImagePreprocessor()
+    _, cold = timed(f"Pool + draft, {pipeline.max_short_side}px short side", lambda: pipeline.encode_many(photos))
+    _, warm = timed("Regeneration (warm cache)", lambda: pipeline.encode_many(photos))
+
+    # Same photo uploaded twice, and another re-saved at lower quality and size
+    resaved = io.BytesIO()
+    Image.open(io.BytesIO(photos[2])).resize((3000, 2250)).save(resaved, format='JPEG', quality=70)
+    batch = [photos[0], photos[0], photos[2], resaved.getvalue(), photos[4]]
+    pipeline.clear()
+    deduped, _ = timed("Batch with 2 duplicates (cold)", lambda: pipeline.encode_many(batch))
+
+    if len(deduped) != 3:
+        print("❌ Duplicates were not removed")
+        sys.exit(1)
+    print(f"✅ {legacy / cold:.1f}x faster cold, {legacy / max(warm, 1e-9):,.0f}x on regeneration")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark push fan-out: one-at-a-time sends vs the concurrent PushDispatcher
+Runs against mock_apns_server.py with a throwaway signing key, so no Apple credentials are needed
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+RECIPIENT_COUNTS = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+LATENCY = float(os.environ.get('MOCK_APNS_LATENCY', 0.05))  # Simulated APNs round trip per push
+SEQUENTIAL_SAMPLE = 200  # The sequential baseline is measured on a sample and extrapolated
+
+
+def write_test_key():
+    """Create a temporary .p8 file with a fresh ES256 key"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    pem = key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    fd, path = tempfile.mkstemp(suffix='.p8')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pem)
+    return path
+
+
+def build_jobs(count):
+    """One alert per recipient; every 50th token is dead to exercise error statuses"""
+    from app.services.push_dispatcher import PushJob
+
+    jobs = []
+    for i in range(count):
+        token = f"bad{i:061d}" if i % 50 == 0 else f"{i:064d}"
+        payload = {
+            "aps": {
+                "alert": {"title": "🧠 Quick Recall", "subtitle": "Tap to see answer", "body": f"Q: Card {i}"},
+                "badge": 1,
+                "sound": "default",
+                "category": "RECALL_CARD"
+            },
+            "card_id": i
+        }
+        jobs.append(PushJob(token, payload, user_id=i))
+    return jobs
+
+
+async def send_sequentially(client, jobs):
+    """The previous behaviour: await each push before sending the next"""
+    for job in jobs:
+        await client.send(job.device_token, job.payload, push_type=job.push_type)
+    await client.aclose()
+
+
+def main():
+    from mock_apns_server import MockAPNsServer
+    from app.services.apns import APNsClient, APNsCredentialProvider
+    from app.services.push_dispatcher import PushDispatcher
+
+    key_path = write_test_key()
+    server = MockAPNsServer(port=0, latency=LATENCY).start_in_thread()
+    try:
+        credentials = APNsCredentialProvider(key_path=key_path, key_id="KEYID12345", team_id="TEAMID1234")
+        client = APNsClient(base_url=server.base_url, credentials=credentials)
+        dispatcher = PushDispatcher(client=client)
+
+        print(f"📡 Mock APNs at {server.base_url} ({LATENCY * 1000:.1f}ms per push)")
+        print(f"   Dispatcher concurrency {dispatcher.concurrency}, "
+              f"rate limit {dispatcher.rate_per_second or 'none'}")
+
+        for count in RECIPIENT_COUNTS:
+            jobs = build_jobs(count)
+            print(f"\n🚀 {count:,} recipients")
+
+            sample = jobs[:SEQUENTIAL_SAMPLE]
+            start = time.perf_counter()
+            asyncio.run(send_sequentially(client, sample))
+            sequential_rate = len(sample) / (time.perf_counter() - start)
+            print(f"   Sequential: {sequential_rate:9,.0f} pushes/s  (~{count / sequential_rate:,.0f}s for all)")
+
+            server.reset_stats()
+            statuses = dispatcher.dispatch_sync(jobs)
+            print(f"   Dispatcher: {dispatcher.last_rate:9,.0f} pushes/s  ({dispatcher.last_elapsed:.2f}s)")
+            print(f"   Statuses: {dict(dispatcher.last_statuses)}, connections opened: {server.connections}")
+
+            if len(statuses) != count:
+                print(f"❌ Expected {count} statuses, got {len(statuses)}")
+                sys.exit(1)
+
+        print(f"\n🔑 Provider tokens signed: {credentials.misses}")
+    finally:
+        server.stop_thread()
+        os.remove(key_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark push payload building: per-push dict construction + json.dumps vs PushPayloadBuilder
+Uses in-memory card objects, so no database or APNs connection is needed
+"""
+import sys
+import json
+import time
+import random
+from types import SimpleNamespace
+
+PAYLOAD_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+CARD_COUNT = 1_000  # Recipients share cards, as recall pushes do
+TARGET_RATE = 100_000  # Payloads per second
+
+
+def build_cards(count):
+    """Mix of short, long and non-ASCII cards, including answers far over the 4 KB limit"""
+    cards = []
+    for i in range(count):
+        length = random.choice([40, 200, 1_000, 6_000])
+        front = (f"Card {i}: what does the mitochondria do? 🧬 Ünïcödé " * 200)[:length]
+        cards.append(SimpleNamespace(
+            id=i,
+            content_type='flashcard' if i % 3 else 'information',
+            front=front,
+            back=("The powerhouse of the cell — 細胞のエネルギー工場. " * 300)[:length * 2],
+            subject="Biology" if i % 2 else None,
+            folder_id=None,
+            folder=None,
+            is_due_for_review=lambda: True
+        ))
+    return cards
+
+
+def legacy_alert(card):
+    """Previous behaviour: slice and build the dict on every push, then serialize"""
+    if card.content_type == 'flashcard':
+        title, body, subtitle = "🧠 Quick Recall", f"Q: {card.front}", "Tap to see answer"
+    else:
+        title, body = "💡 Remember This", card.front
+        subtitle = f"Subject: {card.subject}" if card.subject else "Key Information"
+    if len(body) > 100:
+        body = body[:97] + "..."
+    payload = {
+        "aps": {
+            "alert": {"title": title, "subtitle": subtitle, "body": body},
+            "badge": 1,
+            "sound": "default",
+            "category": "RECALL_CARD"
+        },
+        "card_id": card.id,
+        "content_type": card.content_type,
+        "card_back": card.back if card.content_type == 'flashcard' else None
+    }
+    return json.dumps(payload).encode('utf-8')
+
+
+def measure(label, build, cards):
+    start = time.perf_counter()
+    sizes = [len(build(cards[i % len(cards)])) for i in range(PAYLOAD_COUNT)]
+    elapsed = time.perf_counter() - start
+    rate = PAYLOAD_COUNT / elapsed
+    oversized = sum(1 for size in sizes if size > 4096)
+    print(f"   {label:<28} {rate:11,.0f} payloads/s  max {max(sizes):6,} bytes  over 4 KB: {oversized:,}")
+    return rate, oversized
+
+
+def main():
+    from app.services import push_payloads as payload_module
+    from app.services.push_payloads import PushPayloadBuilder
+
+    random.seed(7)
+    cards = build_cards(CARD_COUNT)
+    builder = PushPayloadBuilder()
+
+    print(f"📦 {PAYLOAD_COUNT:,} payloads over {CARD_COUNT:,} cards "
+          f"(encoder: {'orjson' if payload_module.orjson else 'json'})")
+
+    measure("Legacy alert", legacy_alert, cards)
+    alert_rate, alert_over = measure("Builder alert", builder.recall_alert, cards)
+    activity_rate, activity_over = measure("Builder Live Activity", builder.recall_live_activity, cards)
+    measure("Builder study card activity", builder.study_card_activity, cards)
+
+    for card in cards[:50]:
+        for body in (builder.recall_alert(card), builder.recall_live_activity(card), builder.study_card_activity(card)):
+            json.loads(body)  # Truncation must never leave invalid JSON or UTF-8
+
+    if alert_over or activity_over:
+        print("❌ Payloads over the APNs limit")
+        sys.exit(1)
+    if min(alert_rate, activity_rate) < TARGET_RATE:
+        print(f"⚠️  Below the {TARGET_RATE:,} payloads/s target")
+    else:
+        print(f"✅ Above the {TARGET_RATE:,} payloads/s target")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark recall eligibility: Python filtering vs the SQL push-down predicate
+Builds a throwaway SQLite database with synthetic users and compares both paths
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import datetime, time as dt_time
+
+USER_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+
+def random_time():
+    return dt_time(random.randint(0, 23), random.choice([0, 15, 30, 45]))
+
+
+def build_users(count):
+    """Generate synthetic users with a spread of recall settings"""
+    from app.models import User
+
+    rows = []
+    for i in range(count):
+        days = random.choice([None, '1,2,3,4,5', '6,7', '1,3,5', '1,2,3,4,5,6,7'])
+        start = end = sleep_start = sleep_end = None
+        if random.random() < 0.5:
+            start, end = sorted([random_time(), random_time()])
+        if random.random() < 0.6:
+            sleep_start, sleep_end = random_time(), random_time()
+
+        row = {
+            'username': f'bench_user_{i}',
+            'email': f'bench_user_{i}@example.com',
+            'password_hash': 'x',
+            'device_token': f'token{i:064d}' if random.random() < 0.9 else None,
+            'recall_enabled': random.random() < 0.9,
+            'recall_paused': random.random() < 0.1,
+            'focus_mode': random.random() < 0.1,
+            'recall_days_of_week': days,
+            'recall_start_time': start,
+            'recall_end_time': end,
+            'sleep_start': sleep_start,
+            'sleep_end': sleep_end
+        }
+        # Bulk inserts skip ORM events, so normalize explicitly
+        row.update(User.recall_schedule_columns(days, start, end, sleep_start, sleep_end))
+        rows.append(row)
+    return rows
+
+
+def main():
+    db_dir = tempfile.mkdtemp(prefix='recall_bench_')
+    os.environ['DEV_DATABASE_URL'] = f"sqlite:///{os.path.join(db_dir, 'bench.db')}"
+
+    from app import create_app, db
+    from app.models import User
+    from app.services.notification_service import NotificationService
+
+    app = create_app('development')
+    service = NotificationService()
+
+    with app.app_context():
+        print(f"🏗️  Inserting {USER_COUNT:,} synthetic users...")
+        start = time.perf_counter()
+        rows = build_users(USER_COUNT)
+        db.session.bulk_insert_mappings(User, rows)
+        db.session.commit()
+        print(f"   Inserted in {time.perf_counter() - start:.2f}s")
+
+        now = datetime.now()
+
+        # Old path: load every user with a device token and filter in Python
+        db.session.expunge_all()
+        start = time.perf_counter()
+        users = User.query.filter(
+            User.device_token.isnot(None),
+            User.recall_enabled == True
+        ).all()
+        python_eligible = {user.id for user in users if service._should_send_notification(user)}
+        python_seconds = time.perf_counter() - start
+
+        # New path: one predicate, only eligible users leave the database
+        db.session.expunge_all()
+        start = time.perf_counter()
+        sql_users = User.query.filter(service.recall_eligibility_filter(now)).all()
+        sql_eligible = {user.id for user in sql_users}
+        sql_seconds = time.perf_counter() - start
+
+        print(f"\n📊 Results for {USER_COUNT:,} users")
+        print(f"   Python filter: {python_seconds * 1000:8.1f} ms  ({len(users):,} rows loaded, {len(python_eligible):,} eligible)")
+        print(f"   SQL predicate: {sql_seconds * 1000:8.1f} ms  ({len(sql_users):,} rows loaded, {len(sql_eligible):,} eligible)")
+        print(f"   Speedup: {python_seconds / sql_seconds:.1f}x")
+
+        if python_eligible == sql_eligible:
+            print("✅ Both paths select the same users")
+        else:
+            print(f"❌ Mismatch: {len(python_eligible ^ sql_eligible)} users differ")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Local APNs stand-in server for tests and benchmarks
+Speaks HTTP/2 over cleartext (prior knowledge); point the app at it with
+APNS_BASE_URL=http://127.0.0.1:8443
+
+Device tokens select the response:
+  bad...   -> 400 BadDeviceToken
+  gone...  -> 410 Unregistered
+  busy...  -> 429 TooManyRequests (with Retry-After)
+  flaky... -> 503 ServiceUnavailable
+  anything else -> 200
+"""
+import sys
+import json
+import uuid
+import asyncio
+import argparse
+import threading
+from collections import Counter
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import RequestReceived, DataReceived, StreamEnded, ConnectionTerminated, StreamReset
+from h2.errors import ErrorCodes
+from h2.exceptions import ProtocolError
+
+ERROR_RESPONSES = {
+    'bad': (400, 'BadDeviceToken'),
+    'gone': (410, 'Unregistered'),
+    'busy': (429, 'TooManyRequests'),
+    'flaky': (503, 'ServiceUnavailable'),
+}
+
+
+class MockAPNsProtocol(asyncio.Protocol):
+    """One HTTP/2 connection to the stand-in server"""
+
+    DRAIN_GRACE_SECONDS = 0.5
+
+    def __init__(self, server):
+        self.server = server
+        self.conn = H2Connection(H2Configuration(client_side=False, header_encoding='utf-8'))
+        self.transport = None
+        self.streams = {}
+        self.pending = 0
+        self.responses_sent = 0
+        self.draining = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections += 1
+        # APNs advertises up to 1000 concurrent streams per connection
+        self.conn.local_settings.max_concurrent_streams = self.server.max_concurrent_streams
+        self.conn.initiate_connection()
+        self.transport.write(self.conn.data_to_send())
+
+    def data_received(self, data):
+        try:
+            events = self.conn.receive_data(data)
+        except ProtocolError:
+            self.transport.write(self.conn.data_to_send())
+            self.transport.close()
+            return
+
+        for event in events:
+            if isinstance(event, RequestReceived):
+                if self.draining:
+                    # Streams opened after GOAWAY are refused; the client retries elsewhere
+                    try:
+                        self.conn.reset_stream(event.stream_id, error_code=ErrorCodes.REFUSED_STREAM)
+                    except ProtocolError:
+                        pass
+                    continue
+                self.streams[event.stream_id] = {'headers': dict(event.headers), 'body': bytearray()}
+                self.pending += 1
+            elif isinstance(event, DataReceived):
+                stream = self.streams.get(event.stream_id)
+                if stream is not None:
+                    stream['body'].extend(event.data)
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, StreamEnded):
+                stream = self.streams.pop(event.stream_id, None)
+                if stream is not None:
+                    if self.server.latency:
+                        asyncio.get_running_loop().call_later(
+                            self.server.latency, self._respond, event.stream_id, stream
+                        )
+                    else:
+                        self._respond(event.stream_id, stream)
+            elif isinstance(event, StreamReset):
+                if self.streams.pop(event.stream_id, None) is not None:
+                    self.pending -= 1
+            elif isinstance(event, ConnectionTerminated):
+                self.transport.close()
+
+        self.transport.write(self.conn.data_to_send())
+
+    def _respond(self, stream_id, stream):
+        """Answer one push the way APNs would"""
+        if self.transport.is_closing():
+            return
+
+        headers = stream['headers']
+        token = headers.get(':path', '').rsplit('/', 1)[-1]
+        apns_id = headers.get('apns-id') or str(uuid.uuid4()).upper()
+
+        status, reason = 200, None
+        if not headers.get('authorization'):
+            status, reason = 403, 'MissingProviderToken'
+        else:
+            for prefix, (error_status, error_reason) in ERROR_RESPONSES.items():
+                if token.startswith(prefix):
+                    status, reason = error_status, error_reason
+                    break
+
+        self.pending -= 1
+        response_headers = [(':status', str(status)), ('apns-id', apns_id)]
+        body = b''
+        if reason:
+            body = json.dumps({'reason': reason}).encode('utf-8')
+            response_headers.append(('content-type', 'application/json'))
+            response_headers.append(('content-length', str(len(body))))
+        if status == 429:
+            response_headers.append(('retry-after', '1'))
+
+        self.server.requests += 1
+        self.server.statuses[status] += 1
+        self.server.bytes_received += len(stream['body'])
+
+        try:
+            self.conn.send_headers(stream_id, response_headers, end_stream=not body)
+            if body:
+                self.conn.send_data(stream_id, body, end_stream=True)
+        except ProtocolError:
+            return
+
+        self.responses_sent += 1
+        # Simulate APNs recycling connections: GOAWAY, finish accepted streams, then close
+        if self.server.goaway_after and self.responses_sent >= self.server.goaway_after and not self.draining:
+            self.draining = True
+            self.conn.close_connection(last_stream_id=self.conn.highest_inbound_stream_id)
+
+        self.transport.write(self.conn.data_to_send())
+        if self.draining and self.pending <= 0:
+            # Give the client a moment to read the last responses before hanging up
+            asyncio.get_running_loop().call_later(self.DRAIN_GRACE_SECONDS, self.transport.close)
+
+    def connection_lost(self, exc):
+        self.streams.clear()
+
+
+class MockAPNsServer:
+    """Configurable APNs stand-in (latency per push, optional GOAWAY after N responses)"""
+
+    def __init__(self, host='127.0.0.1', port=8443, latency=0.0, goaway_after=None, max_concurrent_streams=1000):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.goaway_after = goaway_after
+        self.max_concurrent_streams = max_concurrent_streams
+
+        self.requests = 0
+        self.connections = 0
+        self.bytes_received = 0
+        self.statuses = Counter()
+
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        """Start listening on the running event loop"""
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: MockAPNsProtocol(self), self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def start_in_thread(self):
+        """Run the server on its own event loop thread (for synchronous callers)"""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop_thread(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def reset_stats(self):
+        self.requests = 0
+        self.connections = 0
+        self.bytes_received = 0
+        self.statuses.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local APNs stand-in server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before answering each push')
+    parser.add_argument('--goaway-after', type=int, default=None, help='Send GOAWAY after this many responses per connection')
+    args = parser.parse_args()
+
+    server = MockAPNsServer(args.host, args.port, args.latency, args.goaway_after)
+
+    async def serve():
+        await server.start()
+        print(f"📡 Mock APNs listening on {server.base_url}")
+        print(f"   export APNS_BASE_URL={server.base_url}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print(f"\n🛑 Stopped after {server.requests} pushes: {dict(server.statuses)}")
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI stand-in server for tests and benchmarks
+Answers POST /v1/chat/completions (streaming or not) with canned but valid Q<n>:/A<n>:/INFO<n>:
+output; point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8600/v1 (any OPENAI_API_KEY)
+
+The item counts and kind come from the generator's prompt ("GENERATE EXACTLY 10
+FLASHCARDS", "EXTRACT EXACTLY 5 INFORMATION PIECES", ...) and the wording is built
+from the study material, so the same prompt always gets the same reply. Prompts
+containing MOCK_ERROR get a 500.
+"""
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MIXED_PATTERN = re.compile(r'GENERATE EXACTLY (\d+) FLASHCARDS AND (\d+) INFORMATION PIECES')
+FLASHCARD_PATTERN = re.compile(r'GENERATE EXACTLY (\d+) FLASHCARDS')
+INFO_PATTERN = re.compile(r'EXTRACT EXACTLY (\d+) INFORMATION PIECES')
+MATERIAL_PATTERN = re.compile(r'STUDY MATERIAL TO PROCESS:\s*(.*?)\s*(?:GENERATE|EXTRACT) EXACTLY', re.DOTALL)
+TOKEN_PATTERN = re.compile(r'\S+\s*|\s+')
+STOP_WORDS = {'the', 'and', 'for', 'that', 'with', 'this', 'from', 'are', 'was', 'its', 'into', 'which', 'their'}
+# Mixed into every item so canned items don't look like duplicates to the generator's dedupe
+ASPECTS = [
+    'structure', 'function', 'origin', 'cause', 'effect', 'example', 'exception', 'process', 'stage', 'rate',
+    'limit', 'scale', 'history', 'model', 'evidence', 'method', 'purpose', 'pattern', 'role', 'property',
+    'measure', 'unit', 'symbol', 'source', 'output', 'input', 'balance', 'cycle', 'trend', 'risk',
+    'benefit', 'cost', 'variant', 'category', 'sequence', 'timeline', 'location', 'component', 'mechanism', 'result'
+]
+
+
+def canned_reply(prompt: str) -> str:
+    """Deterministic, parseable reply with the number and kind of items the prompt asks for"""
+    mixed = MIXED_PATTERN.search(prompt)
+    if mixed:
+        flashcards, infos = int(mixed.group(1)), int(mixed.group(2))
+    else:
+        flashcard_match = FLASHCARD_PATTERN.search(prompt)
+        info_match = INFO_PATTERN.search(prompt)
+        flashcards = int(flashcard_match.group(1)) if flashcard_match else 0
+        infos = int(info_match.group(1)) if info_match else 0
+        if not flashcard_match and not info_match:
+            flashcards = 5
+
+    material = MATERIAL_PATTERN.search(prompt)
+    words = [word for word in re.findall(r'[A-Za-z][A-Za-z-]{2,}', material.group(1) if material else prompt)
+             if word.lower() not in STOP_WORDS] or ['material']
+    rng = random.Random(hashlib.sha256(prompt.encode('utf-8')).digest())
+
+    lines = []
+    for i in range(1, flashcards + 1):
+        first, second = rng.choice(words), rng.choice(words)
+        aspect, detail, angle = rng.sample(ASPECTS, 3)
+        lines.append(f"Q{i}: What is the {aspect} of {first} with respect to its {detail} and {angle}?")
+        lines.append(f"A{i}: The {aspect} of {first} follows from {second}, which sets its {detail}.")
+        lines.append("")
+    for i in range(1, infos + 1):
+        first, second = rng.choice(words), rng.choice(words)
+        aspect, detail, angle = rng.sample(ASPECTS, 3)
+        lines.append(f"INFO{i}: {first.capitalize()} {aspect}: {second} determines the {detail} and {angle}.")
+    return "\n".join(lines).strip()
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send_json(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+        if not self.headers.get('Authorization'):
+            return self._send_json(401, {'error': {'message': 'Missing API key', 'type': 'invalid_request_error'}})
+
+        server = self.server.mock
+        prompt = '\n'.join(_message_text(message) for message in body.get('messages', []))
+        server.record_request()
+        try:
+            if 'MOCK_ERROR' in prompt or (server.error_rate and server.rng.random() < server.error_rate):
+                server.record_status(500)
+                return self._send_json(500, {'error': {'message': 'The server had an error', 'type': 'server_error'}})
+
+            tokens = TOKEN_PATTERN.findall(canned_reply(prompt))
+            finish_reason = 'stop'
+            max_tokens = body.get('max_tokens')
+            if max_tokens and len(tokens) > max_tokens:
+                tokens, finish_reason = tokens[:max_tokens], 'length'
+            model = body.get('model', 'mock')
+
+            time.sleep(server.latency)
+            if body.get('stream'):
+                self._stream(model, tokens, finish_reason)
+            else:
+                if server.tokens_per_second:
+                    time.sleep(len(tokens) / server.tokens_per_second)
+                self._send_json(200, {
+                    'id': f"chatcmpl-mock-{server.requests}",
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                        'finish_reason': finish_reason
+                    }],
+                    'usage': {
+                        'prompt_tokens': len(prompt) // 4,
+                        'completion_tokens': len(tokens),
+                        'total_tokens': len(prompt) // 4 + len(tokens)
+                    }
+                })
+            server.record_status(200, len(tokens))
+        finally:
+            server.record_done()
+
+    def _stream(self, model, tokens, finish_reason):
+        """Server-sent event chunks, one token each, paced at tokens_per_second"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        server = self.server.mock
+        chunk_id = f"chatcmpl-mock-{server.requests}"
+        created = int(time.time())
+        delay = 1 / server.tokens_per_second if server.tokens_per_second else 0
+
+        def chunk(delta, finish=None):
+            return {
+                'id': chunk_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish}]
+            }
+
+        try:
+            self._write_event(chunk({'role': 'assistant', 'content': ''}))
+            for token in tokens:
+                if delay:
+                    time.sleep(delay)
+                self._write_event(chunk({'content': token}))
+            self._write_event(chunk({}, finish_reason))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. once it had enough cards
+            self.close_connection = True
+
+    def _write_event(self, data):
+        self._write_chunk(f"data: {json.dumps(data)}\n\n".encode('utf-8'))
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, status, data):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _message_text(message) -> str:
+    content = message.get('content') or ''
+    if isinstance(content, list):
+        return '\n'.join(part.get('text', '') for part in content if part.get('type') == 'text')
+    return content
+
+
+class MockOpenAIServer:
+    """Configurable OpenAI stand-in (time to first token, token rate, random error rate)"""
+
+    def __init__(self, host='127.0.0.1', port=8600, latency=0.0, tokens_per_second=0.0, error_rate=0.0, seed=0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.tokens_sent = 0
+        self.statuses = {}
+
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def record_status(self, status, tokens=0):
+        with self._lock:
+            self.tokens_sent += tokens
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def record_done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def start_in_thread(self):
+        """Serve on a background thread (for synchronous callers)"""
+        self._server = ThreadingHTTPServer((self.host, self.port), MockOpenAIHandler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop_thread(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = 0
+            self.max_in_flight = self.in_flight
+            self.tokens_sent = 0
+            self.statuses = {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OpenAI stand-in server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=80.0, help='Output token rate per request (0 = instant)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 500')
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(args.host, args.port, args.latency, args.tokens_per_second, args.error_rate)
+    server.start_in_thread()
+    print(f"🤖 Mock OpenAI listening on {server.base_url}")
+    print(f"   export OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=mock")
+
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        print(f"\n🛑 Stopped after {server.requests} requests, {server.tokens_sent} tokens: {server.statuses}")
+        server.stop_thread()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
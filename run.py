@@ -47,7 +47,7 @@ def main():
     
     # Start notification scheduler
     print("📅 Starting notification scheduler...")
-    notification_service.start_scheduler()
+    notification_service.start_scheduler(app)
     
     try:
         # Run the application
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Notification outbox worker for Active Recall
+
+Each worker drains the outbox rows of its shards (shard % shards == index), so
+adding workers spreads the push load. Set OUTBOX_SHARD_WORKERS to the number of
+dedicated workers: it is the default for --shards, and it turns the scheduler's
+inline worker off unless OUTBOX_INLINE_WORKER says otherwise.
+
+Usage:
+  python3 run_outbox_worker.py                      # Single worker for every shard
+  python3 run_outbox_worker.py --shard 0 --shards 4 # One of four workers
+  python3 run_outbox_worker.py --once               # Send what is due and exit
+"""
+import sys
+import argparse
+from app.services.outbox_worker import OutboxWorker
+from app.config import Config
+
+def main():
+    """Run an outbox worker inside an application context"""
+    parser = argparse.ArgumentParser(description='Deliver queued push notifications')
+    parser.add_argument('--shard', type=int, default=0, help='Index of this worker (0-based)')
+    parser.add_argument('--shards', type=int, default=Config.OUTBOX_SHARD_WORKERS or 1,
+                        help='Total number of workers (default: OUTBOX_SHARD_WORKERS)')
+    parser.add_argument('--batch-size', type=int, default=None, help='Rows claimed per batch')
+    parser.add_argument('--poll-interval', type=float, default=None, help='Seconds to sleep when idle')
+    parser.add_argument('--once', action='store_true', help='Drain due rows once and exit')
+    parser.add_argument('--metrics-port', type=int, default=None, help='Serve Prometheus metrics on this port')
+    args = parser.parse_args()
+
+    try:
+        worker = OutboxWorker(shard_index=args.shard, shard_count=args.shards, batch_size=args.batch_size)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    from app import create_app
+    app = create_app()
+    
+    if args.metrics_port:
+        from app.utils.metrics import start_metrics_server
+        start_metrics_server(args.metrics_port, app=app)
+        print(f"📈 Metrics on http://0.0.0.0:{args.metrics_port}/metrics")
+
+    with app.app_context():
+        print(f"📬 Outbox worker {worker.worker_id} starting (shard {args.shard} of {args.shards})")
+
+        recovered = worker.recover_stale()
+        if recovered:
+            print(f"♻️  Recovered {recovered} rows with expired leases")
+
+        if args.once:
+            stats = worker.drain()
+            print(f"✅ Sent {stats['sent']} of {stats['claimed']} claimed pushes "
+                  f"({stats['dead_tokens']} dead tokens cleared, {stats['retried']} retrying, {stats['failed']} failed)")
+            return
+
+        try:
+            worker.run_forever(args.poll_interval)
+        except KeyboardInterrupt:
+            worker.stop()
+            print("\n🛑 Outbox worker stopped")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+"""
+Shared test fixtures
+"""
+import pytest
+from app import create_app, db
+
+
+@pytest.fixture
+def app():
+    """Application on a fresh in-memory database, with an app context pushed"""
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,150 @@
+"""
+MinHash signatures and the per-user LSH duplicate index
+"""
+import pytest
+from app import db
+from app.models import User, Card
+from app.utils import minhash
+from app.services.duplicate_index import LshTable, duplicate_index
+
+FRONT = 'What is the powerhouse of the cell?'
+BACK = 'The mitochondria, which produce most of the ATP'
+
+
+def signature(front, back=None):
+    return minhash.signature(front, back)
+
+
+def packed(front, back=None):
+    return minhash.pack(signature(front, back))
+
+
+def test_identical_text_matches_exactly_regardless_of_case_and_punctuation():
+    assert minhash.similarity(signature(FRONT, BACK), signature(FRONT.upper(), BACK + '!!')) == 1.0
+
+
+def test_similarity_tracks_how_much_text_is_shared():
+    original = signature(FRONT, BACK)
+    edited = signature(FRONT, 'The mitochondria, which produce most of the energy')
+    unrelated = signature('Which treaty ended the Thirty Years War?', 'The Peace of Westphalia in 1648')
+
+    assert minhash.similarity(original, edited) >= 0.6
+    assert minhash.similarity(original, unrelated) <= 0.2
+
+
+def test_estimate_is_close_to_the_true_jaccard_similarity():
+    first = minhash.normalize_card_text(FRONT, BACK)
+    second = minhash.normalize_card_text(FRONT, 'Chloroplasts, which turn light into sugar')
+    shingles_first, shingles_second = minhash.shingles(first), minhash.shingles(second)
+    jaccard = len(shingles_first & shingles_second) / len(shingles_first | shingles_second)
+
+    estimate = minhash.similarity(signature(FRONT, BACK), signature(FRONT, 'Chloroplasts, which turn light into sugar'))
+    assert estimate == pytest.approx(jaccard, abs=0.2)
+
+
+def test_packed_similarity_matches_the_unpacked_comparison():
+    pairs = [(FRONT, BACK), (FRONT, 'Ribosomes'), ('Define osmosis', 'Water moving across a membrane')]
+    for first in pairs:
+        for second in pairs:
+            expected = minhash.similarity(signature(*first), signature(*second))
+            as_ints = [int.from_bytes(packed(*text), 'little') for text in (first, second)]
+            assert minhash.packed_similarity(*as_ints) == pytest.approx(expected)
+
+
+def test_pack_round_trip_and_malformed_data():
+    sig = signature(FRONT, BACK)
+    assert minhash.unpack(minhash.pack(sig)) == sig
+    assert minhash.unpack(b'') is None
+    assert minhash.unpack(b'\x00' * 10) is None
+    assert signature('?!', '...') is None
+
+
+def test_lsh_insert_query_remove_round_trip():
+    table = LshTable(bands=16)
+    table.insert(1, packed(FRONT, BACK))
+    table.insert(2, packed('Define osmosis', 'Water moving across a membrane'))
+
+    assert table.query(signature(FRONT.lower(), BACK), 0.7) == (1, 1.0)
+    assert len(table) == 2
+
+    table.remove(1)
+    assert table.query(signature(FRONT, BACK), 0.7) is None
+    table.remove(2)
+    table.remove(2)  # Removing a missing key is a no-op
+    assert len(table) == 0
+    assert table._buckets == {}
+
+
+def test_lsh_reinsert_replaces_the_old_signature():
+    table = LshTable(bands=16)
+    table.insert(1, packed(FRONT, BACK))
+    table.insert(1, packed('Define osmosis', 'Water moving across a membrane'))
+
+    assert len(table) == 1
+    assert table.query(signature(FRONT, BACK), 0.7) is None
+    assert table.query(signature('Define osmosis', 'Water moving across a membrane'), 0.7)[0] == 1
+
+
+@pytest.fixture
+def index(app):
+    """The shared index, which the session hooks keep up to date"""
+    duplicate_index.clear()
+    yield duplicate_index
+    duplicate_index.clear()
+
+
+@pytest.fixture
+def user(index):
+    user = User(username='deduper', email='deduper@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_card(user, front, back):
+    card = Card(user_id=user.id, content_type='flashcard', front=front, back=back)
+    db.session.add(card)
+    db.session.commit()
+    return card
+
+
+def test_index_follows_committed_inserts_edits_and_deletes(user, index):
+    card = add_card(user, FRONT, BACK)
+    assert index.find(user.id, FRONT, BACK)['card_id'] == card.id
+
+    # Changes after the table is loaded reach it through the session hooks
+    other = add_card(user, 'Define osmosis', 'Water moving across a membrane')
+    assert index.find(user.id, 'define osmosis', 'water moving across a membrane')['card_id'] == other.id
+
+    card.front, card.back = 'Which treaty ended the Thirty Years War?', 'The Peace of Westphalia'
+    db.session.commit()
+    assert index.find(user.id, FRONT, BACK) is None
+
+    db.session.delete(other)
+    db.session.commit()
+    assert index.find(user.id, 'Define osmosis', 'Water moving across a membrane') is None
+
+
+def test_rolled_back_cards_are_not_indexed(user, index):
+    index.find(user.id, FRONT, BACK)  # Load the table
+    db.session.add(Card(user_id=user.id, content_type='flashcard', front=FRONT, back=BACK))
+    db.session.flush()
+    db.session.rollback()
+
+    assert index.find(user.id, FRONT, BACK) is None
+
+
+def test_cards_committed_while_the_table_loads_are_not_lost(user, index, monkeypatch):
+    load = index._load
+
+    def load_then_commit(user_id):
+        table = load(user_id)
+        # Committed after the query ran but before the table is registered
+        add_card(user, FRONT, BACK)
+        return table
+
+    monkeypatch.setattr(index, '_load', load_then_commit)
+    match = index.find(user.id, FRONT, BACK)
+
+    assert match is not None and match['similarity'] == 1.0
+    assert index._loading == {}
@@ -0,0 +1,125 @@
+"""
+Queued generation jobs and the uploads they own
+"""
+import io
+import os
+import threading
+import time
+import pytest
+from flask import jsonify, request
+from app import db
+from app.config import Config
+from app.models import Card, ContentGeneration, User
+from app.services import generation_jobs as generation_jobs_module
+from app.services.generation_cache import GenerationCache
+from app.services.generation_jobs import GenerationJobQueue
+from app.utils.pdf_text import PdfTextExtractor
+from app.utils.uploads import SpooledUpload, accepts_uploads
+
+FACTS = [
+    'Mitochondria produce most of the cell ATP',
+    'The Treaty of Westphalia ended the Thirty Years War',
+    'Osmosis moves water across a membrane',
+    'Light travels at about 300000 km per second',
+]
+
+
+def text_pdf(lines):
+    """A minimal PDF with one line of Helvetica text per page"""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for line in lines:
+        stream = b'BT /F1 12 Tf 72 720 Td (%s) Tj ET' % line.encode('ascii')
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> '
+            b'/Contents %d 0 R >>' % (len(objects))
+        )
+        kids.append(b'%d 0 R' % len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(kids), len(kids))
+
+    pdf, offsets = bytearray(b'%PDF-1.4\n'), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+class PdfGenerator:
+    """Turns each extracted PDF line into a card, once the test lets the job run"""
+
+    MODEL = 'test'
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+        self.release = threading.Event()
+
+    def is_available(self):
+        return True
+
+    def generate_mixed_content(self, source_material, subject, max_cards, focus_areas, images, pdf_content,
+                               page_range=None, on_item=None):
+        assert self.release.wait(10)
+        text = self.extractor.extract(pdf_content, page_range)
+        return [{'content_type': 'information', 'front': line} for line in text.splitlines() if line.strip()]
+
+    generate_flashcards = generate_information_pieces = generate_mixed_content
+
+
+@pytest.fixture
+def extractor():
+    # Every page goes to a worker process, which reopens the spooled file by path
+    extractor = PdfTextExtractor(workers=2, parallel_min_pages=2, cache_dir='')
+    yield extractor
+    extractor._reset_executor()
+
+
+@pytest.fixture
+def queue(app, extractor, monkeypatch):
+    monkeypatch.setattr(Config, 'UPLOAD_SPOOL_MEMORY_BYTES', 64)
+    monkeypatch.setattr(generation_jobs_module, 'generation_cache', GenerationCache(db_path=''))
+    queue = GenerationJobQueue(workers=1, generator=PdfGenerator(extractor))
+    yield queue
+    queue.generator.release.set()
+    if queue._executor is not None:
+        queue._executor.shutdown(wait=True)
+
+
+def test_a_queued_pdf_job_runs_after_its_request_has_closed(app, queue):
+    user = User(username='reader', email='reader@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+    spooled_paths = []
+
+    @accepts_uploads
+    def generate():
+        pdf = SpooledUpload.from_file_storage(request.files['pdf_file'])
+        spooled_paths.append(pdf.path)
+        result = queue.enqueue(user_id, '', 'mixed', max_cards=len(FACTS), pdf_content=pdf)
+        pdf.close()  # The request's own handle no longer owns the file
+        return jsonify(generation_id=result['generation'].id)
+
+    app.add_url_rule('/generate', 'generate', generate, methods=['POST'])
+    pdf = text_pdf(FACTS)
+    response = app.test_client().post('/generate', data={'pdf_file': (io.BytesIO(pdf), 'notes.pdf')})
+    generation_id = response.json['generation_id']
+
+    # The request is over and its uploads were cleaned up; the job still has the file
+    assert os.path.exists(spooled_paths[0])
+    queue.generator.release.set()
+
+    deadline = time.monotonic() + 30
+    while queue._pending and time.monotonic() < deadline:
+        time.sleep(0.05)
+    db.session.expire_all()
+    generation = db.session.get(ContentGeneration, generation_id)
+
+    assert generation.generation_status == 'completed', generation.error_message
+    assert sorted(card.front for card in Card.query.filter_by(generation_id=generation_id)) == sorted(FACTS)
+    # Deleted once the job finished
+    assert not os.path.exists(spooled_paths[0])
@@ -0,0 +1,32 @@
+"""
+Image preprocessing and duplicate removal
+"""
+import io
+from PIL import Image, ImageDraw
+from app.utils.image_prep import ImagePreprocessor
+
+
+def page(text, fmt='PNG'):
+    """A white page with a line of text, like a photo of a worksheet"""
+    image = Image.new('RGB', (400, 300), 'white')
+    ImageDraw.Draw(image).text((20, 20), text, fill='black')
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def test_pages_that_look_alike_are_all_kept():
+    preprocessor = ImagePreprocessor(workers=1)
+    pages = [page(f'Chapter 3, page {number}: the Krebs cycle') for number in range(3)]
+
+    assert len(preprocessor.encode_many(pages)) == 3
+
+
+def test_the_same_image_is_sent_once():
+    preprocessor = ImagePreprocessor(workers=2)
+    first = page('Chapter 3')
+    # Same pixels in a different container still normalize to the same JPEG
+    encoded = preprocessor.encode_many([first, first, page('Chapter 3', 'BMP'), page('Chapter 4')])
+
+    assert len(encoded) == 2
+    assert encoded[0] == preprocessor.encode(first)
@@ -0,0 +1,158 @@
+"""
+Outbox claiming, lease recovery and lease renewal
+"""
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import User, NotificationOutbox
+from app.services.apns import APNsResponse
+from app.services.outbox_worker import OutboxWorker
+
+
+class FakeDispatcher:
+    """Accepts every push, recording the tokens it was given; on_wave runs after each dispatch"""
+
+    def __init__(self, concurrency=100, on_wave=None):
+        self.concurrency = concurrency
+        self.on_wave = on_wave
+        self.sent = []
+
+    def dispatch_sync(self, jobs):
+        for job in jobs:
+            job.response = APNsResponse(200)
+            self.sent.append(job.device_token)
+        if self.on_wave is not None:
+            self.on_wave()
+        return [200] * len(jobs)
+
+    def dead_tokens(self, jobs):
+        return {}
+
+
+@pytest.fixture
+def users(app):
+    users = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x') for i in range(8)]
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+
+def enqueue(users, per_user=1):
+    rows = [
+        NotificationOutbox.row_for(user.id, 'alert', f'token-{user.id}-{n}', '{}', f'test:{user.id}:{n}')
+        for user in users for n in range(per_user)
+    ]
+    OutboxWorker.enqueue(rows)
+    db.session.commit()
+    return len(rows)
+
+
+def test_a_claimed_row_is_not_claimed_again(users):
+    total = enqueue(users)
+    first = OutboxWorker(worker_id='first', batch_size=5)
+    second = OutboxWorker(worker_id='second', batch_size=100)
+
+    claimed_first = {row.id for row in first.claim_batch()}
+    claimed_second = {row.id for row in second.claim_batch()}
+
+    assert len(claimed_first) == 5
+    assert claimed_first.isdisjoint(claimed_second)
+    assert len(claimed_first | claimed_second) == total
+    assert second.claim_batch() == []
+
+
+def test_shard_workers_split_the_rows(users):
+    total = enqueue(users, per_user=3)
+    workers = [OutboxWorker(shard_index=index, shard_count=2, worker_id=f'shard{index}') for index in range(2)]
+
+    claims = [workers[index].claim_batch() for index in range(2)]
+
+    assert sum(len(rows) for rows in claims) == total
+    for index, rows in enumerate(claims):
+        assert all(row.shard % 2 == index for row in rows)
+
+
+def test_rows_not_yet_available_are_left_pending(users):
+    enqueue(users[:1])
+    NotificationOutbox.query.update({'available_at': datetime.utcnow() + timedelta(minutes=5)})
+    db.session.commit()
+
+    assert OutboxWorker().claim_batch() == []
+
+
+def test_recover_stale_only_returns_expired_leases(users):
+    enqueue(users[:4])
+    now = datetime.utcnow()
+    stale = OutboxWorker(worker_id='crashed', batch_size=2).claim_batch(now=now)
+    fresh = OutboxWorker(worker_id='busy').claim_batch(now=now + timedelta(seconds=90))
+
+    assert OutboxWorker(lease_seconds=60).recover_stale(now=now + timedelta(seconds=120)) == 2
+
+    statuses = {row.id: (row.status, row.claimed_by) for row in NotificationOutbox.query.all()}
+    assert all(statuses[row.id] == ('pending', None) for row in stale)
+    assert all(statuses[row.id][0] == 'claimed' for row in fresh)
+    assert len(fresh) == 2
+
+
+def test_a_stale_worker_cannot_finish_a_reclaimed_row(users):
+    enqueue(users[:1])
+    slow = OutboxWorker(worker_id='slow', lease_seconds=60, dispatcher=FakeDispatcher())
+    now = datetime.utcnow() + timedelta(seconds=120)
+    rows = slow.claim_batch(now=now - timedelta(seconds=120))
+    slow.recover_stale(now=now)
+    reclaimed = OutboxWorker(worker_id='fast').claim_batch(now=now)
+    assert [row.id for row in reclaimed] == [row.id for row in rows]
+
+    # The slow worker's late result must not overwrite the new claim
+    jobs = [type('Job', (), {'outcome': APNsResponse.RETRY, 'response': None})()]
+    slow._finish(rows, jobs, now)
+
+    row = db.session.get(NotificationOutbox, rows[0].id)
+    db.session.refresh(row)
+    assert row.status == 'claimed'
+    assert row.claimed_by == reclaimed[0].claimed_by
+
+
+def test_extend_lease_keeps_rows_out_of_recovery(users):
+    enqueue(users[:3])
+    worker = OutboxWorker(worker_id='worker', lease_seconds=60)
+    now = datetime.utcnow()
+    rows = worker.claim_batch(now=now)
+
+    assert worker.extend_lease(rows, now=now + timedelta(seconds=50)) == rows
+    assert worker.recover_stale(now=now + timedelta(seconds=80)) == 0
+    assert worker.recover_stale(now=now + timedelta(seconds=120)) == 3
+
+
+def test_extend_lease_drops_rows_another_worker_reclaimed(users):
+    enqueue(users[:3])
+    worker = OutboxWorker(worker_id='worker', lease_seconds=60)
+    rows = worker.claim_batch()
+    NotificationOutbox.query.filter_by(id=rows[0].id).update({'claimed_by': 'someone-else'})
+    db.session.commit()
+
+    assert [row.id for row in worker.extend_lease(rows)] == [row.id for row in rows[1:]]
+
+
+def test_run_once_sends_in_waves_and_skips_rows_lost_mid_batch(users):
+    enqueue(users[:5])
+    lost = []
+
+    def reclaim_one():
+        # After the first wave another worker takes over one of the remaining rows
+        if not lost:
+            row = NotificationOutbox.query.filter(
+                NotificationOutbox.status == 'claimed',
+                NotificationOutbox.device_token.notin_(dispatcher.sent)
+            ).first()
+            lost.append(row.device_token)
+            row.claimed_by = 'someone-else'
+            db.session.commit()
+
+    dispatcher = FakeDispatcher(concurrency=2, on_wave=reclaim_one)
+    stats = OutboxWorker(worker_id='worker', dispatcher=dispatcher).run_once()
+
+    assert stats['claimed'] == 5
+    assert stats['sent'] == 4
+    assert lost[0] not in dispatcher.sent
+    assert len(dispatcher.sent) == len(set(dispatcher.sent)) == 4
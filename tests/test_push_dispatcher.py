@@ -0,0 +1,39 @@
+"""
+Push dispatcher retries
+"""
+from app.services.apns import APNsResponse
+from app.services.push_dispatcher import PushDispatcher, PushJob
+
+
+class ThrottledClient:
+    """Answers every push with 429 and counts the sends"""
+
+    def __init__(self):
+        self.sends = 0
+
+    async def check_health(self):
+        pass
+
+    async def send(self, device_token, payload, **kwargs):
+        self.sends += 1
+        return APNsResponse(429, reason='TooManyRequests')
+
+
+def dispatcher(client):
+    dispatcher = PushDispatcher(client=client, retry_attempts=2)
+    dispatcher.retry_base_seconds = 0
+    return dispatcher
+
+
+def test_throttled_pushes_are_retried_inline():
+    client = ThrottledClient()
+    assert dispatcher(client).dispatch_sync([PushJob('token', b'{}')]) == [429]
+    assert client.sends == 3
+
+
+def test_request_path_can_skip_the_retries():
+    client = ThrottledClient()
+    job = PushJob('token', b'{}')
+    assert dispatcher(client).dispatch_sync([job], retry_attempts=0) == [429]
+    assert client.sends == 1
+    assert job.outcome == APNsResponse.RETRY
@@ -0,0 +1,81 @@
+"""
+Push payload size limits
+"""
+import json
+from datetime import datetime, timedelta
+import pytest
+from app.models import Card
+from app.services.push_payloads import PushPayloadBuilder, truncate_utf8
+
+LONG_TEXTS = {
+    'ascii': 'What does the mitochondrial electron transport chain do? ' * 120,
+    'emoji': '🧬🔬⚗️ Which enzyme unwinds DNA? ' * 200,
+    'escapes': 'A "quoted" \\ back\\slash\n and tab\t ' * 300,
+    'cjk': '光合作用は植物が光エネルギーを化学エネルギーに変える過程です。' * 100,
+}
+
+
+def make_card(text, content_type='flashcard', card_id=1):
+    return Card(
+        id=card_id,
+        user_id=1,
+        content_type=content_type,
+        front=text,
+        back=text if content_type == 'flashcard' else None,
+        subject=text[:300],
+        next_review=datetime.utcnow() - timedelta(days=1)
+    )
+
+
+@pytest.mark.parametrize('kind', sorted(LONG_TEXTS))
+@pytest.mark.parametrize('content_type', ['flashcard', 'information'])
+def test_every_payload_fits_the_apns_limit(kind, content_type):
+    builder = PushPayloadBuilder()
+    card = make_card(LONG_TEXTS[kind], content_type)
+    payloads = {
+        'recall_alert': builder.recall_alert(card),
+        'recall_live_activity': builder.recall_live_activity(card),
+        'study_card_update': builder.study_card_activity(card, 'update'),
+        'study_card_start': builder.study_card_activity(card, 'start'),
+        'study_card_end': builder.study_card_activity(card, 'end'),
+        'live_activity': builder.live_activity('update', {'question': card.front, 'answer': card.front}),
+    }
+    for name, payload in payloads.items():
+        assert len(payload) <= PushPayloadBuilder.MAX_PAYLOAD_BYTES, name
+        json.loads(payload)  # Still valid JSON after truncation and splicing
+
+
+def test_start_alert_is_sized_with_the_state():
+    builder = PushPayloadBuilder()
+    card = make_card(LONG_TEXTS['emoji'])
+    payload = json.loads(builder.study_card_activity(card, 'start'))
+    alert = payload['aps']['alert']
+    assert alert['title'] == '🧠 Active Recall'
+    assert len(json.dumps(alert, ensure_ascii=False, separators=(',', ':')).encode('utf-8')) \
+        <= PushPayloadBuilder.ACTIVITY_ALERT_RESERVE_BYTES
+
+
+def test_update_and_end_events_leave_out_the_alert():
+    builder = PushPayloadBuilder()
+    card = make_card('What is ATP?')
+    for event in ('update', 'end'):
+        aps = json.loads(builder.study_card_activity(card, event))['aps']
+        assert 'alert' not in aps
+        assert aps['content-state']['question'] == 'What is ATP?'
+
+
+def test_short_cards_are_not_truncated():
+    builder = PushPayloadBuilder()
+    card = make_card('What is ATP?')
+    state = json.loads(builder.study_card_activity(card, 'start'))['aps']['content-state']
+    assert state['question'] == 'What is ATP?'
+    assert state['answer'] == 'What is ATP?'
+
+
+def test_truncate_utf8_never_splits_a_character():
+    text = '🧬' * 10  # 4 bytes each
+    assert truncate_utf8(text, 40) == text
+    for max_bytes in range(40):
+        shortened = truncate_utf8(text, max_bytes)
+        assert len(shortened.encode('utf-8')) <= max_bytes
+        assert shortened.rstrip('.') == '🧬' * len(shortened.rstrip('.'))
@@ -0,0 +1,134 @@
+"""
+Sliding-window rate limiting
+"""
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.utils.rate_limiter import (
+    LoginRateLimiter, MemoryRateLimitStore, SQLiteRateLimitStore, SlidingWindowRateLimiter
+)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryRateLimitStore()
+    return SQLiteRateLimitStore(str(tmp_path / 'rate_limit.db'))
+
+
+def test_allows_up_to_the_limit_then_reports_the_wait(store):
+    limiter = SlidingWindowRateLimiter(3, 60, store)
+    for offset in range(3):
+        assert limiter.is_allowed('key', now=1000 + offset)
+        limiter.hit('key', now=1000 + offset)
+
+    assert not limiter.is_allowed('key', now=1010)
+    # The oldest of the last `limit` hits leaves the window first
+    assert limiter.retry_after('key', now=1010) == pytest.approx(50)
+
+
+def test_window_slides_past_old_hits(store):
+    limiter = SlidingWindowRateLimiter(2, 60, store)
+    limiter.hit('key', now=1000)
+    limiter.hit('key', now=1030)
+
+    assert not limiter.is_allowed('key', now=1059.9)
+    # A hit exactly window_seconds old no longer counts
+    assert limiter.is_allowed('key', now=1060)
+    limiter.hit('key', now=1060)
+    assert limiter.retry_after('key', now=1060) == pytest.approx(30)
+
+
+def test_keys_are_limited_independently(store):
+    limiter = SlidingWindowRateLimiter(1, 60, store)
+    limiter.hit('first', now=1000)
+
+    assert not limiter.is_allowed('first', now=1001)
+    assert limiter.is_allowed('second', now=1001)
+
+
+def test_acquire_records_only_when_under_the_limit(store):
+    limiter = SlidingWindowRateLimiter(1, 60, store)
+
+    assert limiter.acquire('key', now=1000) == 0
+    assert limiter.acquire('key', now=1020) == pytest.approx(40)
+    # The rejected attempt was not recorded, so the wait still runs from the first hit
+    assert limiter.acquire('key', now=1060) == 0
+
+
+def test_reset_clears_the_history(store):
+    limiter = SlidingWindowRateLimiter(1, 60, store)
+    limiter.hit('key', now=1000)
+    limiter.reset('key')
+
+    assert limiter.is_allowed('key', now=1001)
+
+
+def test_memory_store_evicts_the_least_recently_used_key():
+    store = MemoryRateLimitStore(max_keys=2)
+    limiter = SlidingWindowRateLimiter(1, 60, store)
+    limiter.hit('a', now=1000)
+    limiter.hit('b', now=1001)
+    limiter.hit('a', now=1002)  # 'a' is now the most recently used
+    limiter.hit('c', now=1003)
+
+    assert len(store) == 2
+    assert limiter.is_allowed('b', now=1004)
+    assert not limiter.is_allowed('a', now=1004)
+
+
+def test_release_gives_one_hit_back(store):
+    limiter = SlidingWindowRateLimiter(2, 60, store)
+    limiter.hit('key', now=1000)
+    limiter.hit('key', now=1010)
+    limiter.release('key', 1010)
+
+    assert limiter.acquire('key', now=1020) == 0
+    assert limiter.retry_after('key', now=1020) == pytest.approx(40)
+
+
+def test_login_limiter_locks_the_account_and_success_unlocks_it():
+    limiter = LoginRateLimiter(ip_limit=10, account_limit=2, window_seconds=300)
+    for now in (1000, 1001):
+        assert limiter.acquire('203.0.113.5', 'Alice@Example.com', now) == 0
+
+    # Account keys ignore case and surrounding spaces
+    assert limiter.acquire('198.51.100.7', ' alice@example.com', 1002) == pytest.approx(298)
+    assert limiter.acquire('198.51.100.7', 'bob@example.com', 1003) == 0
+
+    limiter.record_success('198.51.100.7', 'bob@example.com', 1003)
+    limiter.record_success('203.0.113.5', 'alice@example.com', 1001)
+    assert limiter.check('198.51.100.7', 'alice@example.com') == 0
+
+
+def test_login_limiter_locks_an_ip_across_accounts():
+    limiter = LoginRateLimiter(ip_limit=3, account_limit=10, window_seconds=300)
+    for now, account in enumerate(('a', 'b', 'c'), start=1000):
+        assert limiter.acquire('203.0.113.5', account, now) == 0
+
+    assert limiter.acquire('203.0.113.5', 'd', 1010) > 0
+    assert limiter.acquire('198.51.100.7', 'd', 1010) == 0
+
+
+def test_a_locked_account_does_not_use_up_the_ip():
+    limiter = LoginRateLimiter(ip_limit=2, account_limit=1, window_seconds=300)
+    limiter.acquire('203.0.113.5', 'alice', 1000)
+    for now in range(1001, 1010):
+        assert limiter.acquire('203.0.113.5', 'alice', now) > 0
+
+    assert limiter.acquire('203.0.113.5', 'bob', 1010) == 0
+
+
+def test_successful_logins_do_not_count_against_the_ip():
+    limiter = LoginRateLimiter(ip_limit=2, account_limit=5, window_seconds=300)
+    for now in range(1000, 1005):
+        assert limiter.acquire('203.0.113.5', 'alice', now) == 0
+        limiter.record_success('203.0.113.5', 'alice', now)
+
+
+def test_concurrent_attempts_cannot_pass_the_limit_together(tmp_path):
+    limiter = LoginRateLimiter(ip_limit=100, account_limit=3, window_seconds=300,
+                               storage_path=str(tmp_path / 'rate_limit.db'))
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        results = list(pool.map(lambda n: limiter.acquire(f'198.51.100.{n}', 'alice', 1000 + n / 100), range(20)))
+
+    assert results.count(0) == 3
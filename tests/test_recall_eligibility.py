@@ -0,0 +1,54 @@
+"""
+Recall eligibility: the SQL predicate and the per-user Python check agree
+"""
+from datetime import datetime, time
+import pytest
+from app import db
+from app.models import User
+from app.services import notification_service as notification_module
+from app.services.notification_service import NotificationService
+
+# A Monday, so every default day mask allows it
+DAY = datetime(2026, 1, 5)
+
+SCHEDULES = {
+    'window': dict(recall_start_time=time(8, 0), recall_end_time=time(22, 0)),
+    'same_day_sleep': dict(sleep_start=time(13, 0), sleep_end=time(14, 0)),
+    'overnight_sleep': dict(sleep_start=time(23, 0), sleep_end=time(7, 0)),
+}
+
+# Half a second either side of each boundary
+MOMENTS = [
+    DAY.replace(hour=hour, minute=minute, second=second, microsecond=microsecond)
+    for hour, minute, second in [(8, 0, 0), (22, 0, 0), (7, 59, 59), (21, 59, 59),
+                                 (13, 0, 0), (14, 0, 0), (12, 59, 59), (13, 59, 59),
+                                 (23, 0, 0), (7, 0, 0), (22, 59, 59), (6, 59, 59)]
+    for microsecond in (0, 500000)
+]
+
+
+@pytest.fixture
+def users(app):
+    users = {
+        name: User(username=name, email=f'{name}@example.com', password_hash='x', device_token=f'token-{name}',
+                   **schedule)
+        for name, schedule in SCHEDULES.items()
+    }
+    db.session.add_all(users.values())
+    db.session.commit()
+    return users
+
+
+@pytest.mark.parametrize('now', MOMENTS, ids=lambda moment: moment.strftime('%H:%M:%S.%f'))
+def test_sql_and_python_agree_on_boundaries(users, now, monkeypatch):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+
+    monkeypatch.setattr(notification_module, 'datetime', FrozenDatetime)
+    service = NotificationService()
+
+    in_sql = {user.username for user in User.query.filter(service.recall_eligibility_filter(now))}
+    in_python = {name for name, user in users.items() if service._should_send_notification(user)}
+    assert in_sql == in_python
@@ -0,0 +1,41 @@
+"""
+Token counting and chunking of long sources
+"""
+import pytest
+from app.utils import text_chunker
+
+
+class OfflineTiktoken:
+    """Stands in for tiktoken on a machine that cannot download the BPE file"""
+
+    calls = 0
+
+    @classmethod
+    def get_encoding(cls, name):
+        cls.calls += 1
+        raise OSError('network unreachable')
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    OfflineTiktoken.calls = 0
+    monkeypatch.setattr(text_chunker, 'tiktoken', OfflineTiktoken)
+    text_chunker._encoding.cache_clear()
+    yield
+    text_chunker._encoding.cache_clear()
+
+
+def test_counts_fall_back_to_an_estimate_when_the_encoding_cannot_load(offline):
+    assert text_chunker.count_tokens('x' * 40) == 10
+    assert text_chunker.count_tokens('y' * 41) == 11
+    # The failed load is not retried on every call
+    assert OfflineTiktoken.calls == 1
+
+
+def test_chunks_stay_under_the_budget_and_overlap(offline):
+    paragraphs = [f'Paragraph {n}. ' + 'word ' * 30 for n in range(10)]
+    chunks = text_chunker.chunk_text('\n\n'.join(paragraphs), max_tokens=100, overlap_tokens=50)
+
+    assert len(chunks) > 1
+    assert all(text_chunker.count_tokens(chunk) <= 100 for chunk in chunks)
+    assert chunks[1].startswith(chunks[0].split('\n\n')[-1])
@@ -0,0 +1,91 @@
+"""
+Unlock debouncing and batched last_notification_time writes
+"""
+import time
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import User
+from app.services.unlock_debounce import UnlockDebouncer
+from app.utils.rate_limiter import LoginRateLimiter
+
+EARLIER = datetime(2026, 1, 1, 9, 0)
+LATER = EARLIER + timedelta(minutes=5)
+
+
+@pytest.fixture
+def debouncer():
+    # A long flush interval so only the test's explicit flush() writes
+    return UnlockDebouncer(interval_seconds=300, flush_seconds=3600, storage_path='')
+
+
+@pytest.fixture
+def user(app):
+    user = User(username='unlocker', email='unlocker@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def stored_time(user_id):
+    db.session.expire_all()
+    return db.session.get(User, user_id).last_notification_time
+
+
+def test_only_one_update_per_interval(debouncer):
+    assert debouncer.acquire(1) == 0
+    assert debouncer.acquire(1) > 0
+    assert debouncer.acquire(2) == 0
+
+
+def test_release_gives_the_slot_back(debouncer):
+    debouncer.acquire(1)
+    debouncer.release(1)
+
+    assert debouncer.retry_after(1) == 0
+
+
+def test_flush_writes_the_latest_buffered_time(debouncer, user):
+    debouncer.record_update(user.id, EARLIER)
+    debouncer.record_update(user.id, LATER)
+
+    assert debouncer.flush() == 1
+    assert stored_time(user.id) == LATER
+    assert debouncer.last_update(user.id) is None
+    assert debouncer.flush() == 0
+
+
+def test_flush_does_not_overwrite_a_newer_stored_time(debouncer, user):
+    debouncer.record_update(user.id, EARLIER)
+    # A scheduler push lands after the unlock was buffered
+    user.last_notification_time = LATER
+    db.session.commit()
+
+    debouncer.flush()
+    assert stored_time(user.id) == LATER
+
+
+def test_flush_moves_an_older_or_missing_time_forward(debouncer, user):
+    other = User(username='fresh', email='fresh@example.com', password_hash='x')
+    db.session.add(other)
+    user.last_notification_time = EARLIER
+    db.session.commit()
+
+    debouncer.record_update(user.id, LATER)
+    debouncer.record_update(other.id, LATER)
+    assert debouncer.flush() == 2
+
+    assert stored_time(user.id) == LATER
+    assert stored_time(other.id) == LATER
+
+
+def test_shared_store_leaves_login_limiter_hits_alone(tmp_path):
+    path = str(tmp_path / 'rate_limit.db')
+    login = LoginRateLimiter(ip_limit=1, account_limit=1, window_seconds=900, storage_path=path)
+    # A failure inside the login window but far older than the debounce interval
+    login.by_account.hit(login._account_key('alice'), now=time.time() - 100)
+    debouncer = UnlockDebouncer(interval_seconds=1, flush_seconds=3600, storage_path=path)
+
+    # Recording a debounce hit purges its own expired rows, never the login limiter's
+    debouncer.acquire(1)
+    assert login.check('203.0.113.5', 'alice') > 0
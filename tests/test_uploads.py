@@ -0,0 +1,53 @@
+"""
+Upload spooling and per-endpoint body limits
+"""
+import io
+import pytest
+from flask import jsonify, request
+from app.config import Config
+from app.utils.uploads import SpooledUpload, UploadSpool, accepts_uploads
+
+KB = 1024
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    app.config['MAX_CONTENT_LENGTH'] = 64 * KB
+    monkeypatch.setattr(Config, 'UPLOAD_MAX_BODY_BYTES', 512 * KB)
+    monkeypatch.setattr(Config, 'UPLOAD_MAX_REQUEST_BYTES', 256 * KB)
+    monkeypatch.setattr(Config, 'UPLOAD_MAX_IMAGE_BYTES', 192 * KB)
+    monkeypatch.setattr(Config, 'UPLOAD_SPOOL_MEMORY_BYTES', 16 * KB)
+
+    def describe():
+        stream = request.files['file'].stream
+        upload = SpooledUpload.from_file_storage(request.files['file'])
+        try:
+            return jsonify(spooled=isinstance(stream, UploadSpool), size=len(upload), on_disk=upload.path is not None)
+        finally:
+            upload.close()
+
+    app.add_url_rule('/plain', 'plain', describe, methods=['POST'])
+    app.add_url_rule('/upload', 'upload', accepts_uploads(describe), methods=['POST'])
+    return app.test_client()
+
+
+def post(client, url, size, filename='photo.png'):
+    return client.post(url, data={'file': (io.BytesIO(b'x' * size), filename)})
+
+
+def test_other_endpoints_keep_the_global_limit(client):
+    assert post(client, '/plain', 128 * KB).status_code == 413
+
+    response = post(client, '/plain', 32 * KB)
+    assert response.status_code == 200
+    assert response.json['spooled'] is False
+
+
+def test_upload_views_spool_files_under_the_larger_limit(client):
+    response = post(client, '/upload', 128 * KB)
+    assert response.status_code == 200
+    assert response.json == {'spooled': True, 'size': 128 * KB, 'on_disk': True}
+
+
+def test_upload_views_enforce_the_per_file_cap(client):
+    assert post(client, '/upload', 224 * KB).status_code == 413